@@ -1,13 +1,36 @@
+import logging
 import os
 import time
+from collections import namedtuple
 from flask import Flask, render_template, request, jsonify
-import sqlite3
-import re
-from config import DB_PATH
+from config import DB_PATH, TRACING_ENABLED
 from flask_cors import CORS
 import math
 import search_functions as search_functions
 from evaluation import tfidf, bm25
+from segment_index import segment_index
+from facet_index import facet_index
+from suggestion_index import suggestion_index
+from near_duplicates import cluster_map
+from snippets import make_snippet, query_terms
+from ranked_cache import ranked_cache, query_key, encode_cursor, decode_cursor, resume_offset, InvalidCursorError
+from redis_index_manager import index_manager
+from response_encoding import DEFAULT_FIELDS, MSGPACK_MIMETYPE, SUPPORTED_ENCODINGS, encode_payload, parse_fields
+from async_search import run_search, run_in_search_pool, count_news, fetch_news, SearchBusyError
+from search_backends import get_backend, classify_query_type, classify_search_query, ranks_natively
+from tracing import Trace, span, start_trace
+from metrics import search_metrics
+from slow_query_log import slow_query_log
+
+logger = logging.getLogger(__name__)
+
+# 支持的打分方法；method 也是指标的标签，只接受这几个取值，避免标签基数无界增长
+SEARCH_METHODS = ("tfidf", "bm25")
+
+# 检索线程返回的一页结果：rows 中尚未回表的结果只有 id，由请求处理协程异步回表后再生成摘要
+# total_relation 为 eq 表示总结果数是精确值，gte 表示提前结束的检索只统计了部分匹配文档，总结果数是下限
+SearchPage = namedtuple("SearchPage", ["rows", "total_results", "total_pages", "facets", "total_relation",
+                                       "key", "generation", "start", "has_more"])
 
 
 def create_app():
@@ -43,136 +66,333 @@ def create_app():
             return False
         return True
 
-    def classify_search_query(query):
-        """根据查询类型调用不同的搜索函数"""
-        query = query.strip().lower()  # 统一转换为小写
-
-        # 近邻搜索匹配：#数字 + 词1 + 词2
-        proximity_pattern = r"^#\d+\s+\w+\s+\w+$"
-
-        # 短语搜索匹配："xxx xxx"
-        phrase_pattern = r'^".+"$'
-
-        # 布尔搜索匹配
-        and_not_pattern = r"\b\w+\s+and\s+not\s+\w+\b"
-        and_pattern = r"\b\w+\s+and\s+\w+\b"
-        or_pattern = r"\b\w+\s+or\s+\w+\b"
-        not_pattern = r"\bnot\s+\w+\b"
-
-        # 根据匹配模式选择搜索函数
-        if re.match(proximity_pattern, query):
-            return search_functions.proximity_search(query)
-        elif re.match(phrase_pattern, query):
-            return search_functions.phrase_search(query)
-        elif re.match(and_not_pattern, query):
-            return search_functions.boolean_search_and_not(query)
-        elif re.match(and_pattern, query):
-            return search_functions.boolean_search_and(query)
-        elif re.match(or_pattern, query):
-            return search_functions.boolean_search_or(query)
-        else:
-            return search_functions.keyword_search(query)
+    def ensure_index_loaded():
+        """首次请求时加载索引；并发的首批请求由 index_manager 保证只加载一次"""
+        if not index_manager.ready:
+            search_functions.initialize_index()
 
-    def query_news(query, method="tfidf", page=1, limit=10):
+    def format_result(row, terms, fields=DEFAULT_FIELDS):
+        """将数据库行转换为API返回的结果字典，只包含 fields 中的字段；正文默认只返回高亮了查询词的摘要"""
+        result = {
+            "id": row['id'],
+            "title": row['title'],
+            "url": row['url'],
+            "publishedDate": row['published_at'],
+            "source": row['source_name'],
+            "sourceUrl": row['source_url']
+        }
+        if "snippet" in fields:
+            result["snippet"] = make_snippet(row, terms)
+        if "content" in fields:
+            result["content"] = row['content']
+        return {name: result[name] for name in fields}
+
+    def format_page(rows, query, fields, key, generation, start, limit, has_more):
+        """为当前页生成摘要并格式化结果，有更多结果时生成下一页的游标"""
+        with span("snippet"):
+            terms = query_terms(query)
+            formatted_results = [format_result(row, terms, fields) for row in rows]
+        next_cursor = encode_cursor(key, generation, start + limit, rows[-1]['id']) if has_more and rows else None
+        return formatted_results, next_cursor
+
+    def query_news(query, method="tfidf", page=1, limit=10, date_from=None, date_to=None, sort="relevance",
+                   sources=None, backend_name=None, collapse=False, cursor=None):
         """
-        搜索数据库中的新闻
+        搜索数据库中的新闻，在检索线程中执行；当前页的回表和摘要由 search_news 在之后完成
 
         参数:
         - query: 搜索关键词
         - method: 搜索方法 (tfidf或bm25)
         - page: 页码
         - limit: 每页结果数
+        - date_from / date_to: 发布时间范围 (ISO日期前缀，如 2020 或 2020-05-01)
+        - sort: relevance 按相关度排序，recent 按发布时间降序
+        - sources: 来源名称列表，只返回这些来源的新闻
+        - backend_name: 检索后端 (index或fts5)，默认使用配置中的 SEARCH_BACKEND
+        - collapse: 是否折叠近重复新闻，每个簇只保留排名最高的一篇
+        - cursor: 上一页响应中的 nextCursor，给出时忽略 page
 
         返回:
-        - 搜索结果列表
-        - 总结果数
+        - SearchPage，其中 rows 是当前页的结果，尚未回表的只有 id
         """
         # 确保索引已加载
-        if app.config.get('FIRST_REQUEST', True):
-            search_functions.initialize_index()
-            app.config['FIRST_REQUEST'] = False
-
-        start_time = time.time()
-
-        # 执行搜索
-        all_results = classify_search_query(query)
-        print(f"查询分类完成，耗时: {time.time() - start_time:.4f} 秒")
+        ensure_index_loaded()
+
+        # 同一查询的各页共用一个查询摘要，排序结果缓存和游标都以它和索引版本为键
+        backend = get_backend(backend_name)
+        generation = index_manager.generation
+        key = query_key(query, method, date_from, date_to, sort, sorted(sources) if sources else None,
+                        backend.name, collapse, generation)
+        start = (page - 1) * limit
+        last_id = None
+        if cursor:
+            start, last_id = decode_cursor(cursor, key, generation)
+            page = start // limit + 1
+
+        # 来源过滤：使用索引构建时生成的来源位图，在打分之前与倒排结果求交
+        source_filter = facet_index.doc_filter(sources=sources) if sources else None
+
+        # "最新优先"的关键词查询：从最新的时间段开始按发布时间排序，凑满当前页后不再读取更早的时间段
+        query_type = classify_query_type(query)
+        if sort == "recent" and query_type == "keyword":
+            # 与相关度排序相同，拼写扩展和通配符扩展后再按时间段检索
+            keywords = list(search_functions.weighted_query_terms(*search_functions.parse_keyword_query(query)))
+            # 折叠近重复新闻时需要全部命中文档的时间顺序，才能确定每个簇保留哪一篇
+            doc_ids, matched_ids, truncated = segment_index.search_recent(
+                keywords, None if collapse else start + limit, date_from, date_to, source_filter)
+            if collapse:
+                doc_ids = matched_ids = cluster_map.collapse(doc_ids, key=lambda doc_id: doc_id)
+            total_results = len(matched_ids)
+            # 分面计数基于已读取的段中的全部命中文档；提前结束时与总结果数一样只是下限
+            return SearchPage([{"id": doc_id} for doc_id in doc_ids[start:start + limit]], total_results,
+                              math.ceil(total_results / limit), facet_index.facet_counts(matched_ids),
+                              "gte" if truncated else "eq", key, generation, start,
+                              truncated or start + limit < total_results)
+
+        # 翻页时优先使用缓存的排序结果，只对当前页回表
+        cached = ranked_cache.get(key)
+        if cached is not None:
+            ranked_ids, total_results, facets, total_relation = cached
+            start = resume_offset(ranked_ids, start, last_id)
+            if start + limit <= len(ranked_ids) or len(ranked_ids) == total_results:
+                return SearchPage([{"id": doc_id} for doc_id in ranked_ids[start:start + limit]], total_results,
+                                  math.ceil(total_results / limit), facets, total_relation, key, generation, start,
+                                  start + limit < total_results)
+
+        # 日期范围过滤：整段跳过不相交的时间段，在查询数据库之前裁剪候选文档
+        doc_filter = source_filter
+        if date_from or date_to:
+            date_filter = segment_index.doc_ids_in_range(date_from, date_to)
+            doc_filter = date_filter if doc_filter is None else doc_filter & date_filter
+
+        # 执行搜索；后端原生排序的结果不再重新排序，只需为前几页回表
+        hydrate_limit = None
+        if ranks_natively(backend, method) and sort == "relevance" and not collapse:
+            hydrate_limit = start + limit
+        all_results = classify_search_query(query, doc_filter, backend, hydrate_limit, method)
+        # 提前结束的关键词检索只返回部分匹配文档，总结果数只是下限
+        total_relation = "gte" if isinstance(all_results, search_functions.TruncatedResults) else "eq"
 
         # 根据method对结果进行排序
-        rank_start = time.time()
-        if method == "tfidf":
-            all_results = tfidf(all_results, query)
-        elif method == "bm25":
-            all_results = bm25(all_results, query)
-        print(f"排序完成，方法: {method}，耗时: {time.time() - rank_start:.4f} 秒")
-
-        # 计算总结果数和总页数
+        with span("score"):
+            if sort == "recent":
+                all_results = sorted(all_results, key=lambda row: row['published_at'] or "", reverse=True)
+            elif ranks_natively(backend, method):
+                pass  # 后端已经按 method 原生排好序
+            else:
+                # 关键词查询经过拼写或通配符扩展时，按扩展出的词条加权打分，而不是按原始查询词
+                weighted_terms = search_functions.scoring_terms(query) if query_type == "keyword" else None
+                if method == "tfidf":
+                    all_results = tfidf(all_results, query, weighted_terms)
+                elif method == "bm25":
+                    all_results = bm25(all_results, query, weighted_terms=weighted_terms)
+
+        # 折叠近重复新闻：同一簇只保留排名最高的一篇
+        if collapse:
+            all_results = cluster_map.collapse(all_results)
+
+        # 基于位图计算分面计数，无需额外查询数据库
+        ranked_ids = [row['id'] for row in all_results]
+        facets = facet_index.facet_counts(ranked_ids)
+
+        # 计算总结果数和总页数，并缓存排序结果供后续翻页使用
         total_results = len(all_results)
         total_pages = math.ceil(total_results / limit)
+        ranked_cache.put(key, ranked_ids, total_results, facets, total_relation)
 
-        # 分页
-        start_idx = (page - 1) * limit
-        end_idx = start_idx + limit
-        paged_results = all_results[start_idx:end_idx]
-
-        # 将结果转换为字典列表
-        formatted_results = []
-        for row in paged_results:
-            result = {
-                "id": row['id'],
-                "title": row['title'],
-                "snippet": row['snippet'][:300] + "..." if row['snippet'] and len(row['snippet']) > 300 else row[
-                    'snippet'],
-                "content": row['content'],
-                "url": row['url'],
-                "publishedDate": row['published_at'],
-                "source": row['source_name'],
-                "sourceUrl": row['source_url']
-            }
-            formatted_results.append(result)
+        # 分页；游标续页可能越过已回表的部分，这些结果由请求处理协程异步回表
+        start = resume_offset(ranked_ids, start, last_id)
+        return SearchPage(all_results[start:start + limit], total_results, total_pages, facets, total_relation,
+                          key, generation, start, start + limit < total_results)
+
+    def traced_query_news(trace, query, method="tfidf", page=1, limit=10, date_from=None, date_to=None,
+                          sort="relevance", sources=None, backend_name=None, collapse=False, cursor=None):
+        """
+        在检索线程中执行 query_news，本线程的分阶段耗时记录到 trace 中
+
+        慢查询日志按抽样比例对本次检索做 profile；profiler 只对启动它的线程生效，因此在检索线程中启停。
+        返回 (SearchPage, profiler)
+        """
+        profiler = slow_query_log.start_profile()
+        try:
+            with start_trace(trace):
+                return query_news(query, method, page, limit, date_from, date_to, sort, sources, backend_name,
+                                  collapse, cursor), profiler
+        finally:
+            slow_query_log.stop_profile(profiler)
+
+    def traced_format_page(trace, *args):
+        """在检索线程中生成摘要，耗时记录到同一个 trace 中"""
+        with start_trace(trace):
+            return format_page(*args)
+
+    async def hydrate_page(rows, trace=None):
+        """
+        为当前页中只有 id 的结果回表，保持原有顺序
 
-        # 计算总耗时
-        total_time = time.time() - start_time
-        print(f"搜索完成，总耗时: {total_time:.4f} 秒，结果数: {total_results}")
+        使用 aiosqlite 在事件循环中等待数据库，不占用检索线程；已被删除的文档直接跳过
+        """
+        missing = [row['id'] for row in rows if 'title' not in row]
+        if not missing:
+            return rows
+
+        hydrate_start = time.perf_counter()
+        news_by_id = {row['id']: row for row in await fetch_news(missing, search_functions.db_file)}
+        if trace is not None:
+            trace.add("hydrate", time.perf_counter() - hydrate_start)
+            trace.counters["rows_hydrated"] += len(missing)
+        return [row if 'title' in row else news_by_id[row['id']] for row in rows
+                if 'title' in row or row['id'] in news_by_id]
+
+    async def search_news(query, method="tfidf", page=1, limit=10, date_from=None, date_to=None, sort="relevance",
+                          sources=None, backend_name=None, collapse=False, fields=DEFAULT_FIELDS, cursor=None):
+        """
+        执行一次搜索：检索和打分在有界线程池中执行，当前页异步回表，再回到检索线程生成摘要
 
-        return formatted_results, total_results, total_pages
+        开启追踪时，查询结束后把总耗时、各阶段耗时和结果数按查询类型和排序方法记录到 search_metrics 中；
+        超过阈值的查询写入慢查询日志。
+
+        返回:
+        - 格式化后的当前页结果
+        - 总结果数
+        - 总页数
+        - 分面计数 (来源、年份)
+        - 下一页的游标，没有更多结果时为 None
+        - 总结果数的含义 (eq 或 gte)
+        """
+        args = (query, method, page, limit, date_from, date_to, sort, sources, backend_name, collapse, cursor)
+        if not TRACING_ENABLED and not slow_query_log.enabled:
+            search_page = await run_search(query_news, *args)
+            rows = await hydrate_page(search_page.rows)
+            results, next_cursor = await run_in_search_pool(
+                format_page, rows, query, fields, search_page.key, search_page.generation, search_page.start,
+                limit, search_page.has_more)
+            return (results, search_page.total_results, search_page.total_pages, search_page.facets, next_cursor,
+                    search_page.total_relation)
+
+        query_type = classify_query_type(query)
+        trace = Trace()
+        start = time.perf_counter()
+        try:
+            search_page, profiler = await run_search(traced_query_news, trace, *args)
+            rows = await hydrate_page(search_page.rows, trace)
+            results, next_cursor = await run_in_search_pool(
+                traced_format_page, trace, rows, query, fields, search_page.key, search_page.generation,
+                search_page.start, limit, search_page.has_more)
+        except SearchBusyError:
+            raise
+        except Exception:
+            search_metrics.observe_error(query_type, method)
+            raise
+        elapsed = time.perf_counter() - start
+        total_results = search_page.total_results
+
+        if TRACING_ENABLED:
+            search_metrics.observe_query(query_type, method, elapsed, trace.stages, total_results)
+        if logger.isEnabledFor(logging.DEBUG):
+            stages = ", ".join(f"{name}={stage_elapsed * 1000:.2f}ms" for name, stage_elapsed in trace.stages.items())
+            logger.debug("搜索完成: '%s' (%s, %s)，耗时: %.4f 秒，结果数: %s，分阶段: %s",
+                         query, query_type, method, elapsed, total_results, stages)
+
+        if slow_query_log.enabled:
+            plan = {
+                "type": query_type,
+                "backend": get_backend(backend_name).name,
+                "method": method,
+                "sort": sort,
+                "page": page,
+                "limit": limit,
+                "date_from": date_from,
+                "date_to": date_to,
+                "sources": sources,
+                "collapse": collapse,
+                "cursor": bool(cursor),
+                "total_results": total_results,
+            }
+            slow_query_log.record(query, plan, elapsed, trace, profiler)
+        return results, total_results, search_page.total_pages, search_page.facets, next_cursor, \
+            search_page.total_relation
 
     @app.route("/")
     def home():
         """首页路由"""
         # 确保索引已加载
-        if app.config.get('FIRST_REQUEST', True):
-            search_functions.initialize_index()
-            app.config['FIRST_REQUEST'] = False
+        ensure_index_loaded()
 
         return render_template("index.html")
 
+    def search_response(payload):
+        """按请求的格式 (JSON 或 msgpack) 和 Accept-Encoding 流式编码检索响应"""
+        if request.args.get("format") == "msgpack" or request.accept_mimetypes.best == MSGPACK_MIMETYPE:
+            response_format = "msgpack"
+        else:
+            response_format = "json"
+        encoding = request.accept_encodings.best_match(SUPPORTED_ENCODINGS)
+
+        chunks, mimetype = encode_payload(payload, response_format, encoding)
+        response = app.response_class(chunks, mimetype=mimetype)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        response.vary.update(("Accept", "Accept-Encoding"))
+        return response
+
     @app.route("/api/search", methods=["GET"])
-    def search():
+    async def search():
         """API端点，用于处理搜索请求"""
         try:
             query = request.args.get("query", "").strip()
             method = request.args.get("method", "tfidf")
             page = int(request.args.get("page", 1))
             limit = int(request.args.get("limit", 10))
+            date_from = request.args.get("from") or None
+            date_to = request.args.get("to") or None
+            sort = request.args.get("sort", "relevance")
+            backend_name = request.args.get("backend") or None
+            sources = [name.strip() for name in request.args.get("source", "").split(",") if name.strip()] or None
+            collapse = request.args.get("collapse", "").lower() in ("1", "true", "yes")
+            cursor = request.args.get("cursor") or None
+            if method not in SEARCH_METHODS:
+                return jsonify({"error": f"未知的打分方法: {method}，可选: {', '.join(SEARCH_METHODS)}",
+                                "results": [], "totalResults": 0, "totalPages": 0}), 400
+            try:
+                fields = parse_fields(request.args.get("fields"))
+            except ValueError as e:
+                return jsonify({"error": str(e), "results": [], "totalResults": 0, "totalPages": 0}), 400
 
             if not query:
                 return jsonify({
                     "results": [],
                     "totalResults": 0,
-                    "totalPages": 0
+                    "totalPages": 0,
+                    "facets": {"source": {}, "year": {}}
                 })
 
-            # 打印调试信息
-            print(f"Processing search query: '{query}', method: {method}, page: {page}, limit: {limit}")
+            # 检索和打分在有界线程池中执行，不阻塞处理其他请求的线程；当前页在事件循环中异步回表
+            results, total_results, total_pages, facets, next_cursor, total_relation = await search_news(
+                query, method, page, limit, date_from, date_to, sort, sources, backend_name, collapse, fields, cursor)
 
-            results, total_results, total_pages = query_news(query, method, page, limit)
-
-            return jsonify({
+            return search_response({
                 "results": results,
                 "totalResults": total_results,
-                "totalPages": total_pages
+                "totalResultsRelation": total_relation,
+                "totalPages": total_pages,
+                "facets": facets,
+                "nextCursor": next_cursor
             })
+        except InvalidCursorError as e:
+            return jsonify({
+                "error": str(e),
+                "results": [],
+                "totalResults": 0,
+                "totalPages": 0
+            }), 400
+        except SearchBusyError as e:
+            return jsonify({
+                "error": str(e),
+                "results": [],
+                "totalResults": 0,
+                "totalPages": 0
+            }), 503
         except Exception as e:
             # 打印详细错误信息到后端控制台
             import traceback
@@ -191,47 +411,48 @@ def create_app():
     def get_suggestions():
         """API端点，提供搜索建议"""
         # 确保索引已加载
-        if app.config.get('FIRST_REQUEST', True):
-            search_functions.initialize_index()
-            app.config['FIRST_REQUEST'] = False
+        ensure_index_loaded()
 
         query = request.args.get("query", "").strip()
 
         if not query or len(query) < 2:
             return jsonify({"suggestions": []})
 
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        # 基于部分匹配获取标题建议
-        cursor.execute(
-            "SELECT DISTINCT title FROM news WHERE title LIKE ? LIMIT 10",
-            ('%' + query + '%',)
-        )
-
-        suggestions = [row[0] for row in cursor.fetchall()]
-        conn.close()
+        # 基于内存中的前缀索引获取加权补全，不再扫描数据库
+        suggestions = [text for text, _ in suggestion_index.suggest(query, 10)]
 
         return jsonify({"suggestions": suggestions})
 
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        """以 Prometheus 文本格式导出检索指标"""
+        search_metrics.observe_index_status(index_manager.status())
+        return app.response_class(search_metrics.render(), mimetype="text/plain; version=0.0.4")
+
     @app.route("/api/stats", methods=["GET"])
     def get_stats():
         """API端点，提供索引和搜索统计信息"""
         # 确保索引已加载
-        if app.config.get('FIRST_REQUEST', True):
-            search_functions.initialize_index()
-            app.config['FIRST_REQUEST'] = False
+        ensure_index_loaded()
 
         try:
-            # 获取索引信息
-            from redis_index_manager import index_manager
-            index, doc_id_map = index_manager.get_index()
+            # 获取索引信息和加载状态
+            index_status = index_manager.status()
 
             return jsonify({
                 "index_stats": {
-                    "terms_count": len(index),
-                    "documents_count": len(doc_id_map),
-                    "status": "loaded"
+                    "terms_count": index_status.get("terms_count", 0),
+                    "documents_count": index_status.get("documents_count", 0),
+                    "status": "loaded" if index_manager.ready else index_status["state"],
+                    "state": index_status["state"],
+                    "source": index_status["source"],
+                    "generation": index_status["generation"],
+                    "loaded_at": index_status["loaded_at"],
+                    "load_seconds": index_status["load_seconds"],
+                    "error": index_status["error"],
+                    "degraded": index_status["degraded"],
+                    "degraded_reason": index_status["degraded_reason"],
+                    "redis": index_status["redis"]
                 }
             })
         except Exception as e:
@@ -242,8 +463,29 @@ def create_app():
                 }
             }), 500
 
-    # 设置一个初始标记来跟踪是否是第一次请求
-    app.config['FIRST_REQUEST'] = True
+    @app.route("/api/health", methods=["GET"])
+    async def health():
+        """健康检查：索引已加载且数据库可访问时返回 200，否则返回 503；不会触发索引加载"""
+        index_status = index_manager.status()
+        try:
+            news_count = await count_news()
+            database = "ok"
+        except Exception as e:
+            news_count = None
+            database = f"error: {e}"
+
+        healthy = index_manager.ready and database == "ok"
+        if not healthy:
+            status = "unavailable"
+        else:
+            # 降级模式下仍能提供检索，返回 200，但在状态中标出
+            status = "degraded" if index_status["degraded"] else "ok"
+        return jsonify({
+            "status": status,
+            "index": index_status,
+            "database": database,
+            "news_count": news_count
+        }), 200 if healthy else 503
 
     # 检查所需的文件
     if check_required_files():
@@ -0,0 +1,35 @@
+"""
+ASGI 入口
+
+使用说明:
+    uvicorn asgi:asgi_app --port 5001 --workers 1
+    或 python main.py run --asgi
+
+Flask 路由保持不变，asgiref 默认把所有 WSGI 调用串行地放在同一个线程里执行，
+这里让每个请求进入独立的 ThreadSensitiveContext（asgiref 为每个上下文分配单独的线程），
+同时最多处理 ASGI_REQUEST_THREADS 个请求，使慢查询不会阻塞同一进程中的建议和统计请求。
+"""
+import asyncio
+
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app
+from config import ASGI_REQUEST_THREADS
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """把 Flask 应用包装为可并发处理请求的 ASGI 应用"""
+
+    def __init__(self, wsgi_application, max_concurrency=ASGI_REQUEST_THREADS):
+        super().__init__(wsgi_application)
+        # 同时运行的请求（线程）数上限，检索任务在其中再交给有界的检索线程池
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    async def __call__(self, scope, receive, send):
+        async with self._slots:
+            async with ThreadSensitiveContext():
+                await super().__call__(scope, receive, send)
+
+
+asgi_app = PooledWsgiToAsgi(app)
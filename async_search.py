@@ -0,0 +1,59 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import aiosqlite
+
+from config import DB_PATH, SEARCH_WORKERS, SEARCH_QUEUE_LIMIT
+from fetch_news_db import news_query, news_row
+
+
+class SearchBusyError(Exception):
+    """排队中的检索任务已达上限"""
+
+
+# 检索和打分使用的有界线程池，避免慢查询占满处理请求的线程
+SEARCH_EXECUTOR = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="search")
+_search_slots = threading.BoundedSemaphore(SEARCH_QUEUE_LIMIT)
+
+
+async def run_search(func, *args, **kwargs):
+    """
+    将CPU密集的检索/打分任务放到有界线程池中执行，不阻塞事件循环
+
+    同时在池中运行和排队的任务数超过 SEARCH_QUEUE_LIMIT 时直接抛出 SearchBusyError，
+    而不是无限堆积请求
+    """
+    if not _search_slots.acquire(blocking=False):
+        raise SearchBusyError(f"检索任务过多 (上限 {SEARCH_QUEUE_LIMIT})，请稍后重试")
+
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(SEARCH_EXECUTOR, functools.partial(func, *args, **kwargs))
+    finally:
+        _search_slots.release()
+
+
+async def run_in_search_pool(func, *args, **kwargs):
+    """在检索线程池中执行已获准检索的请求的后续步骤（例如生成摘要），不再占用排队名额"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(SEARCH_EXECUTOR, functools.partial(func, *args, **kwargs))
+
+
+async def count_news(db_path=DB_PATH):
+    """异步统计数据库中的新闻总数"""
+    async with aiosqlite.connect(db_path) as conn:
+        async with conn.execute("SELECT COUNT(*) FROM news") as cursor:
+            row = await cursor.fetchone()
+    return row[0] if row else 0
+
+
+async def fetch_news(doc_ids, db_path=DB_PATH):
+    """异步读取新闻完整数据（格式与 fetch_news_db.fetch_news_from_db 相同），回表时不占用检索线程"""
+    if not doc_ids:
+        return []
+    async with aiosqlite.connect(db_path) as conn:
+        async with conn.execute(news_query(len(doc_ids)), list(doc_ids)) as cursor:
+            rows = await cursor.fetchall()
+    return [news_row(row) for row in rows]
@@ -0,0 +1,275 @@
+"""
+检索延迟基准测试
+
+使用说明:
+    - python main.py bench --synthetic                 在合成语料上运行（无需下载数据）
+    - python main.py bench --log queries.jsonl -c 8    回放查询日志，8 路并发
+
+查询日志为 JSONL，每行一个查询，例如:
+    {"query": "apple and google", "method": "bm25"}
+"""
+import contextlib
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from nltk.corpus import stopwords
+from nltk.stem import PorterStemmer
+
+import search_functions
+from database import create_table
+from evaluation import tfidf, bm25
+from index_optimizer import IndexOptimizer
+from packed_index import build_packed_index
+from redis_index_manager import index_manager
+from search_backends import BACKENDS, get_backend, classify_query_type, classify_search_query, ranks_natively
+from tracing import span, start_trace
+
+STAGES = ["parse", "lexicon", "decode", "intersect", "fts", "verify", "hydrate", "score", "snippet"]
+
+
+def synthetic_vocabulary(size, rng):
+    """生成合成词表：由辅音+元音音节拼成，且经过词干提取后保持不变的非停用词"""
+    stemmer = PorterStemmer()
+    stop_words = set(stopwords.words("english"))
+    syllables = [c + v for c in "bdgklmnprstvz" for v in "aiou"]
+
+    vocabulary = set()
+    while len(vocabulary) < size:
+        word = "".join(rng.choice(syllables) for _ in range(rng.randint(2, 4)))
+        if word not in stop_words and stemmer.stem(word) == word:
+            vocabulary.add(word)
+    return sorted(vocabulary)
+
+
+def generate_corpus(output_dir="bench_corpus", num_docs=5000, vocab_size=2000, doc_length=200,
+                    num_queries=500, seed=42):
+    """
+    生成合成语料、对应的索引文件和查询日志，使基准测试不依赖 Google Drive 上的数据
+
+    参数:
+    - output_dir: 输出目录
+    - num_docs: 文档数
+    - vocab_size: 词表大小，词频服从 Zipf 分布
+    - doc_length: 每篇正文的词数
+    - num_queries: 查询日志中的查询数
+
+    返回:
+    - 包含各文件路径的字典
+    """
+    print(f"🧪 开始生成合成语料: {num_docs} 篇文档，词表 {vocab_size} 个词")
+    start_time = time.time()
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+
+    paths = {
+        "db": os.path.join(output_dir, "news.db"),
+        "index": os.path.join(output_dir, "inverted_index.json"),
+        "optimized": os.path.join(output_dir, "optimized_index.msgpack"),
+        "packed": os.path.join(output_dir, "packed_index.bin"),
+        "log": os.path.join(output_dir, "queries.jsonl"),
+    }
+
+    vocabulary = synthetic_vocabulary(vocab_size, rng)
+    weights = [1 / (rank + 1) ** 1.1 for rank in range(len(vocabulary))]
+    sources = [f"Source {i}" for i in range(20)]
+
+    if os.path.exists(paths["db"]):
+        os.remove(paths["db"])
+    create_table(paths["db"])
+
+    conn = sqlite3.connect(paths["db"])
+    inverted_index = defaultdict(dict)
+    documents = []
+    for i in range(num_docs):
+        title_words = rng.choices(vocabulary, weights, k=8)
+        content_words = rng.choices(vocabulary, weights, k=doc_length)
+        title = " ".join(title_words).capitalize()
+        published_at = f"{rng.randint(2009, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T00:00:00Z"
+        doc_id = hashlib.md5(f"{title}{published_at}{i}".encode()).hexdigest()
+        conn.execute(
+            "INSERT INTO news (id, title, description, content, url, published_at, source_name, source_url) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (doc_id, title, " ".join(content_words[:30]), " ".join(content_words),
+             f"https://example.com/{doc_id}", published_at, rng.choice(sources), "https://example.com")
+        )
+
+        # 与 Indexer 相同：标题+正文合并后的词位置（合成词均非停用词且词干不变）
+        for pos, token in enumerate(title_words + content_words):
+            inverted_index[token].setdefault(doc_id, {"positions": []})["positions"].append(pos)
+        documents.append(content_words)
+    conn.commit()
+    conn.close()
+
+    with open(paths["index"], "w", encoding="utf-8") as f:
+        json.dump(inverted_index, f)
+    IndexOptimizer.compress_index(paths["index"], paths["optimized"], paths["db"])
+    build_packed_index(paths["optimized"], paths["packed"])
+
+    # 生成覆盖各种查询类型的查询日志
+    with open(paths["log"], "w", encoding="utf-8") as f:
+        for _ in range(num_queries):
+            kind = rng.choice(["keyword", "keyword", "phrase", "proximity", "and", "or", "and_not"])
+            words = rng.choices(vocabulary, weights, k=3)
+            if kind == "keyword":
+                query = " ".join(words[:rng.randint(1, 3)])
+            elif kind == "phrase":
+                content_words = rng.choice(documents)
+                start = rng.randrange(len(content_words) - 1)
+                query = f'"{content_words[start]} {content_words[start + 1]}"'
+            elif kind == "proximity":
+                query = f"#{rng.randint(2, 10)} {words[0]} {words[1]}"
+            elif kind == "and_not":
+                query = f"{words[0]} and not {words[1]}"
+            else:
+                query = f"{words[0]} {kind} {words[1]}"
+            f.write(json.dumps({"query": query, "method": rng.choice(["tfidf", "bm25"])}) + "\n")
+
+    print(f"✅ 合成语料生成完成，耗时: {time.time() - start_time:.2f} 秒")
+    return paths
+
+
+def use_corpus(db_path, optimized_index_file, packed_index_file):
+    """让检索引擎使用指定的数据库和索引文件（直接从 mmap 打包索引加载，不经过Redis）"""
+    search_functions.db_file = db_path
+    BACKENDS["fts5"].db_path = db_path
+    BACKENDS["sharded"].sharded_index.optimized_index_file = optimized_index_file
+    BACKENDS["sharded"].sharded_index.shard_dir = os.path.join(os.path.dirname(optimized_index_file), "shards")
+    index_manager.optimized_index_file = optimized_index_file
+    index_manager.packed_index_file = packed_index_file
+    index_manager.load_packed_index()
+
+
+def load_query_log(path):
+    """读取 JSONL 查询日志"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run_query(query, method="tfidf", backend_name=None):
+    """与 /api/search 相同的检索流程：分类检索 + 排序"""
+    backend = get_backend(backend_name)
+    results = classify_search_query(query, None, backend, method=method)
+    if not isinstance(results, list):
+        return []
+
+    with span("score"):
+        if ranks_natively(backend, method):
+            pass
+        else:
+            weighted_terms = search_functions.scoring_terms(query) if classify_query_type(query) == "keyword" else None
+            if method == "tfidf":
+                results = tfidf(results, query, weighted_terms)
+            elif method == "bm25":
+                results = bm25(results, query, weighted_terms=weighted_terms)
+    return results
+
+
+def percentile(sorted_values, p):
+    """最近秩法计算百分位数"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(p / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def replay(entries, concurrency=1, method=None, backend_name=None, quiet=True):
+    """
+    按给定并发度回放查询日志
+
+    参数:
+    - entries: 查询日志条目列表
+    - concurrency: 并发线程数
+    - method: 覆盖日志中的排序方法
+    - backend_name: 检索后端 (index或fts5)；fts5 后端的短语和近邻查询在 Python 中按倒排索引的位置规则
+      校验全部候选文档，这部分耗时单独计入 verify 阶段
+    - quiet: 是否屏蔽检索过程中的 print 输出
+
+    返回:
+    - 统计报告字典
+    """
+
+    def execute(entry):
+        query = entry["query"]
+        with start_trace() as trace:
+            start = time.perf_counter()
+            results = run_query(query, method or entry.get("method", "tfidf"), backend_name)
+            elapsed = time.perf_counter() - start
+        return classify_query_type(query), elapsed, dict(trace.stages), len(results)
+
+    with open(os.devnull, "w") as devnull, \
+            (contextlib.redirect_stdout(devnull) if quiet else contextlib.nullcontext()):
+        wall_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            samples = list(executor.map(execute, entries))
+        wall_time = time.perf_counter() - wall_start
+
+    return summarize(samples, wall_time, concurrency)
+
+
+def summarize(samples, wall_time, concurrency):
+    """汇总延迟分布、QPS 和分阶段耗时"""
+    latencies = sorted(elapsed for _, elapsed, _, _ in samples)
+    by_type = defaultdict(list)
+    stage_totals = defaultdict(float)
+    for query_type, elapsed, stages, _ in samples:
+        by_type[query_type].append(elapsed)
+        for name, stage_elapsed in stages.items():
+            stage_totals[name] += stage_elapsed
+
+    count = len(samples) or 1
+    return {
+        "queries": len(samples),
+        "concurrency": concurrency,
+        "wall_time_sec": wall_time,
+        "qps": len(samples) / wall_time if wall_time else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 50) * 1000,
+            "p95": percentile(latencies, 95) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "mean": sum(latencies) / count * 1000,
+        },
+        "by_type": {
+            query_type: {
+                "count": len(values),
+                "p50_ms": percentile(sorted(values), 50) * 1000,
+                "p95_ms": percentile(sorted(values), 95) * 1000,
+            }
+            for query_type, values in sorted(by_type.items())
+        },
+        "stages_mean_ms": {name: total / count * 1000 for name, total in stage_totals.items()},
+        "avg_results": sum(hits for _, _, _, hits in samples) / count,
+    }
+
+
+def print_report(report):
+    """打印基准测试报告"""
+    latency = report["latency_ms"]
+    print("\n📊 基准测试结果:")
+    print(f"查询数: {report['queries']}，并发: {report['concurrency']}，"
+          f"总耗时: {report['wall_time_sec']:.2f} 秒，QPS: {report['qps']:.1f}")
+    print(f"延迟 (ms): p50={latency['p50']:.2f}  p95={latency['p95']:.2f}  "
+          f"p99={latency['p99']:.2f}  mean={latency['mean']:.2f}")
+    print(f"平均结果数: {report['avg_results']:.1f}")
+
+    print("\n按查询类型:")
+    for query_type, stats in report["by_type"].items():
+        print(f"  {query_type:<10} n={stats['count']:<6} p50={stats['p50_ms']:.2f} ms  p95={stats['p95_ms']:.2f} ms")
+
+    print("\n分阶段平均耗时 (每个查询):")
+    total = sum(report["stages_mean_ms"].values()) or 1
+    for name in STAGES:
+        if name in report["stages_mean_ms"]:
+            elapsed = report["stages_mean_ms"][name]
+            print(f"  {name:<10} {elapsed:8.2f} ms  ({elapsed / total:.0%})")
+
+
+if __name__ == "__main__":
+    corpus = generate_corpus(num_docs=2000, num_queries=200)
+    use_corpus(corpus["db"], corpus["optimized"], corpus["packed"])
+    print_report(replay(load_query_log(corpus["log"]), concurrency=4))
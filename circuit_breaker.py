@@ -0,0 +1,89 @@
+"""
+熔断器
+
+连续失败达到阈值后打开，在 reset_timeout 秒内直接拒绝调用，调用方改走本地降级路径，
+不再为每次请求等待超时；冷却时间过后进入半开状态，只放行一次探测调用，
+成功则关闭，失败则重新打开。
+"""
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    参数:
+    - name: 名称，用于日志
+    - failure_threshold: 连续失败多少次后打开
+    - reset_timeout: 打开后多少秒进入半开状态
+    """
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self.failures_total = 0
+        self.last_error = None
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self):
+        """
+        是否允许发起调用；半开状态下只放行一次探测调用
+
+        放行后调用方必须在每条退出路径上调用 record_success 或 record_failure，
+        否则探测标记不会释放，熔断器会一直拒绝调用。
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            if self._probing:
+                return False
+            self._state = HALF_OPEN
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                print(f"✅ {self.name} 已恢复，熔断器关闭")
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self.failures_total += 1
+            self.last_error = str(error) if error is not None else None
+            self._failures += 1
+            self._probing = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    print(f"⚠️ {self.name} 连续失败 {self._failures} 次，熔断 {self.reset_timeout:g} 秒")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def status(self):
+        """返回熔断器状态，用于 /api/stats、/api/health 和指标"""
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "failures_total": self.failures_total,
+            "last_error": self.last_error,
+        }
@@ -7,3 +7,68 @@ DB_PATH = "news.db"
 
 # GNews API 基础 URL
 GNEWS_BASE_URL = "https://gnews.io/api/v4/search?"
+
+# GNews 抓取的并发数、平均每秒请求数、令牌桶容量和最大重试次数
+GNEWS_CONCURRENCY = 4
+GNEWS_RATE_LIMIT = 1.0
+GNEWS_BURST = 4
+GNEWS_MAX_RETRIES = 5
+# 已完成的 (关键词, 年份) 检查点文件
+GNEWS_CHECKPOINT = "gnews_checkpoint.jsonl"
+
+# 检索线程池大小，以及同时运行和排队的检索任务上限
+SEARCH_WORKERS = 4
+SEARCH_QUEUE_LIMIT = 32
+
+# ASGI 模式下处理请求的线程数
+ASGI_REQUEST_THREADS = 32
+
+# 默认检索后端: index (自定义倒排索引)、fts5 (SQLite FTS5) 或 sharded (按文档ID区间分片的多进程索引)
+SEARCH_BACKEND = "index"
+# sharded 后端的分片数（工作进程数）和分片文件目录
+INDEX_SHARDS = 4
+SHARD_DIR = "shards"
+
+# 是否为每个检索请求记录分阶段耗时，并汇总到 /metrics 指标中
+TRACING_ENABLED = True
+
+# 慢查询日志：超过阈值（毫秒）的查询会连同执行计划和分阶段耗时写入日志，None 表示关闭
+SLOW_QUERY_THRESHOLD_MS = None
+SLOW_QUERY_LOG = "slow_queries.jsonl"
+# 在 cProfile 下运行的查询比例 (0~1)，其中的慢查询会保存 profile 文件，最多保留 SLOW_QUERY_MAX_PROFILES 个
+SLOW_QUERY_PROFILE_RATE = 0.0
+SLOW_QUERY_PROFILE_DIR = "slow_query_profiles"
+SLOW_QUERY_MAX_PROFILES = 20
+
+# 静态排名：时效性、来源质量和正文长度的权重，时效性的半衰期（天）
+STATIC_RANK_WEIGHTS = {"recency": 0.5, "source": 0.3, "length": 0.2}
+STATIC_RANK_HALF_LIFE_DAYS = 365
+# 来源质量分数 (0~1)，未列出的来源按其在语料中的文章数估计
+SOURCE_QUALITY = {}
+# 构建优化索引时是否按静态排名降序存储每个词条的倒排记录
+IMPACT_ORDERED_POSTINGS = False
+# 宽泛的关键词查询只取静态排名最高的前 k 篇文档打分，None 表示关闭提前结束
+EARLY_TERMINATION_K = None
+
+# 排序结果缓存：最多缓存的查询数、有效期（秒）以及每个查询保存的文档ID数，用于深度分页
+RANKED_CACHE_SIZE = 256
+RANKED_CACHE_TTL = 300
+RANKED_CACHE_MAX_IDS = 10000
+
+# 近重复折叠：检索进程每隔多少秒增量读取一次新写入新闻的 cluster_id
+CLUSTER_MAP_REFRESH_INTERVAL = 60
+
+# 关键词搜索中不在索引里的词条最多扩展为几个拼写相近的词条，0 表示关闭
+FUZZY_MAX_EXPANSIONS = 3
+
+# Redis 连接：连接池大小、连接和读写超时（秒）、空闲连接的健康检查间隔（秒）
+REDIS_HOST = "localhost"
+REDIS_PORT = 6379
+REDIS_DB = 0
+REDIS_MAX_CONNECTIONS = 16
+REDIS_CONNECT_TIMEOUT = 0.5
+REDIS_SOCKET_TIMEOUT = 1.0
+REDIS_HEALTH_CHECK_INTERVAL = 30
+# Redis 熔断：连续失败多少次后熔断，熔断后多少秒再尝试连接；熔断期间直接使用本地 mmap 打包索引
+REDIS_CIRCUIT_FAILURE_THRESHOLD = 3
+REDIS_CIRCUIT_RESET_TIMEOUT = 30
@@ -1,9 +1,9 @@
 import sqlite3
 from config import DB_PATH
 
-def create_table():
+def create_table(db_path=DB_PATH):
     """创建数据库表"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS news (
@@ -17,9 +17,53 @@ def create_table():
         source_url TEXT
     )
     """)
+    cursor.execute(CRAWL_STATE_SCHEMA)
+    conn.commit()
+    conn.close()
+
+# 每篇新闻的抓取状态：条件请求的验证信息、抓取结果、正文哈希和失败退避
+CRAWL_STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS crawl_state (
+    id TEXT PRIMARY KEY,
+    url TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    status INTEGER,
+    content_hash TEXT,
+    indexed_hash TEXT,
+    failures INTEGER DEFAULT 0,
+    fetched_at REAL,
+    next_retry_at REAL
+)
+"""
+
+def create_crawl_state_table(db_path=DB_PATH):
+    """创建抓取状态表"""
+    conn = sqlite3.connect(db_path)
+    conn.execute(CRAWL_STATE_SCHEMA)
     conn.commit()
     conn.close()
 
+def changed_doc_ids(db_path=DB_PATH):
+    """正文哈希与上次建索引时不同的新闻 ID（包括已被删除、需要从索引中移除的新闻）"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM crawl_state WHERE content_hash IS NOT indexed_hash")
+    doc_ids = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return doc_ids
+
+def mark_indexed(doc_ids, db_path=DB_PATH):
+    """记录这些新闻已按当前正文重建索引"""
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany("UPDATE crawl_state SET indexed_hash = content_hash WHERE id = ?",
+                         [(doc_id,) for doc_id in doc_ids])
+        # 已删除的新闻从索引中移除后，不再需要保留抓取状态
+        conn.execute("DELETE FROM crawl_state WHERE content_hash IS NULL AND indexed_hash IS NULL "
+                     "AND id NOT IN (SELECT id FROM news)")
+    conn.close()
+
 def insert_news(news_hash, title, description, content, url, published_at, source_name, source_url):
     """插入新闻（去重存储）"""
     conn = sqlite3.connect(DB_PATH)
@@ -45,5 +89,68 @@ def check_duplicate(news_hash):
     return exists is not None  # 如果存在，则返回 True
 
 
+class BatchWriter:
+    """
+    批量写入新闻
+
+    使用一个常驻的 WAL 模式连接，文章先在内存中攒批，每批在一个事务中通过
+    INSERT OR IGNORE 写入，按主键去重，不再为每篇文章单独打开连接、查重和提交。
+    """
+
+    def __init__(self, db_path=DB_PATH, batch_size=500, detect_duplicates=True):
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.pending = []
+        self.inserted = 0  # 成功写入的文章数
+        self.skipped = 0  # 因主键重复被忽略的文章数
+        self.near_duplicates = 0  # 与已有新闻近重复的文章数（仍然写入，但归入同一 cluster_id）
+
+        # 写入时增量检测近重复转载
+        self.detector = None
+        if detect_duplicates:
+            from near_duplicates import NearDuplicateDetector
+            with self.conn:
+                self.detector = NearDuplicateDetector(self.conn)
+
+    def add(self, news_hash, title, description, content, url, published_at, source_name, source_url):
+        """加入一篇新闻，攒满一批时自动写入"""
+        self.pending.append((news_hash, title, description, content, url, published_at, source_name, source_url))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """在一个事务中写入当前批次，返回本批写入的文章数"""
+        if not self.pending:
+            return 0
+
+        with self.conn:
+            cursor = self.conn.executemany("""
+            INSERT OR IGNORE INTO news (id, title, description, content, url, published_at, source_name, source_url)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, self.pending)
+            if self.detector:
+                self.near_duplicates += self.detector.assign_ids(row[0] for row in self.pending)
+        # executemany 的 rowcount 是各条语句实际插入行数之和，不包括触发器产生的修改
+        inserted = cursor.rowcount
+        self.inserted += inserted
+        self.skipped += len(self.pending) - inserted
+        self.pending = []
+        return inserted
+
+    def close(self):
+        """写入剩余的文章并关闭连接"""
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
 if __name__ == "__main__":
     create_table()
@@ -1,6 +1,18 @@
+import logging
 import math
 import re
-from collections import defaultdict
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from functools import lru_cache
+
+from nltk.corpus import stopwords
+from nltk.stem import PorterStemmer
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = set(stopwords.words("english"))
+# 文档中的词大量重复，缓存词干提取结果
+stem = lru_cache(maxsize=100000)(PorterStemmer().stem)
 
 
 def preprocess_text(text):
@@ -14,6 +26,65 @@ def preprocess_text(text):
     return tokens
 
 
+def index_tokens(text):
+    """按倒排索引构建时的规则切分文本: 小写、去除标点、去停用词、词干化，用于按扩展出的词干打分"""
+    if not text:
+        return []
+    words = re.sub(r"[^\w\s]", "", text.lower()).split()
+    return [stem(word) for word in words if word not in STOPWORDS]
+
+
+# 按扩展出的词干打分时缓存每篇文档的词频，翻页和相近的拼写/通配符查询反复为同一批文档打分时不再重新分词
+DOC_TERM_CACHE_SIZE = 20000
+_doc_term_cache = OrderedDict()
+_doc_term_lock = threading.Lock()
+
+
+def index_term_counts(doc_id, text):
+    """
+    按 index_tokens 切分的文档词频，返回 (Counter, 词数)
+
+    以文档ID和文本的哈希为键缓存，文档内容变化后自然失效。
+    """
+    key = (doc_id, hash(text))
+    with _doc_term_lock:
+        entry = _doc_term_cache.get(key)
+        if entry is not None:
+            _doc_term_cache.move_to_end(key)
+            return entry
+
+    tokens = index_tokens(text)
+    entry = (Counter(tokens), len(tokens))
+    with _doc_term_lock:
+        _doc_term_cache[key] = entry
+        while len(_doc_term_cache) > DOC_TERM_CACHE_SIZE:
+            _doc_term_cache.popitem(last=False)
+    return entry
+
+
+def _plain_term_counts(doc_id, text):
+    tokens = preprocess_text(text)
+    return Counter(tokens), len(tokens)
+
+
+def _query_terms(query, weighted_terms):
+    """返回 ([(小写查询词, 权重), ...], 文档词频函数)"""
+    if weighted_terms:
+        return [(term.lower(), weight) for term, weight in weighted_terms.items()], index_term_counts
+    return [(term, 1.0) for term in query.lower().split()], _plain_term_counts
+
+
+def _doc_term_counts(results, term_counts):
+    """每篇文档只分词一次，得到 {文档ID: (词频 Counter, 词数)}，每个查询词的词频和文档频率都从中直接读取"""
+    doc_counts = {}
+    for result in results:
+        # 合并标题和内容以提高匹配质量
+        title = result.get("title", "")
+        content = result.get("content", "")
+        doc_counts[result["id"]] = term_counts(result["id"], f"{title} {content}")
+    return doc_counts
+
+
 def calculate_term_frequency(term, tokens):
     """计算词频"""
     if not tokens:
@@ -22,41 +93,35 @@ def calculate_term_frequency(term, tokens):
     return term_count / len(tokens)
 
 
-def tfidf(results, query):
+def tfidf(results, query, weighted_terms=None):
     """
     使用TF-IDF对结果进行排序
     参数:
     - results: 搜索结果列表
     - query: 搜索关键词(假设已经去除停用词)
+    - weighted_terms: 可选的 {词干: 权重}，查询经过拼写或通配符扩展时给出，此时按词干匹配文档并加权
     返回:
     - 排序后的搜索结果列表
     """
     if not results:
         return []
 
-    print(f"TF-IDF排序: 输入结果数量 {len(results)}")
+    logger.debug(f"TF-IDF排序: 输入结果数量 {len(results)}")
 
     # 直接使用查询词，假设search_functions已经去除了停用词
-    query_terms = query.lower().split()
+    query_terms, term_counts = _query_terms(query, weighted_terms)
     if not query_terms:
         return results  # 如果查询为空,直接返回原结果
 
     # 预处理文档内容
-    doc_tokens = {}
-    for result in results:
-        # 合并标题和内容以提高匹配质量
-        title = result.get("title", "")
-        content = result.get("content", "")
-        combined_text = f"{title} {content}"
-        doc_tokens[result["id"]] = preprocess_text(combined_text)
+    doc_counts = _doc_term_counts(results, term_counts)
 
     # 计算文档评分
     doc_scores = defaultdict(float)
 
-    for term in query_terms:
+    for term, weight in query_terms:
         # 计算含有该词的文档数
-        term_docs = sum(1 for doc_id, tokens in doc_tokens.items()
-                        if any(token.lower() == term.lower() for token in tokens))
+        term_docs = sum(1 for counts, _ in doc_counts.values() if counts[term])
         if term_docs == 0:
             continue  # 如果没有文档包含该词,跳过
 
@@ -64,15 +129,12 @@ def tfidf(results, query):
         idf = math.log((len(results) + 1) / (term_docs + 1)) + 1
 
         # 为每个文档计算TF-IDF分数
-        for result in results:
-            doc_id = result["id"]
-            tokens = doc_tokens[doc_id]
-
+        for doc_id, (counts, length) in doc_counts.items():
             # 计算词频 (TF)
-            tf = calculate_term_frequency(term, tokens)
+            tf = counts[term] / length if length else 0
 
             # 累加TF-IDF评分
-            doc_scores[doc_id] += tf * idf
+            doc_scores[doc_id] += weight * tf * idf
 
     # 如果没有任何文档获得分数,返回原始结果
     if not doc_scores:
@@ -81,20 +143,21 @@ def tfidf(results, query):
     # 按评分排序
     sorted_results = sorted(results, key=lambda x: doc_scores.get(x["id"], 0), reverse=True)
 
-    print(f"TF-IDF排序: 输出结果数量 {len(sorted_results)}")
+    logger.debug(f"TF-IDF排序: 输出结果数量 {len(sorted_results)}")
     if sorted_results:
         top_score = doc_scores.get(sorted_results[0]["id"], 0)
-        print(f"最高分数: {top_score:.4f}, 最低分数: {doc_scores.get(sorted_results[-1]['id'], 0):.4f}")
+        logger.debug(f"最高分数: {top_score:.4f}, 最低分数: {doc_scores.get(sorted_results[-1]['id'], 0):.4f}")
 
     return sorted_results
 
 
-def bm25(results, query, k1=1.5, b=0.75):
+def bm25(results, query, k1=1.5, b=0.75, weighted_terms=None):
     """
     使用BM25对结果进行排序
     参数:
     - results: 搜索结果列表
     - query: 搜索关键词(假设已经去除停用词)
+    - weighted_terms: 可选的 {词干: 权重}，查询经过拼写或通配符扩展时给出，此时按词干匹配文档并加权
     - k1: BM25参数,控制词频缩放(默认1.5)
     - b: BM25参数,控制文档长度归一化(默认0.75)
     返回:
@@ -103,33 +166,25 @@ def bm25(results, query, k1=1.5, b=0.75):
     if not results:
         return []
 
-    print(f"BM25排序: 输入结果数量 {len(results)}")
+    logger.debug(f"BM25排序: 输入结果数量 {len(results)}")
 
     # 直接使用查询词，假设search_functions已经去除了停用词
-    query_terms = query.lower().split()
+    query_terms, term_counts = _query_terms(query, weighted_terms)
     if not query_terms:
         return results  # 如果查询为空,直接返回原结果
 
     # 预处理文档内容
-    doc_tokens = {}
-    for result in results:
-        # 合并标题和内容以提高匹配质量
-        title = result.get("title", "")
-        content = result.get("content", "")
-        combined_text = f"{title} {content}"
-        doc_tokens[result["id"]] = preprocess_text(combined_text)
+    doc_counts = _doc_term_counts(results, term_counts)
 
     # 计算平均文档长度
-    doc_lengths = {doc_id: len(tokens) for doc_id, tokens in doc_tokens.items()}
-    avg_doc_length = sum(doc_lengths.values()) / len(doc_lengths) if doc_lengths else 1
+    avg_doc_length = sum(length for _, length in doc_counts.values()) / len(doc_counts) if doc_counts else 1
 
     # 计算文档评分
     doc_scores = defaultdict(float)
 
-    for term in query_terms:
+    for term, weight in query_terms:
         # 计算含有该词的文档数
-        term_docs = sum(1 for doc_id, tokens in doc_tokens.items()
-                        if any(token.lower() == term.lower() for token in tokens))
+        term_docs = sum(1 for counts, _ in doc_counts.values() if counts[term])
         if term_docs == 0:
             continue  # 如果没有文档包含该词,跳过
 
@@ -137,20 +192,16 @@ def bm25(results, query, k1=1.5, b=0.75):
         idf = math.log((len(results) - term_docs + 0.5) / (term_docs + 0.5) + 1)
 
         # 为每个文档计算BM25分数
-        for result in results:
-            doc_id = result["id"]
-            tokens = doc_tokens[doc_id]
-
-            # 计算词频(考虑大小写不敏感)
-            tf = sum(1 for token in tokens if token.lower() == term.lower())
+        for doc_id, (counts, doc_length) in doc_counts.items():
+            # 计算词频(分词时已统一转换为小写)
+            tf = counts[term]
 
             # 文档长度归一化
-            doc_length = doc_lengths[doc_id]
             normalized_length = doc_length / avg_doc_length
 
             # BM25评分公式
             score_part = (tf * (k1 + 1)) / (tf + k1 * (1 - b + b * normalized_length))
-            doc_scores[doc_id] += idf * score_part
+            doc_scores[doc_id] += weight * idf * score_part
 
     # 如果没有任何文档获得分数,返回原始结果
     if not doc_scores:
@@ -159,9 +210,9 @@ def bm25(results, query, k1=1.5, b=0.75):
     # 按评分排序
     sorted_results = sorted(results, key=lambda x: doc_scores.get(x["id"], 0), reverse=True)
 
-    print(f"BM25排序: 输出结果数量 {len(sorted_results)}")
+    logger.debug(f"BM25排序: 输出结果数量 {len(sorted_results)}")
     if sorted_results:
         top_score = doc_scores.get(sorted_results[0]["id"], 0)
-        print(f"最高分数: {top_score:.4f}, 最低分数: {doc_scores.get(sorted_results[-1]['id'], 0):.4f}")
+        logger.debug(f"最高分数: {top_score:.4f}, 最低分数: {doc_scores.get(sorted_results[-1]['id'], 0):.4f}")
 
     return sorted_results
\ No newline at end of file
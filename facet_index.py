@@ -0,0 +1,219 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+import msgpack
+
+from config import DB_PATH
+from index_optimizer import IndexOptimizer
+
+
+def bitmap_to_bytes(bitmap):
+    """将整数位图编码为小端字节串，便于msgpack存储"""
+    return bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+
+
+# 一次加载得到的完整分面位图，整体发布后不再修改
+FacetData = namedtuple("FacetData", ["doc_ids", "doc_id_map", "source_bitmaps", "year_bitmaps"])
+
+# 每个字节值中置位的比特位置，用于快速解码位图
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+
+def bitmap_from_ids(int_doc_ids):
+    """由整数文档ID集合构建位图，第 i 位表示文档 i"""
+    buffer = bytearray()
+    for int_doc_id in int_doc_ids:
+        byte_index = int_doc_id >> 3
+        if byte_index >= len(buffer):
+            buffer.extend(bytes(byte_index - len(buffer) + 1))
+        buffer[byte_index] |= 1 << (int_doc_id & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def iter_bitmap(bitmap):
+    """依次返回位图中所有置位的整数文档ID"""
+    for byte_index, value in enumerate(bitmap_to_bytes(bitmap)):
+        if value:
+            base = byte_index << 3
+            for bit in _BYTE_BITS[value]:
+                yield base + bit
+
+
+class FacetIndex:
+    """
+    来源和发布年份的分面索引
+
+    在索引构建时为每个来源 (source_name) 和每个发布年份生成文档位图，
+    位图使用Python整数表示，第 i 位对应优化索引中的整数文档ID i。
+    来源过滤直接对位图做并运算，分面计数用位图与结果位图求交后计数，无需额外查询数据库。
+    日期范围过滤由 segment_index 按文档的发布时间精确完成。
+    全部位图解码完成后作为一个 FacetData 整体发布，加载在锁内进行，并发请求只解压一次。
+    """
+
+    def __init__(self, facet_file="facet_index.msgpack",
+                 optimized_index_file="optimized_index.msgpack", db_path=DB_PATH):
+        self.facet_file = facet_file
+        self.optimized_index_file = optimized_index_file
+        self.db_path = db_path
+
+        self._data = None
+        self._lock = threading.Lock()
+
+    def build(self):
+        """从优化索引的文档ID映射和数据库构建分面位图"""
+        print("📌 开始构建分面位图...")
+        start_time = time.time()
+
+        optimized_data = IndexOptimizer.decompress_index(self.optimized_index_file)
+        if not optimized_data:
+            raise Exception(f"无法加载优化索引: {self.optimized_index_file}")
+        doc_id_map = optimized_data["doc_id_map"]
+
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, source_name, published_at FROM news")
+        rows = cursor.fetchall()
+        conn.close()
+
+        source_ids = {}
+        year_ids = {}
+        for doc_id, source_name, published_at in rows:
+            int_doc_id = doc_id_map.get(doc_id)
+            if int_doc_id is None:
+                continue  # 未被索引的文档不参与过滤
+            source_ids.setdefault(source_name or "Unknown Source", []).append(int_doc_id)
+            if published_at and published_at[:4].isdigit():
+                year_ids.setdefault(published_at[:4], []).append(int_doc_id)
+
+        doc_ids = [None] * len(doc_id_map)
+        for doc_id, int_doc_id in doc_id_map.items():
+            doc_ids[int_doc_id] = doc_id
+
+        facet_data = {
+            "doc_ids": doc_ids,
+            "sources": {name: bitmap_to_bytes(bitmap_from_ids(ids)) for name, ids in source_ids.items()},
+            "years": {year: bitmap_to_bytes(bitmap_from_ids(ids)) for year, ids in year_ids.items()}
+        }
+        with open(self.facet_file, "wb") as f:
+            f.write(zlib.compress(msgpack.packb(facet_data, use_bin_type=True)))
+
+        self._load_data(facet_data)
+        print(f"✅ 分面位图构建完成，{len(source_ids)} 个来源，{len(year_ids)} 个年份，"
+              f"耗时: {time.time() - start_time:.2f} 秒")
+        return facet_data
+
+    def _load_data(self, facet_data):
+        """解码全部位图后一次性替换引用"""
+        doc_ids = facet_data["doc_ids"]
+        source_bitmaps = {name: int.from_bytes(data, "little") for name, data in facet_data["sources"].items()}
+        year_bitmaps = {}
+        # 旧版本的分面文件按月份存储位图，加载时合并为年份
+        for bucket, data in facet_data.get("years", facet_data.get("months", {})).items():
+            year_bitmaps[bucket[:4]] = year_bitmaps.get(bucket[:4], 0) | int.from_bytes(data, "little")
+        self._data = FacetData(doc_ids, {doc_id: int_doc_id for int_doc_id, doc_id in enumerate(doc_ids)},
+                               source_bitmaps, year_bitmaps)
+        return self._data
+
+    def _read(self):
+        """从文件读取分面位图，文件不存在时构建"""
+        if not os.path.exists(self.facet_file):
+            print(f"⚠️ 分面位图文件不存在，开始构建: {self.facet_file}")
+            self.build()
+            return self._data
+
+        with open(self.facet_file, "rb") as f:
+            facet_data = msgpack.unpackb(zlib.decompress(f.read()), raw=False)
+        return self._load_data(facet_data)
+
+    def load(self):
+        """加载分面位图（多个线程同时调用时只加载一次），文件不存在时自动构建"""
+        data = self._data
+        if data is not None:
+            return data
+        with self._lock:
+            return self._data or self._read()
+
+    def reload(self):
+        """重新加载位图（索引重建后调用），加载完成前查询继续使用旧位图"""
+        with self._lock:
+            return self._read()
+
+    def filter_bitmap(self, sources=None):
+        """
+        根据来源计算文档位图
+
+        参数:
+        - sources: 来源名称列表，多个来源之间为"或"关系
+
+        返回:
+        - 属于这些来源的文档位图；没有给出来源时返回 None
+        """
+        if not sources:
+            return None
+        return self._filter_bitmap(self.load(), sources)
+
+    @staticmethod
+    def _filter_bitmap(data, sources):
+        bitmap = 0
+        for source in sources:
+            bitmap |= data.source_bitmaps.get(source, 0)
+        return bitmap
+
+    def doc_filter(self, sources=None):
+        """返回属于这些来源的原始文档ID集合，供检索函数在查询数据库之前裁剪候选文档"""
+        if not sources:
+            return None
+        # 位图和文档ID列表取自同一份数据，避免与重新加载交错
+        data = self.load()
+        bitmap = self._filter_bitmap(data, sources)
+        return {data.doc_ids[int_doc_id] for int_doc_id in iter_bitmap(bitmap)}
+
+    def facet_counts(self, doc_ids, top_n=20):
+        """
+        计算一组结果文档的分面计数
+
+        参数:
+        - doc_ids: 全部结果（不只是当前页）的原始文档ID
+        - top_n: 每个分面最多返回的取值个数
+
+        返回:
+        - {"source": {来源: 数量}, "year": {年份: 数量}}
+        """
+        data = self.load()
+        result_bitmap = bitmap_from_ids(
+            data.doc_id_map[doc_id] for doc_id in doc_ids if doc_id in data.doc_id_map
+        )
+        if not result_bitmap:
+            return {"source": {}, "year": {}}
+
+        source_counts = {}
+        for name, bitmap in data.source_bitmaps.items():
+            count = (bitmap & result_bitmap).bit_count()
+            if count:
+                source_counts[name] = count
+
+        year_counts = {}
+        for year, bitmap in data.year_bitmaps.items():
+            count = (bitmap & result_bitmap).bit_count()
+            if count:
+                year_counts[year] = count
+
+        top_sources = sorted(source_counts.items(), key=lambda item: item[1], reverse=True)[:top_n]
+        return {
+            "source": dict(top_sources),
+            "year": dict(sorted(year_counts.items(), reverse=True))
+        }
+
+
+# 创建全局实例，用于应用中访问
+facet_index = FacetIndex()
+
+if __name__ == "__main__":
+    # 构建分面位图并打印来源分布
+    manager = FacetIndex()
+    manager.build()
+    print(manager.facet_counts(manager.load().doc_ids))
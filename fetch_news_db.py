@@ -1,35 +1,46 @@
 import sqlite3
+from tracing import span, count
 
 db_file="news.db"
+
+
+def news_query(num_ids):
+    """按ID批量读取新闻的 SQL，同步和异步回表共用"""
+    placeholders = ",".join(["?" for _ in range(num_ids)])  # 生成 (?, ?, ?) 形式的参数
+    return f"""
+    SELECT id, title, description, content, url, published_at, source_name, source_url 
+    FROM news 
+    WHERE id IN ({placeholders})
+    """
+
+
+def news_row(row):
+    """将查询结果的一行转换为新闻字典"""
+    return {
+        "id": row[0],
+        "title": row[1],
+        "snippet": row[2],
+        "content": row[3],
+        "url": row[4],
+        "published_at": row[5],
+        "source_name": row[6],
+        "source_url": row[7],
+    }
+
+
 # **数据库查询函数**
+@span("hydrate")
 def fetch_news_from_db(doc_ids, db_file):
     """从 SQLite 数据库中查询完整新闻数据"""
     conn = sqlite3.connect(db_file)
     cursor = conn.cursor()
 
     # 查询数据库
-    placeholders = ",".join(["?" for _ in doc_ids])  # 生成 (?, ?, ?) 形式的参数
-    query = f"""
-    SELECT id, title, description, content, url, published_at, source_name, source_url 
-    FROM news 
-    WHERE id IN ({placeholders})
-    """
-    cursor.execute(query, doc_ids)
+    cursor.execute(news_query(len(doc_ids)), doc_ids)
 
     # 获取查询结果
-    results = [
-        {
-            "id": row[0],
-            "title": row[1],
-            "snippet": row[2],
-            "content": row[3],
-            "url": row[4],
-            "published_at": row[5],
-            "source_name": row[6],
-            "source_url": row[7],
-        }
-        for row in cursor.fetchall()
-    ]
+    results = [news_row(row) for row in cursor.fetchall()]
 
     conn.close()
+    count("rows_hydrated", len(results))
     return results
\ No newline at end of file
@@ -0,0 +1,213 @@
+"""
+GNews 抓取调度器
+
+- 多个请求并发执行，并发数可配置
+- 令牌桶限流，使请求速率不超过 API 配额
+- 遇到 429 和 5xx 时按指数退避重试（优先使用 Retry-After）
+- 每个 (关键词, 年份) 完成后写入检查点文件，崩溃后重新运行会跳过已完成的组合；整轮完成后清空检查点
+
+base_url 可配置，因此也可以对本地的模拟 HTTP 服务器运行。
+"""
+import asyncio
+import json
+import os
+import random
+import time
+
+import aiohttp
+
+from config import (GNEWS_API_KEY, GNEWS_BASE_URL, GNEWS_CONCURRENCY, GNEWS_RATE_LIMIT, GNEWS_BURST,
+                    GNEWS_MAX_RETRIES, GNEWS_CHECKPOINT)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """令牌桶：平均每秒发放 rate 个令牌，最多积攒 capacity 个"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """取走一个令牌，没有令牌时等待"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class FetchCheckpoint:
+    """
+    记录已完成的 (类别, 关键词, 年份) 组合，每完成一个追加一行 JSON
+
+    同一个关键词可能出现在多个类别下，抓到的文章按类别分别处理，因此类别也是键的一部分；
+    旧格式中没有类别的记录不会匹配任何组合，这些组合会重新抓取一次
+    """
+
+    def __init__(self, path=GNEWS_CHECKPOINT):
+        self.path = path
+        self.completed = set()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.completed.add((entry.get("category"), entry["query"], entry["year"]))
+
+    def is_done(self, category, query, year):
+        return (category, query, year) in self.completed
+
+    def clear(self):
+        """整轮抓取完成后清空检查点，下一轮从头开始"""
+        self.completed = set()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def mark_done(self, category, query, year, count):
+        self.completed.add((category, query, year))
+        if self.path:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"category": category, "query": query, "year": year, "articles": count},
+                                   ensure_ascii=False) + "\n")
+
+
+class FetchScheduler:
+    """
+    并发、限流、可断点续抓的 GNews 抓取器
+
+    参数:
+    - base_url: API 地址
+    - api_key: API 密钥
+    - concurrency: 同时进行的请求数
+    - rate: 平均每秒请求数
+    - burst: 令牌桶容量，允许的瞬时突发请求数
+    - max_retries: 429/5xx/网络错误的最大重试次数
+    - checkpoint_file: 检查点文件，None 表示不记录
+    - page_size: 每次请求返回的文章数
+    """
+
+    def __init__(self, base_url=GNEWS_BASE_URL, api_key=GNEWS_API_KEY, concurrency=GNEWS_CONCURRENCY,
+                 rate=GNEWS_RATE_LIMIT, burst=GNEWS_BURST, max_retries=GNEWS_MAX_RETRIES,
+                 checkpoint_file=GNEWS_CHECKPOINT, page_size=100, backoff=1.0):
+        self.base_url = base_url.rstrip("?")
+        self.api_key = api_key
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.checkpoint = FetchCheckpoint(checkpoint_file)
+        self.page_size = page_size
+        self.backoff = backoff
+        self._stopped = False
+
+    def stop(self):
+        """不再开始新的请求（正在进行的请求会正常完成）"""
+        self._stopped = True
+
+    async def fetch(self, session, bucket, query, year):
+        """
+        抓取某个关键词在某一年的新闻
+
+        返回:
+        - 文章列表；请求最终失败时返回 None（不写入检查点，下次运行会重试）
+        """
+        params = {
+            "q": query,
+            "lang": "en",
+            "max": self.page_size,
+            "apikey": self.api_key,
+            "from": f"{year}-01-01T00:00:00Z",
+            "to": f"{year}-12-31T23:59:59Z",
+        }
+
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            retry_after = None
+            try:
+                async with session.get(self.base_url, params=params) as response:
+                    if response.status == 200:
+                        data = await response.json()
+                        return data.get("articles", [])
+                    if response.status not in RETRY_STATUSES:
+                        print(f"❌ 请求失败 ({response.status}): {query} {year} {await response.text()}")
+                        return None
+                    print(f"⚠️ 请求受限或服务端错误 ({response.status}): {query} {year}")
+                    retry_after = response.headers.get("Retry-After")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"⚠️ 请求出错: {query} {year}: {e}")
+
+            if attempt == self.max_retries:
+                break
+
+            # 指数退避加随机抖动；服务器给出 Retry-After 时以其为准
+            delay = self.backoff * 2 ** attempt + random.uniform(0, self.backoff)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            await asyncio.sleep(delay)
+
+        print(f"❌ 重试 {self.max_retries} 次后仍然失败: {query} {year}")
+        return None
+
+    async def run(self, cells, handle_articles):
+        """
+        抓取所有 (类别, 关键词, 年份) 组合
+
+        参数:
+        - cells: (category, query, year) 的可迭代对象，按此顺序调度
+        - handle_articles: 回调 handle_articles(category, query, year, articles)，在事件循环线程中调用
+
+        返回:
+        - 本次完成的组合数
+        """
+        queue = asyncio.Queue()
+        skipped = 0
+        self._stopped = False
+        for cell in cells:
+            if self.checkpoint.is_done(*cell):
+                skipped += 1
+            else:
+                queue.put_nowait(cell)
+        if skipped:
+            print(f"⏭️ 跳过检查点中已完成的 {skipped} 个组合")
+
+        bucket = TokenBucket(self.rate, self.burst)
+        completed = 0
+
+        async def worker():
+            nonlocal completed
+            while not self._stopped:
+                try:
+                    category, query, year = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                articles = await self.fetch(session, bucket, query, year)
+                if articles is not None:
+                    handle_articles(category, query, year, articles)
+                    self.checkpoint.mark_done(category, query, year, len(articles))
+                    completed += 1
+
+        pending = queue.qsize()
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60)) as session:
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            try:
+                await asyncio.gather(*workers)
+            except BaseException:
+                # 某个 worker 出错时取消其余 worker，已完成的组合都在检查点中
+                for task in workers:
+                    task.cancel()
+                raise
+
+        if completed == pending:
+            self.checkpoint.clear()
+        else:
+            print(f"⚠️ 本轮完成 {completed}/{pending} 个组合，检查点已保存，重新运行将继续抓取剩余部分")
+        return completed
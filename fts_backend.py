@@ -0,0 +1,252 @@
+import bisect
+import json
+import re
+import sqlite3
+import time
+
+from nltk.corpus import stopwords
+
+import fetch_news_db
+from config import DB_PATH
+from index import Indexer
+from search_functions import STEMMER, is_phrase_match, preprocess_query
+from tracing import span
+
+STOPWORDS = set(stopwords.words("english"))
+
+# 短语和近邻查询的位置校验使用与倒排索引构建完全相同的分词（去除停用词后再编号）
+INDEXER = Indexer()
+
+FTS_SCHEMA = [
+    # 外部内容表：FTS5 只保存倒排数据，正文仍然存放在 news 表中
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS news_fts USING fts5(
+        title, content,
+        content='news', content_rowid='rowid',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS news_fts_ai AFTER INSERT ON news BEGIN
+        INSERT INTO news_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS news_fts_ad AFTER DELETE ON news BEGIN
+        INSERT INTO news_fts(news_fts, rowid, title, content) VALUES ('delete', old.rowid, old.title, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS news_fts_au AFTER UPDATE OF title, content ON news BEGIN
+        INSERT INTO news_fts(news_fts, rowid, title, content) VALUES ('delete', old.rowid, old.title, old.content);
+        INSERT INTO news_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+    END
+    """
+]
+
+
+def ensure_fts_table(db_path=DB_PATH, rebuild=False):
+    """
+    创建 FTS5 影子表和同步触发器
+
+    参数:
+    - db_path: 数据库路径
+    - rebuild: 是否从 news 表重建全文索引 (首次创建时自动重建；VACUUM 可能改变 rowid，之后也需要重建)
+    """
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='news_fts'")
+    exists = cursor.fetchone() is not None
+
+    # 旧版本的更新触发器对任何列的更新都会重写全文索引（例如写入 cluster_id），替换为只监听 title/content
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type='trigger' AND name='news_fts_au'")
+    row = cursor.fetchone()
+    if row and "UPDATE OF" not in row[0].upper():
+        cursor.execute("DROP TRIGGER news_fts_au")
+
+    for statement in FTS_SCHEMA:
+        cursor.execute(statement)
+
+    if rebuild or not exists:
+        print("📌 正在从 news 表重建 FTS5 全文索引...")
+        start_time = time.time()
+        cursor.execute("INSERT INTO news_fts(news_fts) VALUES ('rebuild')")
+        print(f"✅ FTS5 全文索引重建完成，耗时: {time.time() - start_time:.2f} 秒")
+
+    conn.commit()
+    conn.close()
+
+
+def query_terms(text):
+    """
+    将查询文本拆分为词条，去除停用词，并转义为 FTS5 字符串
+
+    以 * 结尾的词转换为 FTS5 的前缀查询；FTS5 不支持词中间的通配符，el*ion 按前缀 el 和词 ion 处理
+    """
+    words = [word for word in re.findall(r"\w+\*?", text.lower()) if word.rstrip("*") not in STOPWORDS]
+    return ['"' + word.rstrip("*").replace('"', '""') + '"' + (" *" if word.endswith("*") else "") for word in words]
+
+
+def term_positions(title, content):
+    """按倒排索引的分词规则计算文档中每个词干的位置（停用词不占位置）"""
+    positions = {}
+    for pos, token in enumerate(INDEXER.preprocess_text(f"{title} {content}")):
+        positions.setdefault(token, []).append(pos)
+    return positions
+
+
+class FTS5SearchBackend:
+    """
+    基于 SQLite FTS5 的检索后端
+
+    与 search_functions 中基于自定义倒排索引的检索函数提供相同的接口，
+    结果同样是 fetch_news_db 格式的字典列表，并额外带有 FTS5 原生的 bm25() 分数，
+    按相关度排好序返回。只支持 bm25 原生排序，检索函数的 method 参数仅为与其他后端保持接口一致。
+    """
+
+    name = "fts5"
+    native_methods = ("bm25",)
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._ready = False
+
+    @span("fts")
+    def _run(self, match_expression, doc_filter=None, limit=None, verify=None):
+        """
+        执行 MATCH 查询，返回按 bm25 排序的结果
+
+        参数:
+        - match_expression: FTS5 查询表达式
+        - doc_filter: 可选的原始文档ID集合，在 SQL 中与命中结果求交
+        - limit: 只为排名前 limit 的结果回表读取完整新闻，其余结果只有 id 和 score
+          （总数和分面计数仍基于全部命中）；为 None 时全部回表
+        - verify: 可选的 verify(title, content) 校验函数，用于 FTS5 无法精确表达的短语和近邻条件；
+          每个候选都要读取标题和正文并在 Python 中重新分词，耗时计入 verify 阶段
+        """
+        if not self._ready:
+            ensure_fts_table(self.db_path)
+            self._ready = True
+
+        columns = "news.id, bm25(news_fts) AS score" + (", news.title, news.content" if verify else "")
+        sql = (f"SELECT {columns} FROM news_fts JOIN news ON news.rowid = news_fts.rowid "
+               f"WHERE news_fts MATCH ?")
+        params = [match_expression]
+        if doc_filter is not None:
+            sql += " AND news.id IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(list(doc_filter)))
+        sql += " ORDER BY score"
+
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        conn.close()
+        if verify:
+            with span("verify"):
+                rows = [row for row in rows if verify(row[2], row[3])]
+
+        # SQLite 的 bm25() 越小越相关，取负数使其与其他分数方向一致
+        results = [{"id": row[0], "score": -row[1]} for row in rows]
+        head = results if limit is None else results[:limit]
+        if head:
+            hydrated = {row["id"]: row for row in fetch_news_db.fetch_news_from_db([r["id"] for r in head], self.db_path)}
+            for result in head:
+                result.update(hydrated.get(result["id"], {}))
+        return results
+
+    def keyword_search(self, query, doc_filter=None, limit=None, method="bm25"):
+        """关键词搜索：任意关键词命中即可"""
+        terms = query_terms(query)
+        if not terms:
+            return "No valid keywords in the query."
+        return self._run(" OR ".join(terms), doc_filter, limit)
+
+    def phrase_search(self, query, doc_filter=None, limit=None, method="bm25"):
+        """
+        短语搜索，格式如 "apple banana"
+
+        倒排索引在编号位置之前去掉了停用词，而 FTS5 的位置包含停用词，直接用 FTS5 短语查询时
+        "president of the united states" 无法命中。因此先用 FTS5 找出包含全部词的文档，
+        再按倒排索引的位置规则校验短语。
+
+        FTS5 的短语和 NEAR 查询按包含停用词的位置计算，结果与倒排索引不同，不能用来缩小候选，
+        因此这里的耗时主要是在 Python 中校验所有 AND 命中文档（verify 阶段），
+        含常见词的短语会比自定义倒排索引慢，基准测试中对比两种后端时需要注意这一点。
+        """
+        match = re.match(r'"(.+?)"', query.strip())
+        if not match:
+            return "Invalid phrase search format"
+        terms = [term.removesuffix(" *") for term in query_terms(match.group(1))]
+        phrase_terms = preprocess_query(match.group(1))
+        if not terms or not phrase_terms:
+            return []
+
+        def verify(title, content):
+            positions = term_positions(title, content)
+            return is_phrase_match([positions.get(term, []) for term in phrase_terms])
+
+        return self._run(" AND ".join(terms), doc_filter, limit, verify)
+
+    def proximity_search(self, query, doc_filter=None, limit=None, method="bm25"):
+        """
+        近邻搜索，格式如 #3 apple banana
+
+        与短语搜索相同，位置差按去掉停用词后的位置计算：先用 FTS5 找出同时包含两个词的文档，再校验距离。
+        两个词之间的停用词个数没有上限，FTS5 的 NEAR 无法给出等价的预过滤，距离校验同样在 Python 中完成。
+        """
+        match = re.match(r"#(\d+)\s+(\w+)\s+(\w+)", query.strip().lower())
+        if not match:
+            return "Invalid proximity search format"
+        max_distance = int(match.group(1))
+        terms = query_terms(match.group(2) + " " + match.group(3))
+        if len(terms) != 2:
+            return []  # 其中一个词是停用词
+        term1, term2 = STEMMER.stem(match.group(2)), STEMMER.stem(match.group(3))
+
+        def verify(title, content):
+            positions = term_positions(title, content)
+            positions2 = positions.get(term2, [])
+            for pos1 in positions.get(term1, ()):
+                # 位置列表有序，只需检查离 pos1 最近的两个位置
+                i = bisect.bisect_left(positions2, pos1)
+                if any(abs(positions2[j] - pos1) <= max_distance for j in (i - 1, i) if 0 <= j < len(positions2)):
+                    return True
+            return False
+
+        return self._run(f"{terms[0]} AND {terms[1]}", doc_filter, limit, verify)
+
+    def _boolean(self, query, pattern, operator, require_both, doc_filter, limit):
+        match = re.match(pattern, query.strip().lower())
+        if not match:
+            return f"Invalid {operator} query format"
+        terms_a = query_terms(match.group(1))
+        terms_b = query_terms(match.group(2))
+        if not terms_a or (require_both and not terms_b):
+            return []
+        if not terms_b:
+            return self._run(" OR ".join(terms_a), doc_filter, limit)
+        return self._run(f"({' OR '.join(terms_a)}) {operator} ({' OR '.join(terms_b)})", doc_filter, limit)
+
+    def boolean_search_and_not(self, query, doc_filter=None, limit=None, method="bm25"):
+        """布尔搜索（AND NOT）"""
+        return self._boolean(query, r"(.+?)\s+and\s+not\s+(.+)", "NOT", False, doc_filter, limit)
+
+    def boolean_search_and(self, query, doc_filter=None, limit=None, method="bm25"):
+        """布尔搜索（AND）"""
+        return self._boolean(query, r"(.+?)\s+and\s+(.+)", "AND", True, doc_filter, limit)
+
+    def boolean_search_or(self, query, doc_filter=None, limit=None, method="bm25"):
+        """布尔搜索（OR）"""
+        match = re.match(r"(.+?)\s+or\s+(.+)", query.strip().lower())
+        if not match:
+            return "Invalid OR query format"
+        terms = query_terms(match.group(1)) + query_terms(match.group(2))
+        if not terms:
+            return []
+        return self._run(" OR ".join(terms), doc_filter, limit)
+
+
+if __name__ == "__main__":
+    # 创建并重建 FTS5 全文索引
+    ensure_fts_table(rebuild=True)
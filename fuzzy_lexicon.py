@@ -0,0 +1,207 @@
+"""
+拼写容错的词条查找
+
+在索引构建时为倒排索引的词典生成 SymSpell 风格的删除字典：每个词条（只取前 PREFIX_LENGTH 个字符）
+删除最多 MAX_EDIT_DISTANCE 个字符得到的所有字符串，按其 32 位哈希存为两个对齐的有序数组。
+查询时对查询词做同样的删除，二分查找命中的哈希得到候选词条，再计算编辑距离确认，
+不需要遍历整个词典。
+
+关键词搜索中不在索引里的词条会被扩展为编辑距离最近、文档频率最高的几个词条。
+"""
+import bisect
+import os
+import threading
+import time
+import zlib
+from array import array
+from collections import namedtuple
+
+import msgpack
+
+from index_optimizer import IndexOptimizer
+
+MAX_EDIT_DISTANCE = 2
+PREFIX_LENGTH = 7  # 只对词条前缀生成删除，控制字典大小；完整词条的距离在确认候选时计算
+MIN_DOCUMENT_FREQUENCY = 2  # 只出现在一篇文档中的词条多半本身就是拼写错误，不作为纠正目标
+
+# 一次加载得到的完整删除字典，整体发布后不再修改
+FuzzyLexiconData = namedtuple("FuzzyLexiconData",
+                              ["terms", "term_ids", "document_frequencies", "hashes", "hash_term_ids"])
+
+
+def max_distance_for(term):
+    """按词条长度决定允许的编辑距离：很短的词条不做纠正，避免误扩展"""
+    if len(term) <= 3:
+        return 0
+    if len(term) <= 5:
+        return 1
+    return MAX_EDIT_DISTANCE
+
+
+def deletes(word, max_distance):
+    """返回从 word 中删除最多 max_distance 个字符得到的所有字符串（包括 word 本身）"""
+    result = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        result |= frontier
+    return result
+
+
+def _hash(word):
+    return zlib.crc32(word.encode("utf-8"))
+
+
+def edit_distance(a, b, max_distance):
+    """
+    计算两个字符串的编辑距离（插入、删除、替换和相邻字符交换）
+
+    超过 max_distance 时提前返回 max_distance + 1
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class FuzzyLexicon:
+    """
+    基于删除字典的模糊词条查找
+
+    词条和文档频率按下标存储，删除字典由两个对齐数组组成：
+    按哈希排序的删除字符串哈希，以及对应的词条下标。
+
+    所有数组构建完成后作为一个 FuzzyLexiconData 整体发布，查询线程不会看到加载到一半的数据；
+    加载在锁内进行，并发的首批查询只解压一次。
+    """
+
+    def __init__(self, fuzzy_file="fuzzy_lexicon.msgpack", optimized_index_file="optimized_index.msgpack"):
+        self.fuzzy_file = fuzzy_file
+        self.optimized_index_file = optimized_index_file
+
+        self._data = None
+        self._lock = threading.Lock()
+
+    def build(self):
+        """从优化索引的词典构建删除字典"""
+        print("📌 开始构建拼写容错词典...")
+        start_time = time.time()
+
+        optimized_data = IndexOptimizer.decompress_index(self.optimized_index_file) or {"index": {}}
+        index = optimized_data["index"]
+        terms = sorted(term for term, postings in index.items() if len(postings) >= MIN_DOCUMENT_FREQUENCY)
+        document_frequencies = [len(index[term]) for term in terms]
+
+        pairs = sorted(
+            (_hash(deleted), term_id)
+            for term_id, term in enumerate(terms)
+            for deleted in deletes(term[:PREFIX_LENGTH], MAX_EDIT_DISTANCE)
+        )
+        hashes = [h for h, _ in pairs]
+        hash_term_ids = [term_id for _, term_id in pairs]
+
+        with open(self.fuzzy_file, "wb") as f:
+            f.write(zlib.compress(msgpack.packb({
+                "terms": terms,
+                "document_frequencies": document_frequencies,
+                "hashes": array("I", hashes).tobytes(),
+                "term_ids": array("I", hash_term_ids).tobytes()
+            }, use_bin_type=True)))
+
+        self._set_data(terms, document_frequencies, array("I", hashes), array("I", hash_term_ids))
+        print(f"✅ 拼写容错词典构建完成，{len(terms)} 个词条，{len(hashes)} 个删除项，"
+              f"耗时: {time.time() - start_time:.2f} 秒")
+
+    def _set_data(self, terms, document_frequencies, hashes, hash_term_ids):
+        """所有字段准备好之后一次性替换引用"""
+        self._data = FuzzyLexiconData(terms, {term: term_id for term_id, term in enumerate(terms)},
+                                      array("I", document_frequencies), hashes, hash_term_ids)
+        return self._data
+
+    def _read(self):
+        """从文件读取删除字典，文件不存在时构建"""
+        if not os.path.exists(self.fuzzy_file):
+            print(f"⚠️ 拼写容错词典文件不存在，开始构建: {self.fuzzy_file}")
+            self.build()
+            return self._data
+
+        with open(self.fuzzy_file, "rb") as f:
+            data = msgpack.unpackb(zlib.decompress(f.read()), raw=False)
+        hashes = array("I")
+        hashes.frombytes(data["hashes"])
+        hash_term_ids = array("I")
+        hash_term_ids.frombytes(data["term_ids"])
+        return self._set_data(data["terms"], data["document_frequencies"], hashes, hash_term_ids)
+
+    def load(self):
+        """加载删除字典（多个线程同时调用时只加载一次），文件不存在时自动构建"""
+        data = self._data
+        if data is not None:
+            return data
+        with self._lock:
+            return self._data or self._read()
+
+    def reload(self):
+        """重新加载删除字典（与倒排索引一起重新加载），加载完成前查询继续使用旧数据"""
+        with self._lock:
+            return self._read()
+
+    def lookup(self, term, limit=3, max_distance=None):
+        """
+        查找与 term 编辑距离最近的词条
+
+        参数:
+        - term: 查询词（词干）
+        - limit: 最多返回的词条数
+        - max_distance: 允许的最大编辑距离，默认按词条长度决定
+
+        返回:
+        - [(词条, 编辑距离, 文档频率), ...]，按距离升序、文档频率降序排列；term 本身不包括在内
+        """
+        data = self.load()
+        if max_distance is None:
+            max_distance = max_distance_for(term)
+        if max_distance <= 0:
+            return []
+
+        candidate_ids = set()
+        for deleted in deletes(term[:PREFIX_LENGTH], max_distance):
+            h = _hash(deleted)
+            i = bisect.bisect_left(data.hashes, h)
+            while i < len(data.hashes) and data.hashes[i] == h:
+                candidate_ids.add(data.hash_term_ids[i])
+                i += 1
+        candidate_ids.discard(data.term_ids.get(term))
+
+        matches = []
+        for term_id in candidate_ids:
+            candidate = data.terms[term_id]
+            distance = edit_distance(term, candidate, max_distance)
+            if distance <= max_distance:
+                matches.append((candidate, distance, data.document_frequencies[term_id]))
+        matches.sort(key=lambda match: (match[1], -match[2], match[0]))
+        return matches[:limit]
+
+
+# 创建全局实例，用于应用中访问
+fuzzy_lexicon = FuzzyLexicon()
+
+if __name__ == "__main__":
+    # 构建拼写容错词典并测试几个拼写错误
+    lexicon = FuzzyLexicon()
+    lexicon.build()
+    for test_term in ["presdent", "technolgi", "bitcon", "electon"]:
+        start = time.perf_counter()
+        expansions = lexicon.lookup(test_term)
+        print(f"{test_term!r}: {expansions} ({(time.perf_counter() - start) * 1000:.3f} ms)")
@@ -0,0 +1,115 @@
+"""
+按站点调度的爬取队列
+
+- 每个站点单独限制并发数，并在同一站点的相邻请求之间保持最小间隔
+- 各站点轮流出队，少数响应慢的站点不会占满所有 worker
+- 连续多次返回 403/429 或超时的站点会被跳过，其余文章留到下次运行
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque, defaultdict
+from urllib.parse import urlparse
+
+# 每个站点同时进行的请求数
+PER_HOST_CONCURRENCY = 2
+# 同一站点相邻两次请求之间的最小间隔（秒）
+HOST_DELAY = 0.5
+# 连续失败多少次后跳过该站点
+HOST_MAX_FAILURES = 5
+
+
+def host_of(url):
+    """提取 URL 的站点（小写，去掉 www. 前缀）"""
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+class HostScheduler:
+    """
+    在多个 worker 之间分配 (news_id, url)，按站点轮询并限制每个站点的并发
+
+    参数:
+    - items: (news_id, url) 列表，同一站点内保持原有顺序
+    - per_host: 每个站点的最大并发请求数
+    - delay: 同一站点相邻请求的最小间隔（秒）
+    - max_failures: 连续失败多少次后跳过该站点
+    """
+
+    def __init__(self, items, per_host=PER_HOST_CONCURRENCY, delay=HOST_DELAY, max_failures=HOST_MAX_FAILURES):
+        self.per_host = per_host
+        self.delay = delay
+        self.max_failures = max_failures
+
+        self.pending = OrderedDict()
+        for news_id, url in items:
+            self.pending.setdefault(host_of(url), deque()).append((news_id, url))
+        self.hosts = deque(self.pending)  # 仍有待抓取文章的站点，按轮询顺序排列
+
+        self.active = defaultdict(int)  # 每个站点正在进行的请求数
+        self.ready_at = defaultdict(float)  # 每个站点下一次允许发起请求的时间
+        self.failures = defaultdict(int)  # 每个站点的连续失败次数
+        self.skipped_hosts = set()
+        self.skipped_ids = []  # 因站点被跳过而未抓取的新闻 ID
+        self._cond = asyncio.Condition()
+
+    def _take(self, host, now):
+        queue = self.pending[host]
+        item = queue.popleft()
+        if not queue:
+            self.hosts.remove(host)
+        self.active[host] += 1
+        self.ready_at[host] = now + self.delay
+        return host, item
+
+    async def acquire(self):
+        """
+        取出下一篇可以抓取的文章，必要时等待站点空出名额或到达请求间隔
+
+        返回:
+        - (host, (news_id, url))；所有站点都已没有待抓取文章时返回 None
+        """
+        async with self._cond:
+            while self.hosts:
+                now = time.monotonic()
+                earliest = None
+                for _ in range(len(self.hosts)):
+                    host = self.hosts[0]
+                    self.hosts.rotate(-1)
+                    if self.active[host] >= self.per_host:
+                        continue
+                    if self.ready_at[host] <= now:
+                        return self._take(host, now)
+                    earliest = self.ready_at[host] if earliest is None else min(earliest, self.ready_at[host])
+
+                try:
+                    timeout = None if earliest is None else earliest - now
+                    await asyncio.wait_for(self._cond.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return None
+
+    async def release(self, host, failed):
+        """
+        归还站点名额，并记录本次请求是否被拒绝或超时
+
+        返回:
+        - 因站点被跳过而丢弃的文章数
+        """
+        dropped = 0
+        async with self._cond:
+            self.active[host] -= 1
+            if not failed:
+                self.failures[host] = 0
+            else:
+                self.failures[host] += 1
+                if self.failures[host] >= self.max_failures and host not in self.skipped_hosts:
+                    self.skipped_hosts.add(host)
+                    queue = self.pending.get(host)
+                    if queue:
+                        dropped = len(queue)
+                        self.skipped_ids.extend(news_id for news_id, _ in queue)
+                        queue.clear()
+                        self.hosts.remove(host)
+                    print(f"⏭️ 站点 {host} 连续 {self.failures[host]} 次拒绝或超时，跳过其余 {dropped} 篇文章")
+            self._cond.notify_all()
+        return dropped
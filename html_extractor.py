@@ -0,0 +1,118 @@
+"""
+新闻正文提取
+
+基于 lxml 从 HTML 中提取正文段落，并在进程池中运行，使 CPU 密集的解析不阻塞爬虫的事件循环。
+"""
+import asyncio
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import lxml.html
+from lxml.etree import ParserError
+
+# 解析进程数
+EXTRACTOR_PROCESSES = os.cpu_count() or 2
+
+# 没有 <article> 时依次尝试的正文容器 class
+CONTENT_DIV_CLASSES = ["article-content", "entry-content", "post-content", "news-content"]
+
+# 文档开头的 XML 声明：lxml 不接受带编码声明的 str，会抛出 ValueError
+XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>")
+
+_pool = None
+
+
+class ExtractionError(Exception):
+    """正文提取出错（解析异常或解析进程池崩溃），与页面本身无关，调用方应稍后重试而不是放弃该新闻"""
+
+
+def _paragraph_text(paragraphs):
+    full_text = "\n".join(p.text_content() for p in paragraphs).strip()
+    return full_text if full_text else None
+
+
+def _parse(html):
+    if isinstance(html, str):
+        html = XML_DECLARATION.sub("", html, count=1)
+    try:
+        return lxml.html.document_fromstring(html)
+    except ParserError:
+        return None  # 空文档
+
+
+def extract_article_text(html):
+    """
+    提取新闻正文：优先 <article>，其次常见的正文 div，最后 <main> 中的段落
+
+    返回:
+    - 正文文本，找不到正文容器时返回 None
+    """
+    root = _parse(html)
+    if root is None:
+        return None
+
+    article = root.find(".//article")
+    if article is not None:
+        return _paragraph_text(article.iter("p"))
+
+    for div_class in CONTENT_DIV_CLASSES:
+        divs = root.xpath(f"//div[contains(concat(' ', normalize-space(@class), ' '), ' {div_class} ')]")
+        if divs:
+            return _paragraph_text(divs[0].iter("p"))
+
+    main = root.find(".//main")
+    if main is not None:
+        return _paragraph_text(main.iter("p"))
+    return None
+
+
+def extract_all_paragraphs(html):
+    """提取页面中所有 <p> 的文本"""
+    root = _parse(html)
+    if root is None:
+        return None
+    return _paragraph_text(root.iter("p"))
+
+
+def get_extractor_pool():
+    """获取（必要时创建）解析进程池"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=EXTRACTOR_PROCESSES)
+    return _pool
+
+
+def shutdown_extractor_pool():
+    """关闭解析进程池"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+def _discard_pool(pool):
+    """丢弃已经崩溃的进程池，下一次提取时重新创建"""
+    global _pool
+    if _pool is pool:
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def extract_in_pool(html, all_paragraphs=False):
+    """
+    在进程池中提取正文，不阻塞事件循环
+
+    解析出错或进程池崩溃（例如解析进程被 OOM 杀掉）时抛出 ExtractionError；
+    崩溃的进程池会被丢弃，之后的提取使用新的进程池。
+    """
+    extractor = extract_all_paragraphs if all_paragraphs else extract_article_text
+    pool = get_extractor_pool()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, extractor, html)
+    except BrokenProcessPool as e:
+        _discard_pool(pool)
+        raise ExtractionError(f"解析进程池已崩溃: {e}") from e
+    except Exception as e:
+        raise ExtractionError(f"{type(e).__name__}: {e}") from e
@@ -156,11 +156,63 @@ class Indexer:
                 }
         return index_data
 
-    def save_index(self, index_data):
+    def save_index(self, index_data, index_file="inverted_index.json"):
         """存储索引到 JSON 文件"""
-        with open("inverted_index.json", "w", encoding="utf-8") as f:
+        with open(index_file, "w", encoding="utf-8") as f:
             json.dump(index_data, f, indent=4)
-        print("✅ 倒排索引已保存至 inverted_index.json")
+        print(f"✅ 倒排索引已保存至 {index_file}")
+
+    def reindex_documents(self, doc_ids, index_file="inverted_index.json"):
+        """
+        增量更新已有的倒排索引：移除这些文档的旧倒排记录，再按数据库中的当前正文重新加入
+
+        已不在数据库中的文档只会被移除。
+
+        返回:
+        - 重新加入的文档的词条位置 {文档ID: {词条: [位置, ...]}}，供优化索引和派生索引增量更新；
+          不在其中的文档已被移除
+        """
+        doc_ids = set(doc_ids)
+        if not doc_ids:
+            return {}
+
+        with open(index_file, "r", encoding="utf-8") as f:
+            index_data = json.load(f)
+
+        # 移除旧的倒排记录
+        for term in list(index_data):
+            postings = index_data[term]
+            if len(postings) < len(doc_ids):
+                stale = [doc_id for doc_id in postings if doc_id in doc_ids]
+            else:
+                stale = [doc_id for doc_id in doc_ids if doc_id in postings]
+            for doc_id in stale:
+                del postings[doc_id]
+            if not postings:
+                del index_data[term]
+
+        # 读取当前正文并重新分词
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+        documents = []
+        id_list = list(doc_ids)
+        for start in range(0, len(id_list), 500):
+            chunk = id_list[start:start + 500]
+            cursor.execute(f"SELECT id, title, content FROM news WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+            documents.extend(cursor.fetchall())
+        conn.close()
+
+        document_positions = {}
+        for doc_id, title, content in documents:
+            positions = defaultdict(list)
+            for pos, token in enumerate(self.preprocess_text(f"{title} {content}")):
+                positions[token].append(pos)
+            for token, token_positions in positions.items():
+                index_data.setdefault(token, {})[doc_id] = {"positions": token_positions}
+            document_positions[doc_id] = dict(positions)
+
+        self.save_index(index_data, index_file)
+        return document_positions
 
     def build_and_store_index(self):
         """构建索引并存储"""
@@ -5,12 +5,16 @@ import zlib
 
 import msgpack
 
+from config import DB_PATH, IMPACT_ORDERED_POSTINGS
+from static_rank import compute_static_rank
+
 
 class IndexOptimizer:
     """用于优化倒排索引的工具类，减少内存占用并提高访问速度"""
 
     @staticmethod
-    def compress_index(input_file="inverted_index.json", output_file="optimized_index.msgpack"):
+    def compress_index(input_file="inverted_index.json", output_file="optimized_index.msgpack", db_path=DB_PATH,
+                       impact_ordered=IMPACT_ORDERED_POSTINGS):
         """
         将原始JSON索引转换为优化的压缩格式
 
@@ -19,6 +23,7 @@ class IndexOptimizer:
         2. 使用差分编码存储位置信息
         3. 使用zlib压缩整体数据
         4. 对文档ID使用整数编码
+        5. 为每篇文档计算静态排名；impact_ordered 为 True 时倒排记录按静态排名降序存储
         """
         print(f"📊 开始优化索引文件: {input_file}")
         start_time = time.time()
@@ -65,10 +70,18 @@ class IndexOptimizer:
 
             optimized_index[term] = term_data
 
+        # 计算静态排名（按整数文档ID下标存储）
+        static_rank = compute_static_rank(doc_id_map, db_path)
+        if impact_ordered:
+            for term, term_data in optimized_index.items():
+                optimized_index[term] = dict(sorted(term_data.items(), key=lambda item: -static_rank[item[0]]))
+
         # 创建完整优化索引数据
         optimized_data = {
             "doc_id_map": doc_id_map,
-            "index": optimized_index
+            "index": optimized_index,
+            "static_rank": static_rank,
+            "impact_ordered": impact_ordered
         }
 
         # 使用msgpack序列化并压缩
@@ -96,6 +109,94 @@ class IndexOptimizer:
             "processing_time_sec": end_time - start_time
         }
 
+    @staticmethod
+    def update_documents(document_positions, removed_doc_ids, output_file="optimized_index.msgpack", db_path=DB_PATH):
+        """
+        增量更新优化索引：替换变化文档的倒排记录，不重新读取和编码整个 JSON 索引
+
+        已有文档保留原来的整数ID，新文档的整数ID接在最后，因此分片和时间分段只需重建包含这些文档的部分。
+        被删除的文档只去掉倒排记录，整数ID保留到下一次完整优化时回收。
+
+        参数:
+        - document_positions: 重新分词的文档 {文档ID: {词条: [位置, ...]}}，见 Indexer.reindex_documents
+        - removed_doc_ids: 已从数据库中删除的文档ID
+        - output_file: 优化索引文件，原地更新
+        - db_path: 数据库路径，用于重新计算静态排名
+
+        返回:
+        - 统计字典，其中 optimized_data 为更新后的完整优化索引，changed_int_ids 为受影响的整数文档ID，
+          terms_changed 表示词条集合或某个词条的文档频率是否变化（词典类索引只在此时需要重建）；
+          优化索引不存在时返回 None
+        """
+        optimized_data = IndexOptimizer.decompress_index(output_file)
+        if not optimized_data:
+            return None
+
+        print(f"📊 开始增量更新优化索引: {len(document_positions)} 篇重新索引，{len(removed_doc_ids)} 篇移除")
+        start_time = time.time()
+
+        doc_id_map = optimized_data["doc_id_map"]
+        index = optimized_data["index"]
+        changed_int_ids = {doc_id_map[doc_id] for doc_id in [*document_positions, *removed_doc_ids]
+                           if doc_id in doc_id_map}
+
+        # 移除旧的倒排记录，记下受影响词条原来的文档频率
+        old_df = {}
+        for term in list(index):
+            postings = index[term]
+            stale = [int_doc_id for int_doc_id in changed_int_ids if int_doc_id in postings]
+            if not stale:
+                continue
+            old_df[term] = len(postings)
+            for int_doc_id in stale:
+                del postings[int_doc_id]
+            if not postings:
+                del index[term]
+
+        # 加入新的倒排记录，新文档分配新的整数ID
+        for doc_id, positions in document_positions.items():
+            if doc_id not in doc_id_map:
+                doc_id_map[doc_id] = len(doc_id_map)
+                changed_int_ids.add(doc_id_map[doc_id])
+            int_doc_id = doc_id_map[doc_id]
+            for term, term_positions in positions.items():
+                if term not in index:
+                    old_df.setdefault(term, 0)
+                elif term not in old_df:
+                    old_df[term] = len(index[term])
+                diff_positions = []
+                prev_pos = 0
+                for pos in sorted(term_positions):
+                    diff_positions.append(pos - prev_pos)
+                    prev_pos = pos
+                index.setdefault(term, {})[int_doc_id] = diff_positions
+        terms_changed = any(len(index.get(term, ())) != df for term, df in old_df.items())
+
+        # 静态排名依赖全库的最新日期和来源分布，整体重新计算（只读数据库元数据，不涉及倒排记录）
+        old_static_rank = optimized_data.get("static_rank") or []
+        static_rank = compute_static_rank(doc_id_map, db_path)
+        optimized_data["static_rank"] = static_rank
+        if optimized_data.get("impact_ordered"):
+            # 其他文档的静态排名不变时，只有受影响的词条需要重新排序
+            unchanged = len(old_static_rank) <= len(static_rank) and all(
+                old == static_rank[int_doc_id] for int_doc_id, old in enumerate(old_static_rank)
+                if int_doc_id not in changed_int_ids)
+            for term in (old_df if unchanged else list(index)):
+                if term in index:
+                    index[term] = dict(sorted(index[term].items(), key=lambda item: -static_rank[item[0]]))
+
+        with open(output_file, "wb") as f:
+            f.write(zlib.compress(msgpack.packb(optimized_data, use_bin_type=True), level=9))
+
+        print(f"✅ 优化索引增量更新完成，{len(old_df)} 个词条受影响，耗时: {time.time() - start_time:.2f} 秒")
+        return {
+            "optimized_data": optimized_data,
+            "changed_int_ids": changed_int_ids,
+            "affected_terms": len(old_df),
+            "terms_changed": terms_changed,
+            "processing_time_sec": time.time() - start_time
+        }
+
     @staticmethod
     def decompress_index(file_path="optimized_index.msgpack"):
         """从优化格式加载索引并解压"""
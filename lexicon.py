@@ -0,0 +1,221 @@
+"""
+有序词典与通配符查询
+
+在索引构建时把倒排索引的词典按字典序排列，同时为每个词条生成 3-gram（首尾加 $ 边界），
+存为 k-gram -> 词条下标 的倒排表：
+
+- 前缀查询 (crypt*) 在有序词典上二分查找出区间
+- 一般通配符 (el*ion、*coin) 先对模式中固定部分的 k-gram 求交得到候选，再用正则确认
+- 每个模式最多扩展为 WILDCARD_MAX_EXPANSIONS 个词条（文档频率最高的），查询耗时可预期
+
+通配符匹配的是索引中的词干，不对模式本身做词干提取。
+"""
+import bisect
+import heapq
+import os
+import re
+import threading
+import time
+import zlib
+from array import array
+from collections import namedtuple
+
+import msgpack
+
+from index_optimizer import IndexOptimizer
+
+KGRAM_SIZE = 3
+WILDCARD_MAX_EXPANSIONS = 50
+# 没有可用 k-gram、只能在前缀区间内逐个匹配时最多检查的词条数
+MAX_SCAN = 20000
+
+WILDCARD_PATTERN = re.compile(r"[\w*]*\*[\w*]*")
+
+# 一次加载得到的完整有序词典，整体发布后不再修改
+LexiconData = namedtuple("LexiconData", ["terms", "document_frequencies", "kgram_index"])
+
+
+def kgrams(text, k=KGRAM_SIZE):
+    """返回文本的所有 k-gram"""
+    return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+
+def pattern_kgrams(pattern):
+    """返回通配符模式中固定部分（加上首尾 $ 边界）的 k-gram"""
+    grams = set()
+    for part in f"${pattern}$".split("*"):
+        grams |= kgrams(part)
+    return grams
+
+
+def extract_wildcards(query):
+    """
+    从查询文本中分离出通配符模式
+
+    返回:
+    - (去掉通配符模式后的查询文本, 小写的通配符模式列表)；只由 * 组成的不算通配符模式，保留在查询文本中
+    """
+    patterns = []
+
+    def take(match):
+        if not match.group().strip("*"):
+            return match.group()
+        patterns.append(match.group().lower())
+        return " "
+
+    return WILDCARD_PATTERN.sub(take, query), patterns
+
+
+class SortedLexicon:
+    """
+    支持前缀和通配符查找的有序词典
+
+    词条按字典序存储，文档频率按下标存储，k-gram 倒排表中的词条下标以有序数组存储。
+    三者作为一个 LexiconData 整体发布，加载在锁内进行，并发查询只解压一次。
+    """
+
+    def __init__(self, lexicon_file="lexicon.msgpack", optimized_index_file="optimized_index.msgpack"):
+        self.lexicon_file = lexicon_file
+        self.optimized_index_file = optimized_index_file
+
+        self._data = None
+        self._lock = threading.Lock()
+
+    def build(self):
+        """从优化索引的词典构建有序词典和 k-gram 倒排表"""
+        print("📌 开始构建有序词典和 k-gram 索引...")
+        start_time = time.time()
+
+        optimized_data = IndexOptimizer.decompress_index(self.optimized_index_file) or {"index": {}}
+        index = optimized_data["index"]
+        terms = sorted(index)
+        document_frequencies = [len(index[term]) for term in terms]
+
+        kgram_ids = {}
+        for term_id, term in enumerate(terms):
+            for gram in kgrams(f"${term}$"):
+                kgram_ids.setdefault(gram, []).append(term_id)
+
+        kgram_data = {gram: array("I", ids).tobytes() for gram, ids in kgram_ids.items()}
+        with open(self.lexicon_file, "wb") as f:
+            f.write(zlib.compress(msgpack.packb({
+                "terms": terms,
+                "document_frequencies": document_frequencies,
+                "kgrams": kgram_data
+            }, use_bin_type=True)))
+
+        self._set_data(terms, document_frequencies, kgram_data)
+        print(f"✅ 有序词典构建完成，{len(terms)} 个词条，{len(kgram_data)} 个 k-gram，"
+              f"耗时: {time.time() - start_time:.2f} 秒")
+
+    def _set_data(self, terms, document_frequencies, kgram_data):
+        """所有字段准备好之后一次性替换引用"""
+        # k-gram -> 词条下标数组的字节串，查询时才解码
+        self._data = LexiconData(terms, array("I", document_frequencies), kgram_data)
+        return self._data
+
+    @staticmethod
+    def _kgram_ids(data, gram):
+        ids = array("I")
+        ids.frombytes(data.kgram_index.get(gram, b""))
+        return ids
+
+    def _read(self):
+        """从文件读取有序词典，文件不存在时构建"""
+        if not os.path.exists(self.lexicon_file):
+            print(f"⚠️ 有序词典文件不存在，开始构建: {self.lexicon_file}")
+            self.build()
+            return self._data
+
+        with open(self.lexicon_file, "rb") as f:
+            data = msgpack.unpackb(zlib.decompress(f.read()), raw=False)
+        return self._set_data(data["terms"], data["document_frequencies"], data["kgrams"])
+
+    def load(self):
+        """加载有序词典（多个线程同时调用时只加载一次），文件不存在时自动构建"""
+        data = self._data
+        if data is not None:
+            return data
+        with self._lock:
+            return self._data or self._read()
+
+    def reload(self):
+        """重新加载词典（与倒排索引一起重新加载），加载完成前查询继续使用旧词典"""
+        with self._lock:
+            return self._read()
+
+    @staticmethod
+    def _prefix_range(data, prefix):
+        lo = bisect.bisect_left(data.terms, prefix)
+        hi = bisect.bisect_left(data.terms, prefix + "\uffff", lo)
+        return lo, hi
+
+    def prefix_range(self, prefix):
+        """返回以 prefix 开头的词条在有序词典中的下标区间 [lo, hi)"""
+        return self._prefix_range(self.load(), prefix)
+
+    def document_frequency(self, term):
+        """返回词条的文档频率，不在词典中时为 0"""
+        data = self.load()
+        lo, hi = self._prefix_range(data, term)
+        if lo < hi and data.terms[lo] == term:
+            return data.document_frequencies[lo]
+        return 0
+
+    @staticmethod
+    def _top(data, term_ids, limit):
+        """取文档频率最高的 limit 个词条，按词条排序返回"""
+        top = heapq.nlargest(limit, term_ids, key=data.document_frequencies.__getitem__)
+        return [data.terms[term_id] for term_id in sorted(top)]
+
+    def expand(self, pattern, limit=WILDCARD_MAX_EXPANSIONS):
+        """
+        将通配符模式扩展为匹配的词条
+
+        参数:
+        - pattern: 含 * 的小写模式，例如 crypt*、el*ion、*coin
+        - limit: 最多返回的词条数，匹配更多时保留文档频率最高的
+
+        返回:
+        - 匹配的词条列表
+        """
+        data = self.load()
+        prefix, _, rest = pattern.partition("*")
+
+        # 纯前缀查询：有序词典上的一个区间
+        if not rest.strip("*"):
+            lo, hi = self._prefix_range(data, prefix)
+            return self._top(data, range(lo, hi), limit)
+
+        matcher = re.compile(".*".join(re.escape(part) for part in pattern.split("*")))
+        grams = pattern_kgrams(pattern)
+        if grams:
+            # 从最短的 k-gram 倒排表开始求交
+            posting_lists = sorted((self._kgram_ids(data, gram) for gram in grams), key=len)
+            candidates = set(posting_lists[0])
+            for ids in posting_lists[1:]:
+                if not candidates:
+                    break
+                candidates.intersection_update(ids)
+        elif prefix:
+            # 固定部分太短、没有 k-gram 时只在前缀区间内逐个匹配
+            lo, hi = self._prefix_range(data, prefix)
+            candidates = range(lo, min(hi, lo + MAX_SCAN))
+        else:
+            return []  # 例如 *a*，无法在有限代价内回答
+
+        matched = [term_id for term_id in candidates if matcher.fullmatch(data.terms[term_id])]
+        return self._top(data, matched, limit)
+
+
+# 创建全局实例，用于应用中访问
+sorted_lexicon = SortedLexicon()
+
+if __name__ == "__main__":
+    # 构建有序词典并测试几个通配符模式
+    lexicon = SortedLexicon()
+    lexicon.build()
+    for test_pattern in ["crypt*", "elect*", "*coin", "pr*nt"]:
+        start = time.perf_counter()
+        expansions = lexicon.expand(test_pattern)
+        print(f"{test_pattern!r}: {expansions[:10]} ({(time.perf_counter() - start) * 1000:.3f} ms)")
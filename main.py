@@ -4,13 +4,18 @@
 使用说明:
     - 运行 python main.py --help 查看所有选项
     - 运行 python main.py run 启动搜索服务
+    - 运行 python main.py run --asgi 以 ASGI 模式启动搜索服务 (需要 uvicorn)
+    - 运行 python main.py serve --workers 4 以预 fork 模式启动生产服务
     - 运行 python main.py optimize 优化索引
     - 运行 python main.py normalize 规范化索引大小写
     - 运行 python main.py reset 重置Redis索引缓存
+    - 运行 python main.py segments 构建按发布时间分段的索引
+    - 运行 python main.py reindex 只为正文有变化的新闻增量更新倒排索引
+    - 运行 python main.py dedup 检测近重复新闻并统计耗时
+    - 运行 python main.py bench --synthetic 在合成语料上运行检索基准测试
 """
-import download_data  # 确保数据库和索引文件已下载
-
 import argparse
+import json
 import os
 import sys
 import subprocess
@@ -19,15 +24,28 @@ import time
 from index_optimizer import IndexOptimizer
 from redis_index_manager import RedisIndexManager
 from search_utils_fix import normalize_index_case
+from segment_index import TimeSegmentIndex
+from facet_index import FacetIndex
+from packed_index import build_packed_index
+from suggestion_index import SuggestionIndex
+from fuzzy_lexicon import FuzzyLexicon
+from lexicon import SortedLexicon
+from sharded_index import build_shards, update_shards
 
 
-def run_server():
+def run_server(asgi=False):
     """启动搜索服务器"""
     print("🚀 启动搜索服务器...")
 
+    if asgi:
+        command = [sys.executable, "-m", "uvicorn", "asgi:asgi_app", "--port", "5001"]
+        print("⚙️ 使用 ASGI 模式 (uvicorn asgi:asgi_app)")
+    else:
+        command = [sys.executable, "app.py"]
+
     # 使用子进程启动Flask应用
     try:
-        subprocess.run([sys.executable, "app.py"], check=True)
+        subprocess.run(command, check=True)
     except KeyboardInterrupt:
         print("\n👋 搜索服务已停止")
     except subprocess.CalledProcessError as e:
@@ -35,6 +53,18 @@ def run_server():
         sys.exit(1)
 
 
+def serve(workers, bind):
+    """以预 fork 模式启动生产服务器，索引在主进程中加载一次后由所有 worker 共享"""
+    print(f"🚀 启动预 fork 搜索服务器 ({workers} 个 worker，监听 {bind})...")
+
+    from prefork_server import serve as serve_prefork
+
+    try:
+        serve_prefork(workers=workers, bind=bind)
+    except KeyboardInterrupt:
+        print("\n👋 搜索服务已停止")
+
+
 def optimize_index():
     """优化索引"""
     print("🔧 开始优化索引...")
@@ -50,6 +80,15 @@ def optimize_index():
         print(f"压缩比: {results['compression_ratio']:.2f}x")
         print(f"处理耗时: {results['processing_time_sec']:.2f} 秒")
 
+        # 索引构建完成后生成可 mmap 的打包索引、来源/时间分面位图、搜索建议索引、拼写容错词典、有序词典、索引分片和时间分段
+        build_packed_index()
+        FacetIndex().build()
+        SuggestionIndex().build()
+        FuzzyLexicon().build()
+        SortedLexicon().build()
+        build_shards()
+        TimeSegmentIndex().build()
+
         print("\n✅ 索引优化完成！")
     except Exception as e:
         print(f"❌ 索引优化失败: {str(e)}")
@@ -106,6 +145,122 @@ def reset_redis():
         sys.exit(1)
 
 
+def build_segments(granularity=None):
+    """构建按发布时间分段的索引"""
+    print("🗂️ 开始构建时间分段索引...")
+
+    try:
+        manifest = TimeSegmentIndex(granularity=granularity).build()
+
+        print("\n📊 分段结果摘要:")
+        for entry in manifest:
+            print(f"{entry['key']}: {entry['doc_count']} 篇文档 ({entry['min_date']} ~ {entry['max_date']})")
+
+        print("\n✅ 时间分段索引构建完成！")
+    except Exception as e:
+        print(f"❌ 构建时间分段索引失败: {str(e)}")
+        sys.exit(1)
+
+
+def reindex_changed():
+    """为重新抓取后正文有变化（或已被删除）的新闻增量更新倒排索引，以及受这些新闻影响的派生索引"""
+    print("🔁 开始增量更新倒排索引...")
+
+    try:
+        from database import changed_doc_ids, mark_indexed
+        from index import Indexer
+
+        doc_ids = changed_doc_ids()
+        if not doc_ids:
+            print("✅ 没有正文变化的新闻，无需更新索引")
+            return
+
+        document_positions = Indexer().reindex_documents(doc_ids)
+        removed_doc_ids = set(doc_ids) - set(document_positions)
+        mark_indexed(doc_ids)
+
+        print("\n📊 增量索引结果摘要:")
+        print(f"重新索引: {len(document_positions)} 篇新闻")
+        print(f"从索引中移除: {len(removed_doc_ids)} 篇新闻")
+        print("\n✅ 增量索引完成！")
+    except Exception as e:
+        print(f"❌ 增量更新索引失败: {str(e)}")
+        sys.exit(1)
+
+    try:
+        results = IndexOptimizer.update_documents(document_positions, removed_doc_ids)
+        if results is None:
+            # 还没有优化索引，只能完整生成
+            optimize_index()
+        else:
+            # 打包索引是一个整体映射的文件，来源/年份位图和搜索建议只读取数据库元数据和标题，整体重建；
+            # 分片和时间分段只重写包含变化文档的部分；词典类索引只在词条集合或文档频率变化时重建
+            optimized_data = results["optimized_data"]
+            build_packed_index()
+            FacetIndex().build()
+            SuggestionIndex().build()
+            if results["terms_changed"]:
+                FuzzyLexicon().build()
+                SortedLexicon().build()
+            update_shards(results["changed_int_ids"], optimized_data)
+            TimeSegmentIndex().update(doc_ids, optimized_data)
+            print("\n✅ 派生索引增量更新完成！")
+    except Exception as e:
+        print(f"❌ 派生索引更新失败: {str(e)}")
+        sys.exit(1)
+    print("⚠️ 请注意，要使修改生效，您需要重置Redis缓存: python main.py reset")
+
+
+def detect_near_duplicates(rebuild=False):
+    """对语料运行近重复检测，并输出耗时统计"""
+    print("🔍 开始检测近重复新闻...")
+
+    try:
+        from near_duplicates import benchmark_corpus
+
+        results = benchmark_corpus(rebuild=rebuild)
+
+        print("\n📊 近重复检测结果摘要:")
+        print(f"处理新闻数: {results['processed']}")
+        print(f"近重复新闻数: {results['duplicates']}")
+        print(f"含近重复的簇: {results['clusters_with_duplicates']}，最大簇: {results['largest_cluster']} 篇")
+        print(f"处理耗时: {results['elapsed_sec']:.2f} 秒 (每篇 {results['per_article_ms']:.2f} ms)")
+        print("\n✅ 近重复检测完成！")
+    except Exception as e:
+        print(f"❌ 近重复检测失败: {str(e)}")
+        sys.exit(1)
+
+
+def run_benchmark(args):
+    """回放查询日志，统计检索延迟"""
+    import benchmark
+
+    try:
+        if args.synthetic:
+            corpus = benchmark.generate_corpus(args.corpus_dir, args.docs, num_queries=args.queries)
+            benchmark.use_corpus(corpus["db"], corpus["optimized"], corpus["packed"])
+            log_path = args.log or corpus["log"]
+        else:
+            if not args.log:
+                print("❌ 请通过 --log 指定查询日志，或使用 --synthetic 生成合成语料")
+                sys.exit(1)
+            benchmark.use_corpus("news.db", "optimized_index.msgpack", "packed_index.bin")
+            log_path = args.log
+
+        entries = benchmark.load_query_log(log_path) * args.repeat
+        print(f"⏱️ 回放 {len(entries)} 个查询 (并发 {args.concurrency})...")
+        report = benchmark.replay(entries, args.concurrency, args.method, args.backend)
+        benchmark.print_report(report)
+
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            print(f"\n📄 报告已保存到: {args.output}")
+    except Exception as e:
+        print(f"❌ 基准测试失败: {str(e)}")
+        sys.exit(1)
+
+
 def setup_argparse():
     """设置命令行参数解析"""
     parser = argparse.ArgumentParser(description="新闻搜索引擎管理工具")
@@ -113,6 +268,12 @@ def setup_argparse():
 
     # 运行服务器
     run_parser = subparsers.add_parser("run", help="启动搜索服务器")
+    run_parser.add_argument("--asgi", action="store_true", help="以 ASGI 模式运行 (需要安装 uvicorn)")
+
+    # 预 fork 生产服务器
+    serve_parser = subparsers.add_parser("serve", help="以预 fork 模式启动生产服务器")
+    serve_parser.add_argument("--workers", type=int, default=4, help="worker 进程数 (默认: 4)")
+    serve_parser.add_argument("--bind", default="127.0.0.1:5001", help="监听地址 (默认: 127.0.0.1:5001)")
 
     # 优化索引
     optimize_parser = subparsers.add_parser("optimize", help="优化索引")
@@ -123,6 +284,31 @@ def setup_argparse():
     # 重置Redis
     reset_parser = subparsers.add_parser("reset", help="重置Redis索引缓存")
 
+    # 构建时间分段索引
+    segments_parser = subparsers.add_parser("segments", help="构建按发布时间分段的索引")
+    segments_parser.add_argument("--granularity", choices=["year", "month"],
+                                 help="分段粒度 (默认沿用已有的分段，否则为 year)")
+
+    # 增量索引
+    reindex_parser = subparsers.add_parser("reindex", help="为正文有变化的新闻增量更新倒排索引")
+
+    # 近重复检测
+    dedup_parser = subparsers.add_parser("dedup", help="检测近重复新闻并统计耗时")
+    dedup_parser.add_argument("--rebuild", action="store_true", help="清空已有结果后对整个语料重新检测")
+
+    # 基准测试
+    bench_parser = subparsers.add_parser("bench", help="回放查询日志，统计检索延迟")
+    bench_parser.add_argument("--log", help="JSONL 查询日志路径")
+    bench_parser.add_argument("-c", "--concurrency", type=int, default=1, help="并发线程数 (默认: 1)")
+    bench_parser.add_argument("--repeat", type=int, default=1, help="查询日志重复回放次数 (默认: 1)")
+    bench_parser.add_argument("--method", choices=["tfidf", "bm25"], help="覆盖日志中的排序方法")
+    bench_parser.add_argument("--backend", choices=["index", "fts5", "sharded"], help="检索后端 (默认使用配置)")
+    bench_parser.add_argument("--synthetic", action="store_true", help="生成并使用合成语料")
+    bench_parser.add_argument("--corpus-dir", default="bench_corpus", help="合成语料目录 (默认: bench_corpus)")
+    bench_parser.add_argument("--docs", type=int, default=5000, help="合成语料文档数 (默认: 5000)")
+    bench_parser.add_argument("--queries", type=int, default=500, help="合成查询日志的查询数 (默认: 500)")
+    bench_parser.add_argument("--output", help="将报告保存为 JSON 文件")
+
     return parser
 
 
@@ -131,14 +317,28 @@ def main():
     parser = setup_argparse()
     args = parser.parse_args()
 
+    # 确保数据库和索引文件已下载（合成语料基准测试不需要）
+    if not (args.command == "bench" and args.synthetic):
+        import download_data
+
     if args.command == "run":
-        run_server()
+        run_server(args.asgi)
+    elif args.command == "serve":
+        serve(args.workers, args.bind)
     elif args.command == "optimize":
         optimize_index()
     elif args.command == "normalize":
         normalize_index()
     elif args.command == "reset":
         reset_redis()
+    elif args.command == "segments":
+        build_segments(args.granularity)
+    elif args.command == "reindex":
+        reindex_changed()
+    elif args.command == "dedup":
+        detect_near_duplicates(args.rebuild)
+    elif args.command == "bench":
+        run_benchmark(args)
     else:
         parser.print_help()
         sys.exit(1)
@@ -0,0 +1,149 @@
+import bisect
+import threading
+from collections import defaultdict
+
+# 查询耗时直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape_label_value(value):
+    """按 Prometheus 文本格式转义标签值中的反斜杠、双引号和换行"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """按标签分组的计数器"""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = defaultdict(float)
+
+    def inc(self, labels=(), amount=1):
+        self._values[labels] += amount
+
+    def set(self, value, labels=()):
+        """用外部维护的累计值（例如熔断器的失败总数）更新计数器"""
+        self._values[labels] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """按标签分组的累积直方图"""
+
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._counts = {}
+        self._sums = defaultdict(float)
+
+    def observe(self, value, labels=()):
+        counts = self._counts.get(labels)
+        if counts is None:
+            counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[labels] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        label_names = self.label_names + ("le",)
+        for labels, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(label_names, labels + (f'{bound:g}',))} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{self.name}_bucket{_format_labels(label_names, labels + ('+Inf',))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {self._sums[labels]:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """按标签分组的当前值"""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+
+    def set(self, value, labels=()):
+        self._values[labels] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value:g}")
+        return lines
+
+
+class SearchMetrics:
+    """检索相关的计数器和直方图，可以以 Prometheus 文本格式导出"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = Counter("search_queries_total", "Number of search queries.", ("type", "method"))
+        self.errors = Counter("search_errors_total", "Number of failed search queries.", ("type", "method"))
+        self.results = Counter("search_results_total", "Number of matching documents returned by searches.",
+                               ("type", "method"))
+        self.latency = Histogram("search_query_duration_seconds", "End-to-end search latency.", ("type", "method"))
+        self.stages = Histogram("search_stage_duration_seconds", "Time spent per search stage.", ("stage", "type"))
+        self.index_degraded = Gauge("search_index_degraded",
+                                    "Whether the index was loaded from a local fallback because Redis is unavailable.")
+        self.redis_circuit = Gauge("search_redis_circuit_state", "Current state of the Redis circuit breaker.",
+                                   ("state",))
+        self.redis_failures = Counter("search_redis_failures_total", "Redis failures recorded by the circuit breaker.")
+        self._metrics = [self.queries, self.errors, self.results, self.latency, self.stages,
+                         self.index_degraded, self.redis_circuit, self.redis_failures]
+
+    def observe_query(self, query_type, method, elapsed, stages, result_count):
+        """记录一次完成的查询"""
+        labels = (query_type, method)
+        with self._lock:
+            self.queries.inc(labels)
+            self.results.inc(labels, result_count)
+            self.latency.observe(elapsed, labels)
+            for stage, stage_elapsed in stages.items():
+                self.stages.observe(stage_elapsed, (stage, query_type))
+
+    def observe_error(self, query_type, method):
+        """记录一次失败的查询"""
+        with self._lock:
+            self.errors.inc((query_type, method))
+
+    def observe_index_status(self, index_status):
+        """根据 index_manager.status() 更新降级模式和Redis熔断器状态"""
+        redis_status = index_status["redis"]
+        with self._lock:
+            self.index_degraded.set(1 if index_status["degraded"] else 0)
+            for state in ("closed", "open", "half_open"):
+                self.redis_circuit.set(1 if redis_status["state"] == state else 0, (state,))
+            self.redis_failures.set(redis_status["failures_total"])
+
+    def render(self):
+        """以 Prometheus 文本格式导出所有指标"""
+        with self._lock:
+            lines = []
+            for metric in self._metrics:
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# 创建全局实例，用于应用中访问
+search_metrics = SearchMetrics()
@@ -0,0 +1,334 @@
+"""
+近重复新闻检测
+
+同一篇通讯稿常被多个媒体以略有不同的标题或发布时间转载，md5(title + published_at) 无法识别。
+这里对标题和摘要做词级 shingling，计算 MinHash 签名，并用 LSH 分桶查找候选：
+
+- 每篇新闻最多取 MAX_SHINGLES 个 shingle，签名长度固定为 NUM_PERM，单篇计算代价有上限
+- 签名切成 BANDS 段，任一段完全相同的新闻成为候选，再用完整签名估计 Jaccard 相似度确认
+- 新闻写入时增量分配 cluster_id（与最早的近重复新闻相同），写入 news.cluster_id
+- 检索时可以按 cluster_id 折叠重复结果
+
+使用说明:
+    - python main.py dedup              为所有尚未分配 cluster_id 的新闻检测近重复
+    - python main.py dedup --rebuild    清空后对整个语料重新检测，并输出耗时统计
+"""
+import random
+import re
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+
+from config import DB_PATH, CLUSTER_MAP_REFRESH_INTERVAL
+
+NUM_PERM = 64  # MinHash 签名长度
+BANDS = 16  # LSH 段数，每段 NUM_PERM // BANDS 行
+SHINGLE_SIZE = 3  # 每个 shingle 的词数
+MAX_SHINGLES = 200  # 每篇新闻最多使用的 shingle 数
+SIMILARITY_THRESHOLD = 0.7  # 估计的 Jaccard 相似度不低于此值即视为近重复
+MAX_CANDIDATES = 50  # 每篇新闻最多验证的候选数
+MAX_BUCKET_READ = 100  # 每个桶最多读取的候选数，大量转载落入同一桶时查询代价有上限
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# 固定种子生成的哈希函数参数，保证不同进程计算出的签名一致
+_rng = random.Random(1)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+NEAR_DUPLICATE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS minhash_signatures (
+        id TEXT PRIMARY KEY,
+        cluster_id TEXT,
+        signature BLOB
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS minhash_bands (
+        bucket INTEGER,
+        id TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_minhash_bands_bucket ON minhash_bands (bucket)",
+    "CREATE INDEX IF NOT EXISTS idx_minhash_bands_id ON minhash_bands (id)",
+    # generation 每次 dedup --rebuild 清空重建时加一，检索进程据此判断签名表是否需要整体重新加载
+    """
+    CREATE TABLE IF NOT EXISTS minhash_meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER
+    )
+    """,
+]
+
+
+def shingles(text):
+    """将文本规范化后切成词级 shingle，返回其 32 位哈希集合"""
+    words = re.findall(r"\w+", (text or "").lower())
+    if len(words) < SHINGLE_SIZE:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))} if words else set()
+    count = min(len(words) - SHINGLE_SIZE + 1, MAX_SHINGLES)
+    return {zlib.crc32(" ".join(words[i:i + SHINGLE_SIZE]).encode("utf-8")) for i in range(count)}
+
+
+def minhash_signature(shingle_hashes):
+    """计算 MinHash 签名（NUM_PERM 个 32 位整数）"""
+    if not shingle_hashes:
+        return [_MAX_HASH] * NUM_PERM
+    return [
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in shingle_hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def band_buckets(signature):
+    """把签名切成 BANDS 段，每段哈希为一个桶编号（段号编码在桶编号中）"""
+    rows = NUM_PERM // BANDS
+    return [
+        (band << 32) | zlib.crc32(struct.pack(f"<{rows}I", *signature[band * rows:(band + 1) * rows]))
+        for band in range(BANDS)
+    ]
+
+
+def estimated_similarity(signature_a, signature_b):
+    """用两个签名中相同位置取值相等的比例估计 Jaccard 相似度"""
+    return sum(1 for a, b in zip(signature_a, signature_b) if a == b) / NUM_PERM
+
+
+def ensure_tables(conn):
+    """创建签名表、LSH 分桶表，并为 news 表添加 cluster_id 列"""
+    for statement in NEAR_DUPLICATE_SCHEMA:
+        conn.execute(statement)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(news)")}
+    if "cluster_id" not in columns:
+        conn.execute("ALTER TABLE news ADD COLUMN cluster_id TEXT")
+
+
+def rebuild_generation(conn):
+    """签名表的重建代数，从未重建过（或还没有 minhash_meta 表）时为 0"""
+    try:
+        row = conn.execute("SELECT value FROM minhash_meta WHERE key = 'generation'").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] if row else 0
+
+
+def bump_rebuild_generation(conn):
+    """在清空签名表的同一个事务中调用，通知检索进程整体重新加载映射"""
+    conn.execute("INSERT INTO minhash_meta (key, value) VALUES ('generation', 1) "
+                 "ON CONFLICT(key) DO UPDATE SET value = value + 1")
+
+
+class NearDuplicateDetector:
+    """在写入新闻的同一个连接上增量分配 cluster_id"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        ensure_tables(conn)
+
+    def assign(self, doc_id, text):
+        """
+        为一篇新闻计算签名并分配 cluster_id
+
+        返回:
+        - cluster_id（没有近重复时为新闻自身的 ID）
+        """
+        signature = minhash_signature(shingles(text))
+        buckets = band_buckets(signature)
+
+        # 每个桶单独限制读取行数（最早写入的优先，簇代表总是最早的新闻）
+        bucket_query = " UNION ALL ".join(
+            ["SELECT id FROM (SELECT id FROM minhash_bands WHERE bucket = ? ORDER BY rowid LIMIT ?)"] * len(buckets))
+        params = [value for bucket in buckets for value in (bucket, MAX_BUCKET_READ)]
+        candidates = Counter(row[0] for row in self.conn.execute(bucket_query, params) if row[0] != doc_id)
+
+        cluster_id = doc_id
+        best = SIMILARITY_THRESHOLD
+        # 命中段数越多越可能相似，优先验证
+        for candidate_id, _ in candidates.most_common(MAX_CANDIDATES):
+            row = self.conn.execute(
+                "SELECT cluster_id, signature FROM minhash_signatures WHERE id = ?", (candidate_id,)
+            ).fetchone()
+            if row is None:
+                continue
+            similarity = estimated_similarity(signature, struct.unpack(f"<{NUM_PERM}I", row[1]))
+            if similarity >= best:
+                cluster_id, best = row[0], similarity
+
+        self.conn.execute("INSERT OR REPLACE INTO minhash_signatures (id, cluster_id, signature) VALUES (?, ?, ?)",
+                          (doc_id, cluster_id, struct.pack(f"<{NUM_PERM}I", *signature)))
+        # 重新分配时先删除旧签名的分桶，避免同一篇新闻在旧桶中残留而成为错误的候选
+        self.conn.execute("DELETE FROM minhash_bands WHERE id = ?", (doc_id,))
+        self.conn.executemany("INSERT INTO minhash_bands (bucket, id) VALUES (?, ?)",
+                              [(bucket, doc_id) for bucket in buckets])
+        self.conn.execute("UPDATE news SET cluster_id = ? WHERE id = ?", (cluster_id, doc_id))
+        return cluster_id
+
+    def assign_ids(self, doc_ids):
+        """为刚写入的这些新闻中尚未分配 cluster_id 的新闻检测近重复，返回其中近重复的篇数"""
+        doc_ids = list(doc_ids)
+        duplicates = 0
+        for start in range(0, len(doc_ids), 500):
+            chunk = doc_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT id, title, description FROM news WHERE cluster_id IS NULL AND id IN ({placeholders})", chunk
+            ).fetchall()
+            for doc_id, title, description in rows:
+                if self.assign(doc_id, f"{title} {description}") != doc_id:
+                    duplicates += 1
+        return duplicates
+
+    def assign_pending(self):
+        """为所有尚未分配 cluster_id 的新闻检测近重复（按发布时间顺序，较早的新闻作为簇代表）"""
+        rows = self.conn.execute(
+            "SELECT id, title, description FROM news WHERE cluster_id IS NULL ORDER BY published_at, id"
+        ).fetchall()
+        duplicates = 0
+        for doc_id, title, description in rows:
+            if self.assign(doc_id, f"{title} {description}") != doc_id:
+                duplicates += 1
+        return len(rows), duplicates
+
+
+class ClusterMap:
+    """
+    检索时使用的 文档ID -> cluster_id 映射，只保存被归入其他新闻所在簇的文档
+
+    映射来自 minhash_signatures 表。爬虫在其他进程中写入新闻并分配 cluster_id，检索进程每隔
+    refresh_interval 秒按 rowid 增量读取新的签名行（重新分配的新闻被 REPLACE 成新的行，同样会被读到）；
+    dedup --rebuild 清空重建签名表时会增加 minhash_meta 中的重建代数，检索进程发现代数变化后整体重新加载。
+    刷新时构建新字典后整体替换，查询线程不会看到修改到一半的映射。
+    """
+
+    def __init__(self, db_path=DB_PATH, refresh_interval=CLUSTER_MAP_REFRESH_INTERVAL):
+        self.db_path = db_path
+        self.refresh_interval = refresh_interval
+        self._clusters = None
+        self._watermark = 0  # 已读取的签名表最大 rowid
+        self._generation = None  # 已读取的签名表的重建代数
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    def _read_since(self, watermark, generation):
+        """
+        读取 rowid 大于 watermark 的签名行
+
+        重建代数与 generation 不同时说明签名表已被清空重建，改为整表读取。
+        代数和签名行在同一个读事务中读取，不会混用重建前后的数据。
+
+        返回:
+        - (行, 签名表当前最大 rowid, 重建代数, 是否为整表读取)
+        """
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            conn.execute("BEGIN")
+            current = rebuild_generation(conn)
+            if current != generation:
+                watermark = 0
+            max_rowid = conn.execute("SELECT MAX(rowid) FROM minhash_signatures").fetchone()[0] or 0
+            rows = conn.execute("SELECT id, cluster_id FROM minhash_signatures WHERE rowid > ? AND rowid <= ?",
+                                (watermark, max_rowid)).fetchall()
+        except sqlite3.OperationalError:
+            return [], 0, None, True  # 还没有运行过近重复检测
+        finally:
+            conn.close()
+        return rows, max_rowid, current, watermark == 0
+
+    def _refresh(self, full):
+        with self._lock:
+            if not full and self._clusters is not None \
+                    and time.monotonic() - self._refreshed_at < self.refresh_interval:
+                return self._clusters  # 其他线程刚刚刷新过
+            if full or self._clusters is None:
+                rows, max_rowid, generation, _ = self._read_since(0, None)
+                clusters = {}
+            else:
+                rows, max_rowid, generation, reset = self._read_since(self._watermark, self._generation)
+                clusters = {} if reset else dict(self._clusters)
+            for doc_id, cluster_id in rows:
+                if cluster_id != doc_id:
+                    clusters[doc_id] = cluster_id
+                else:
+                    clusters.pop(doc_id, None)
+            self._clusters = clusters
+            self._watermark = max_rowid
+            self._generation = generation
+            self._refreshed_at = time.monotonic()
+            return clusters
+
+    def load(self):
+        """加载映射，已加载时直接返回"""
+        clusters = self._clusters
+        if clusters is not None:
+            return clusters
+        # 尚未加载时 _refresh 会整表读取；并发的首批调用在锁内看到已加载的映射后直接返回，只读一次
+        return self._refresh(full=False)
+
+    def reload(self):
+        """丢弃内存中的映射并整体重新加载"""
+        return self._refresh(full=True)
+
+    def clusters(self):
+        """返回当前映射，距上次刷新超过 refresh_interval 秒时先增量读取新写入的新闻"""
+        clusters = self._clusters
+        if clusters is None or time.monotonic() - self._refreshed_at >= self.refresh_interval:
+            clusters = self._refresh(full=False)
+        return clusters
+
+    def cluster_of(self, doc_id):
+        return self.clusters().get(doc_id, doc_id)
+
+    def collapse(self, results, key=lambda result: result["id"]):
+        """按 cluster_id 折叠结果，每个簇只保留排在最前面的一篇"""
+        clusters = self.clusters()
+        seen = set()
+        collapsed = []
+        for result in results:
+            doc_id = key(result)
+            cluster_id = clusters.get(doc_id, doc_id)
+            if cluster_id not in seen:
+                seen.add(cluster_id)
+                collapsed.append(result)
+        return collapsed
+
+
+def benchmark_corpus(db_path=DB_PATH, rebuild=False):
+    """
+    对整个语料运行近重复检测并统计耗时
+
+    参数:
+    - rebuild: 是否清空已有的签名和 cluster_id 后重新检测
+    """
+    conn = sqlite3.connect(db_path)
+    detector = NearDuplicateDetector(conn)
+    if rebuild:
+        conn.execute("DELETE FROM minhash_signatures")
+        conn.execute("DELETE FROM minhash_bands")
+        conn.execute("UPDATE news SET cluster_id = NULL")
+        bump_rebuild_generation(conn)
+
+    start_time = time.time()
+    with conn:
+        processed, duplicates = detector.assign_pending()
+    elapsed = time.time() - start_time
+
+    cluster_sizes = Counter(row[0] for row in conn.execute("SELECT cluster_id FROM news WHERE cluster_id IS NOT NULL"))
+    conn.close()
+
+    multi = [size for size in cluster_sizes.values() if size > 1]
+    return {
+        "processed": processed,
+        "duplicates": duplicates,
+        "elapsed_sec": elapsed,
+        "per_article_ms": elapsed / processed * 1000 if processed else 0.0,
+        "clusters_with_duplicates": len(multi),
+        "largest_cluster": max(multi, default=1),
+    }
+
+
+# 创建全局实例，用于应用中访问
+cluster_map = ClusterMap()
@@ -0,0 +1,269 @@
+import mmap
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, Sequence
+
+import msgpack
+
+from index_optimizer import IndexOptimizer
+
+MAGIC = b"PIDX0002"
+HEADER_STRUCT = struct.Struct("<8sQ")
+OFFSET_TYPE = "Q"  # 词条、文档ID和倒排数据的偏移表
+ID_TYPE = "I"  # 排序表中的词条下标和整数文档ID
+RANK_TYPE = "d"  # 静态排名
+
+
+def _string_table(strings):
+    """将字符串序列编码为 (偏移表, 拼接后的 UTF-8 数据)，第 i 个字符串位于 offsets[i]:offsets[i + 1]"""
+    offsets = array(OFFSET_TYPE, [0])
+    blobs = []
+    for string in strings:
+        blob = string.encode("utf-8")
+        blobs.append(blob)
+        offsets.append(offsets[-1] + len(blob))
+    return offsets.tobytes(), b"".join(blobs)
+
+
+def build_packed_index(optimized_index_file="optimized_index.msgpack", packed_index_file="packed_index.bin"):
+    """
+    将优化索引转换为可直接 mmap 的打包格式
+
+    文件布局:
+    1. 8字节魔数 + 8字节头部长度
+    2. 头部: msgpack 编码的 {"terms": 词条数, "docs": 文档数, "impact_ordered": ..., "sections": {名称: [偏移, 长度]}}
+    3. 各个数据区，按 8 字节对齐:
+       - term_offsets / term_blob: 按字典序排列的词条表，查询时二分查找
+       - postings_offsets: 第 i 个词条的倒排记录在 postings 中的位置
+       - doc_id_offsets / doc_id_blob: 整数文档ID -> 原始文档ID
+       - doc_id_order: 按原始文档ID排序的整数文档ID，用于原始ID -> 整数ID 的二分查找
+       - case_variants: 含大写字母的词条下标，按小写形式排序
+       - static_rank: 按整数文档ID下标排列的静态排名
+       - postings: 每个词条的倒排记录单独用 msgpack 编码后顺序拼接
+
+    词典和文档ID映射都以定长数组的形式留在文件映射中，进程内不再为它们创建 Python 对象。
+    """
+    print(f"📦 开始打包索引: {optimized_index_file} -> {packed_index_file}")
+    start_time = time.time()
+
+    optimized_data = IndexOptimizer.decompress_index(optimized_index_file)
+    if not optimized_data:
+        raise Exception(f"无法加载优化索引: {optimized_index_file}")
+
+    index = optimized_data["index"]
+    terms = sorted(index)
+    postings_offsets = array(OFFSET_TYPE, [0])
+    postings_blobs = []
+    for term in terms:
+        blob = msgpack.packb(index[term], use_bin_type=True)
+        postings_blobs.append(blob)
+        postings_offsets.append(postings_offsets[-1] + len(blob))
+
+    # 整数文档ID由优化索引从 0 开始连续分配
+    doc_id_map = optimized_data["doc_id_map"]
+    doc_ids = [None] * len(doc_id_map)
+    for doc_id, int_doc_id in doc_id_map.items():
+        doc_ids[int_doc_id] = doc_id
+    if None in doc_ids:
+        raise Exception(f"优化索引中的整数文档ID不连续: {optimized_index_file}")
+    doc_id_order = array(ID_TYPE, sorted(range(len(doc_ids)), key=doc_ids.__getitem__))
+
+    case_variants = array(ID_TYPE, sorted((i for i, term in enumerate(terms) if term != term.lower()),
+                                          key=lambda i: (terms[i].lower(), terms[i])))
+
+    term_offsets, term_blob = _string_table(terms)
+    doc_id_offsets, doc_id_blob = _string_table(doc_ids)
+    sections = [
+        ("term_offsets", term_offsets),
+        ("term_blob", term_blob),
+        ("postings_offsets", postings_offsets.tobytes()),
+        ("doc_id_offsets", doc_id_offsets),
+        ("doc_id_blob", doc_id_blob),
+        ("doc_id_order", doc_id_order.tobytes()),
+        ("case_variants", case_variants.tobytes()),
+        ("static_rank", array(RANK_TYPE, optimized_data.get("static_rank", [])).tobytes()),
+        ("postings", b"".join(postings_blobs)),
+    ]
+
+    # 头部长度决定数据区的起始位置，先用占位偏移估算头部长度，再按 8 字节对齐排布各数据区
+    layout = {name: [0, len(data)] for name, data in sections}
+    header_fields = {"terms": len(terms), "docs": len(doc_ids),
+                     "impact_ordered": optimized_data.get("impact_ordered", False), "sections": layout}
+    position = HEADER_STRUCT.size + len(msgpack.packb(header_fields, use_bin_type=True)) + 9 * len(sections)
+    for name, data in sections:
+        position += -position % 8
+        layout[name] = [position, len(data)]
+        position += len(data)
+    header = msgpack.packb(header_fields, use_bin_type=True)
+
+    with open(packed_index_file, "wb") as f:
+        f.write(HEADER_STRUCT.pack(MAGIC, len(header)))
+        f.write(header)
+        for name, data in sections:
+            f.write(b"\0" * (layout[name][0] - f.tell()))
+            f.write(data)
+
+    size_mb = os.path.getsize(packed_index_file) / (1024 * 1024)
+    print(f"✅ 索引打包完成，大小: {size_mb:.2f} MB，耗时: {time.time() - start_time:.2f} 秒")
+    return packed_index_file
+
+
+class _StringTable(Sequence):
+    """mmap 中的只读字符串表，按下标访问时才解码对应的字符串"""
+
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __getitem__(self, i):
+        return str(self._blob[self._offsets[i]:self._offsets[i + 1]], "utf-8")
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+
+class PackedDocIdMap(Mapping):
+    """原始文档ID -> 整数文档ID，在按原始ID排序的整数ID数组上二分查找"""
+
+    def __init__(self, doc_ids, order):
+        self._doc_ids = doc_ids
+        self._order = order
+
+    def __getitem__(self, doc_id):
+        i = bisect_left(self._order, doc_id, key=self._doc_ids.__getitem__) if isinstance(doc_id, str) else len(self)
+        if i < len(self) and self._doc_ids[self._order[i]] == doc_id:
+            return self._order[i]
+        raise KeyError(doc_id)
+
+    def __iter__(self):
+        return iter(self._doc_ids)
+
+    def __len__(self):
+        return len(self._doc_ids)
+
+
+class PackedReverseDocIdMap(Mapping):
+    """整数文档ID -> 原始文档ID，直接按下标读取"""
+
+    def __init__(self, doc_ids):
+        self._doc_ids = doc_ids
+
+    def __getitem__(self, int_doc_id):
+        if isinstance(int_doc_id, int) and 0 <= int_doc_id < len(self._doc_ids):
+            return self._doc_ids[int_doc_id]
+        raise KeyError(int_doc_id)
+
+    def __iter__(self):
+        return iter(range(len(self._doc_ids)))
+
+    def __len__(self):
+        return len(self._doc_ids)
+
+
+class PackedCaseVariants(Mapping):
+    """小写 -> 索引中大小写不同的词条，在按小写形式排序的词条下标数组上二分查找"""
+
+    def __init__(self, terms, order):
+        self._terms = terms
+        self._order = order
+
+    def _lower(self, i):
+        return self._terms[i].lower()
+
+    def __getitem__(self, term):
+        i = bisect_left(self._order, term, key=self._lower)
+        if i < len(self._order) and self._lower(self._order[i]) == term:
+            return self._terms[self._order[i]]
+        raise KeyError(term)
+
+    def __iter__(self):
+        return iter(dict.fromkeys(self._lower(i) for i in self._order))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class PackedIndex(Mapping):
+    """
+    基于 mmap 的只读倒排索引
+
+    倒排数据、词典和文档ID映射都留在文件映射的页中，只有被查询的词条和文档ID才会在访问时解码，
+    进程内常驻的只有几个指向映射的 memoryview。多个 fork 出来的 worker 共享同一份文件页，
+    查询时不会因为修改 Python 对象的引用计数而触发写时复制。
+    """
+
+    def __init__(self, packed_index_file="packed_index.bin"):
+        self.packed_index_file = packed_index_file
+        self._file = open(packed_index_file, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, header_length = HEADER_STRUCT.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise Exception(f"不是有效的打包索引文件（请重新运行 optimize）: {packed_index_file}")
+
+        header_start = HEADER_STRUCT.size
+        header = msgpack.unpackb(self._mmap[header_start:header_start + header_length], raw=False)
+        self.impact_ordered = header.get("impact_ordered", False)
+
+        self._view = memoryview(self._mmap)
+        self._sections = {}
+        for name, (offset, length) in header["sections"].items():
+            self._sections[name] = self._view[offset:offset + length]
+
+        self._terms = _StringTable(self._array("term_offsets", OFFSET_TYPE), self._sections["term_blob"])
+        self._postings_offsets = self._array("postings_offsets", OFFSET_TYPE)
+        doc_ids = _StringTable(self._array("doc_id_offsets", OFFSET_TYPE), self._sections["doc_id_blob"])
+
+        self.doc_id_map = PackedDocIdMap(doc_ids, self._array("doc_id_order", ID_TYPE))
+        self.reverse_doc_id_map = PackedReverseDocIdMap(doc_ids)
+        self.case_variants = PackedCaseVariants(self._terms, self._array("case_variants", ID_TYPE))
+        self.static_rank = self._array("static_rank", RANK_TYPE)
+
+    def _array(self, name, typecode):
+        return self._sections[name].cast(typecode)
+
+    def _find(self, term):
+        """返回词条在词条表中的下标，不存在时返回 -1"""
+        if not isinstance(term, str):
+            return -1
+        i = bisect_left(self._terms, term)
+        if i < len(self._terms) and self._terms[i] == term:
+            return i
+        return -1
+
+    def __getitem__(self, term):
+        i = self._find(term)
+        if i < 0:
+            raise KeyError(term)
+        postings = self._sections["postings"][self._postings_offsets[i]:self._postings_offsets[i + 1]]
+        return msgpack.unpackb(postings, raw=False, strict_map_key=False)
+
+    def __contains__(self, term):
+        return self._find(term) >= 0
+
+    def __iter__(self):
+        return iter(self._terms)
+
+    def __len__(self):
+        return len(self._terms)
+
+    def close(self):
+        """关闭文件映射"""
+        self.doc_id_map = self.reverse_doc_id_map = self.case_variants = self.static_rank = None
+        self._terms = self._postings_offsets = None
+        for section in self._sections.values():
+            section.release()
+        self._sections = {}
+        self._view.release()
+        self._mmap.close()
+        self._file.close()
+
+
+if __name__ == "__main__":
+    # 打包索引并测试读取
+    build_packed_index()
+    packed = PackedIndex()
+    print(f"打包索引包含 {len(packed)} 个词条，{len(packed.doc_id_map)} 个文档")
@@ -0,0 +1,116 @@
+"""
+预 fork 的生产服务器
+
+在 gunicorn 主进程中一次性加载 mmap 打包索引和其他查询结构，然后再 fork 出 worker。
+worker 直接继承已经加载好的索引：倒排数据、词典（有序词条表）和文档ID映射（定长数组）
+都位于共享的文件映射页中，查询时不会修改其中任何 Python 对象的引用计数，不会被复制。
+
+其余的查询结构（SIDE_INDEXES 中的有序词典、拼写容错词典、时间分段、分面位图、搜索建议和近重复簇）
+是普通的 Python 对象。gc.freeze() 只能让垃圾回收不再遍历它们，查询读取这些对象时仍会修改引用计数，
+所在的页在每个 worker 中各复制一份。因此每个 worker 的独占内存大约等于查询实际触及的这部分结构的大小，
+用 python prefork_server.py 可以在当前目录的索引上测量：它模拟预 fork，在 fork 出的进程中执行一组查询，
+报告执行前后的独占内存（smaps_rollup 中的 Private_Clean + Private_Dirty）。执行后的数字还包括每个 worker
+自己填充的查询缓存（文档词频缓存、按需加载的时间分段等），是 worker 数量乘上去的那部分内存的上限。
+"""
+import gc
+import os
+import sys
+import time
+
+from gunicorn.app.base import BaseApplication
+
+
+def warm_up(app):
+    """在 fork 之前加载所有查询需要的索引结构"""
+    from redis_index_manager import index_manager
+    from search_functions import SIDE_INDEXES
+
+    start_time = time.time()
+    index, doc_id_map = index_manager.load_packed_index()
+    for side_index in SIDE_INDEXES:
+        side_index.load()
+
+    # 先回收加载过程中产生的垃圾，再冻结剩余对象，避免 worker 中的GC触碰共享页
+    gc.collect()
+    gc.freeze()
+    print(f"✅ 主进程索引预热完成，共有 {len(index)} 个词条和 {len(doc_id_map)} 个文档，"
+          f"耗时: {time.time() - start_time:.2f} 秒")
+
+
+def private_memory_kb():
+    """当前进程独占的常驻内存 (KB)，即 fork 后被写时复制或新分配的页；非 Linux 平台返回 None"""
+    try:
+        with open("/proc/self/smaps_rollup", "r") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return None
+    return sum(int(fields.get(name, "0 kB").split()[0]) for name in ("Private_Clean", "Private_Dirty"))
+
+
+def measure_worker_memory(app, queries, workers=2):
+    """
+    测量每个 worker 因写时复制增加的独占内存
+
+    在已预热的当前进程中依次 fork 出 workers 个子进程，每个子进程通过测试客户端把 queries 按相关度和
+    "最新优先"各执行一遍，并请求搜索建议，返回 [(fork 后的独占内存 KB, 执行查询后的独占内存 KB), ...]
+    """
+    measurements = []
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            before = private_memory_kb()
+            client = app.test_client()
+            for query in queries:
+                for sort in ("relevance", "recent"):
+                    client.get("/api/search", query_string={"query": query, "limit": 10, "sort": sort})
+                client.get("/api/suggestions", query_string={"query": query[:3]})
+            os.write(write_fd, f"{before} {private_memory_kb()}".encode())
+            os._exit(0)
+
+        os.close(write_fd)
+        with os.fdopen(read_fd, "rb") as f:
+            before, after = f.read().decode().split()
+        os.waitpid(pid, 0)
+        measurements.append((int(before), int(after)))
+    return measurements
+
+
+class PreforkSearchServer(BaseApplication):
+    """以 preload 模式运行的 gunicorn 应用，索引只在主进程中加载一次"""
+
+    def __init__(self, workers=4, bind="127.0.0.1:5001", timeout=120):
+        self.options = {
+            "bind": bind,
+            "workers": workers,
+            "timeout": timeout,
+            "preload_app": True,
+        }
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app import app
+
+        warm_up(app)
+        return app
+
+
+def serve(workers=4, bind="127.0.0.1:5001"):
+    """启动预 fork 服务器"""
+    PreforkSearchServer(workers=workers, bind=bind).run()
+
+
+if __name__ == "__main__":
+    # 在当前目录的索引上测量每个 worker 的独占内存，例如: python prefork_server.py apple "china trade" tech*
+    from app import app
+
+    warm_up(app)
+    test_queries = sys.argv[1:] or ["technology", "apple and google", '"stock market"', "presdent", "crypt*"]
+    for worker, (before, after) in enumerate(measure_worker_memory(app, test_queries)):
+        print(f"worker {worker}: fork 后独占 {before / 1024:.1f} MB，执行 {len(test_queries)} 个查询后 "
+              f"{after / 1024:.1f} MB")
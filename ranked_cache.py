@@ -0,0 +1,123 @@
+"""
+深度分页：排序结果缓存和游标
+
+第一次执行某个查询时把排好序的文档ID列表（以及总数和分面计数）放入一个短期缓存，
+后续翻页直接从缓存中切出当前页的文档ID，只对这一页回表，不再重新检索和打分。
+
+响应中的 nextCursor 是不透明的 base64 字符串，编码了查询（检索参数的摘要）、
+索引版本、下一页的起始位置和上一页最后一篇文档的ID。索引重新加载后旧游标失效；
+缓存过期时重新执行一次查询，并从游标记录的位置继续。
+"""
+import base64
+import binascii
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import msgpack
+
+from config import RANKED_CACHE_SIZE, RANKED_CACHE_TTL, RANKED_CACHE_MAX_IDS
+
+
+class InvalidCursorError(ValueError):
+    """游标无法解析，或与当前的查询、索引版本不匹配"""
+
+
+def query_key(*params):
+    """由检索参数（不含页码、每页条数和返回字段）计算查询摘要"""
+    return hashlib.sha1(msgpack.packb(params, use_bin_type=True)).hexdigest()[:16]
+
+
+def encode_cursor(key, generation, offset, last_id):
+    """生成指向 offset 处的游标"""
+    data = msgpack.packb({"k": key, "g": generation, "o": offset, "d": last_id}, use_bin_type=True)
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, key, generation):
+    """
+    解析游标并校验它属于同一个查询和同一版本的索引
+
+    返回:
+    - (起始位置, 上一页最后一篇文档的ID)
+
+    异常:
+    - InvalidCursorError: 游标格式错误、查询参数已改变或索引已重新加载
+    """
+    try:
+        data = msgpack.unpackb(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)), raw=False)
+        cursor_key, cursor_generation, offset, last_id = data["k"], data["g"], data["o"], data["d"]
+    except (binascii.Error, ValueError, TypeError, KeyError, msgpack.UnpackException):
+        raise InvalidCursorError("无效的分页游标")
+    if not isinstance(offset, int) or offset < 0:
+        raise InvalidCursorError("无效的分页游标")
+    if cursor_key != key:
+        raise InvalidCursorError("分页游标与当前查询参数不匹配")
+    if cursor_generation != generation:
+        raise InvalidCursorError("索引已更新，分页游标已失效，请重新搜索")
+    return offset, last_id
+
+
+def resume_offset(ranked_ids, offset, last_id):
+    """
+    确定从排序结果的哪个位置继续
+
+    正常情况下 ranked_ids[offset - 1] 就是上一页的最后一篇；
+    缓存过期后重新执行的查询排序可能略有不同，此时从 last_id 之后继续。
+    """
+    if offset == 0 or not last_id:
+        return offset
+    if offset <= len(ranked_ids) and ranked_ids[offset - 1] == last_id:
+        return offset
+    try:
+        return ranked_ids.index(last_id) + 1
+    except ValueError:
+        return offset
+
+
+class RankedResultCache:
+    """
+    查询摘要 -> 排序结果 的 LRU 缓存，条目在 ttl 秒后过期
+
+    只保存排在前 max_ids 位的文档ID，更深的页面按需重新执行查询。
+    """
+
+    def __init__(self, max_entries=RANKED_CACHE_SIZE, ttl=RANKED_CACHE_TTL, max_ids=RANKED_CACHE_MAX_IDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_ids = max_ids
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        返回:
+        - (排序后的文档ID列表, 总结果数, 分面计数, 总结果数的含义)；没有缓存或已过期时返回 None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1:]
+
+    def put(self, key, ranked_ids, total, facets, total_relation="eq"):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), ranked_ids[:self.max_ids], total, facets, total_relation)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# 创建全局实例，用于应用中访问
+ranked_cache = RankedResultCache()
@@ -1,19 +1,81 @@
 import redis
+import hashlib
 import json
 import msgpack
 import zlib
+import heapq
 import os
+import threading
 import time
+from itertools import islice
+from circuit_breaker import CircuitBreaker, OPEN
+from config import (REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_MAX_CONNECTIONS, REDIS_CONNECT_TIMEOUT,
+                    REDIS_SOCKET_TIMEOUT, REDIS_HEALTH_CHECK_INTERVAL, REDIS_CIRCUIT_FAILURE_THRESHOLD,
+                    REDIS_CIRCUIT_RESET_TIMEOUT)
 from index_optimizer import IndexOptimizer
+from packed_index import PackedIndex, build_packed_index
+from tracing import span, record_postings
+
+
+# 索引加载状态
+STATE_NOT_LOADED = "not_loaded"
+STATE_LOADING = "loading"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+
+class IndexSnapshot:
+    """
+    一次加载得到的索引快照，创建后不再修改
+
+    加载完成后整体替换管理器中的快照引用，查询线程每次取一个快照后只读访问，不需要加锁；
+    重新加载期间正在执行的查询继续使用旧快照。
+    """
+
+    __slots__ = ("index", "doc_id_map", "reverse_doc_id_map", "static_rank", "impact_ordered",
+                 "generation", "source", "loaded_at", "case_variants")
+
+    def __init__(self, index, doc_id_map, static_rank=(), impact_ordered=False, generation=0, source="empty",
+                 reverse_doc_id_map=None, case_variants=None):
+        self.index = index
+        self.doc_id_map = doc_id_map
+        # 整数ID -> 原始ID；打包索引直接提供基于 mmap 的映射，不在进程内建字典
+        if reverse_doc_id_map is None:
+            reverse_doc_id_map = {v: k for k, v in doc_id_map.items()}
+        self.reverse_doc_id_map = reverse_doc_id_map
+        self.static_rank = static_rank
+        self.impact_ordered = impact_ordered
+        self.generation = generation
+        self.source = source  # redis、optimized_file、json、packed 或 empty
+        self.loaded_at = time.time()
+        # 只包含大小写不同的词条: 小写 -> 索引中的词条
+        if case_variants is None:
+            case_variants = {term.lower(): term for term in index.keys() if term != term.lower()}
+        self.case_variants = case_variants
+
+    @classmethod
+    def from_optimized_data(cls, optimized_data, generation, source):
+        return cls(optimized_data["index"], optimized_data["doc_id_map"], optimized_data.get("static_rank", []),
+                   optimized_data.get("impact_ordered", False), generation, source)
+
+
+EMPTY_SNAPSHOT = IndexSnapshot({}, {})
 
 
 class RedisIndexManager:
-    """管理Redis中的索引数据"""
+    """
+    管理Redis中的索引数据
+
+    索引以不可变快照的形式保存在内存中。第一次访问时由一个线程加载（单飞），
+    同时到达的其他线程等待这次加载完成并复用其结果，不会各自解压一份完整索引。
+    """
 
-    def __init__(self, host='localhost', port=6379, db=0,
+    def __init__(self, host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB,
                  index_key='inverted_index',
                  optimized_index_file="optimized_index.msgpack",
-                 original_index_file="inverted_index.json"):
+                 original_index_file="inverted_index.json",
+                 packed_index_file="packed_index.bin",
+                 redis_client=None, breaker=None):
         """
         初始化Redis索引管理器
 
@@ -24,148 +86,405 @@ class RedisIndexManager:
         - index_key: Redis中存储索引的键名
         - optimized_index_file: 优化索引文件路径
         - original_index_file: 原始索引文件路径
+        - packed_index_file: 可 mmap 的打包索引文件路径
+        - redis_client: 可选的Redis客户端（例如 fakeredis），默认按配置创建带连接池和超时的客户端
+        - breaker: 可选的熔断器，默认按配置创建
         """
-        self.redis_client = redis.Redis(host=host, port=port, db=db, decode_responses=False)
+        if redis_client is None:
+            # 创建连接只建立连接池，不会连接Redis；超时保证Redis不可用时请求不会长时间阻塞
+            pool = redis.ConnectionPool(host=host, port=port, db=db,
+                                        max_connections=REDIS_MAX_CONNECTIONS,
+                                        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+                                        socket_timeout=REDIS_SOCKET_TIMEOUT,
+                                        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+                                        decode_responses=False)
+            redis_client = redis.Redis(connection_pool=pool)
+        self.redis_client = redis_client
+        self.breaker = breaker or CircuitBreaker("Redis", REDIS_CIRCUIT_FAILURE_THRESHOLD,
+                                                 REDIS_CIRCUIT_RESET_TIMEOUT)
         self.index_key = index_key
+        self.generation_key = f"{index_key}:generation"
         self.optimized_index_file = optimized_index_file
         self.original_index_file = original_index_file
-
-        # 内存中的缓存
-        self._index_cache = None
-        self._doc_id_map = None
-        self._reverse_doc_id_map = None
+        self.packed_index_file = packed_index_file
+
+        # 当前快照，只在持有加载锁时替换
+        self._snapshot = None
+        self._load_lock = threading.Lock()
+        self._load_attempts = 0
+        self._state = STATE_NOT_LOADED
+        self._last_error = None
+        self._load_seconds = None
+        # Redis 不可用而改用本地索引时记录原因，Redis 恢复后清除
+        self._degraded_reason = None
+        self._recovery_lock = threading.Lock()
+        self._recovering = False
+
+    @staticmethod
+    def _content_generation(compressed_data):
+        """以压缩索引内容的哈希作为Redis中索引的版本，同一份索引在所有实例上版本相同"""
+        return int.from_bytes(hashlib.blake2b(compressed_data, digest_size=8).digest(), "big")
+
+    @staticmethod
+    def _file_generation(path):
+        """以索引文件的修改时间作为索引版本，文件不存在时为 0"""
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return 0
+
+    @property
+    def ready(self):
+        """索引是否已加载"""
+        return self._snapshot is not None
+
+    @property
+    def generation(self):
+        """当前加载的索引版本，索引重新加载后改变，用于使分页游标和排序结果缓存失效"""
+        return self.snapshot().generation
+
+    def status(self):
+        """返回索引加载状态，供 /api/stats 和 /api/health 使用，不会触发加载"""
+        snapshot = self._snapshot
+        status = {
+            "state": self._state,
+            "source": snapshot.source if snapshot else None,
+            "generation": snapshot.generation if snapshot else None,
+            "loaded_at": snapshot.loaded_at if snapshot else None,
+            "load_seconds": self._load_seconds,
+            "error": self._last_error,
+            "degraded": self._degraded_reason is not None,
+            "degraded_reason": self._degraded_reason,
+            "redis": self.breaker.status(),
+        }
+        if snapshot:
+            status["terms_count"] = len(snapshot.index)
+            status["documents_count"] = len(snapshot.doc_id_map)
+        return status
 
     def is_index_in_redis(self):
-        """检查Redis中是否已有索引"""
-        return self.redis_client.exists(self.index_key)
+        """检查Redis中是否已有索引，Redis不可用或熔断时返回 False"""
+        if not self.breaker.allow():
+            return False
+        try:
+            exists = self.redis_client.exists(self.index_key)
+        except Exception as e:
+            self.breaker.record_failure(e)
+            print(f"❌ 检查Redis中的索引失败: {str(e)}")
+            return False
+        self.breaker.record_success()
+        return exists
 
-    def load_index_to_redis(self):
-        """将优化索引加载到Redis中"""
+    def _upload_to_redis(self):
+        """将优化索引上传到Redis并返回压缩数据，Redis出错时抛出 redis.RedisError"""
         # 首先检查优化索引是否存在
         if not os.path.exists(self.optimized_index_file):
             # 优化索引不存在，创建一个
             print(f"📌 优化索引文件不存在，开始创建: {self.optimized_index_file}")
             IndexOptimizer.compress_index(self.original_index_file, self.optimized_index_file)
 
-        # 加载优化索引
+        with open(self.optimized_index_file, "rb") as f:
+            compressed_data = f.read()
+
+        # 存储到Redis，版本号与索引在同一个事务中写入
+        print(f"📤 正在将优化索引上传到Redis (大小: {len(compressed_data) / (1024 * 1024):.2f} MB)...")
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.set(self.index_key, compressed_data)
+        pipe.set(self.generation_key, self._content_generation(compressed_data))
+        pipe.execute()
+        print("✅ 索引已成功加载到Redis")
+        return compressed_data
+
+    def load_index_to_redis(self):
+        """将优化索引加载到Redis中"""
+        if not self.breaker.allow():
+            print("⚠️ Redis 熔断中，跳过上传索引")
+            return False
         try:
-            with open(self.optimized_index_file, "rb") as f:
-                compressed_data = f.read()
-
-            # 存储到Redis
-            print(f"📤 正在将优化索引上传到Redis (大小: {len(compressed_data) / (1024 * 1024):.2f} MB)...")
-            self.redis_client.set(self.index_key, compressed_data)
-            print("✅ 索引已成功加载到Redis")
-            return True
+            self._upload_to_redis()
+        except redis.RedisError as e:
+            self.breaker.record_failure(e)
+            print(f"❌ 索引加载到Redis失败: {str(e)}")
+            return False
         except Exception as e:
+            self.breaker.record_failure(e)
             print(f"❌ 索引加载到Redis失败: {str(e)}")
             return False
+        self.breaker.record_success()
+        return True
 
-    def get_index(self):
+    def _load(self, loader, replace=False):
         """
-        获取索引，优先从内存缓存中获取，其次从Redis获取
-        返回元组: (索引字典, 文档ID映射)
+        单飞加载：同一时间只有一个线程执行 loader
+
+        在锁上等待的线程如果发现别的线程已经完成了一次加载（无论成功与否），直接复用其结果，
+        不再重复加载。replace 为 True 时总是重新加载并替换当前快照。
+        """
+        attempts = self._load_attempts
+        with self._load_lock:
+            if not replace and (self._snapshot is not None or self._load_attempts != attempts):
+                return self._snapshot or EMPTY_SNAPSHOT
+
+            self._load_attempts += 1
+            if self._snapshot is None:
+                self._state = STATE_LOADING
+            start_time = time.time()
+            try:
+                snapshot = loader()
+            except Exception as e:
+                print(f"❌ 所有索引加载方法均失败: {str(e)}")
+                self._last_error = str(e)
+                if self._snapshot is None:
+                    self._state = STATE_FAILED
+                return self._snapshot or EMPTY_SNAPSHOT
+
+            self._snapshot = snapshot
+            self._state = STATE_READY
+            self._last_error = None
+            self._load_seconds = time.time() - start_time
+            return snapshot
+
+    def _load_from_redis(self):
+        compressed_data, generation = self.redis_client.mget(self.index_key, self.generation_key)
+        if not compressed_data:
+            # Redis中不存在索引，先上传
+            compressed_data = self._upload_to_redis()
+            generation = None
+
+        # 版本号与Redis中的索引内容对应，而不是本地文件的修改时间；旧版本上传的索引没有版本号时按内容计算
+        generation = int(generation) if generation else self._content_generation(compressed_data)
+
+        # 解压缩和反序列化 - 添加strict_map_key=False参数
+        decompressed_data = zlib.decompress(compressed_data)
+        optimized_data = msgpack.unpackb(decompressed_data, raw=False, strict_map_key=False)
+        return IndexSnapshot.from_optimized_data(optimized_data, generation, "redis")
+
+    def _load_from_tiers(self):
+        """
+        依次尝试从Redis、优化文件和原始JSON加载索引
+
+        Redis 连接失败、超时或熔断时不再解压优化文件，直接映射本地打包索引（降级模式）。
         """
-        # 如果内存中已有缓存，直接返回
-        if self._index_cache is not None and self._doc_id_map is not None:
-            return self._index_cache, self._doc_id_map
+        if self.breaker.allow():
+            try:
+                snapshot = self._load_from_redis()
+                self.breaker.record_success()
+                if self._degraded_reason is not None:
+                    print("✅ Redis 已恢复，退出降级模式")
+                self._degraded_reason = None
+                return snapshot
+            except redis.RedisError as e:
+                self.breaker.record_failure(e)
+                degraded_reason = f"Redis 不可用: {str(e)}"
+            except Exception as e:
+                # 索引数据损坏等非连接错误也要结束本次调用，否则半开状态下的探测标记不会释放
+                self.breaker.record_failure(e)
+                print(f"❌ 从Redis加载索引失败: {str(e)}")
+                degraded_reason = None
+        else:
+            degraded_reason = "Redis 熔断中"
+
+        if degraded_reason is not None:
+            print(f"⚠️ {degraded_reason}，改用本地打包索引")
+            try:
+                snapshot = self._load_packed()
+                self._degraded_reason = degraded_reason
+                return snapshot
+            except Exception as e:
+                print(f"❌ 从打包索引加载失败: {str(e)}")
 
-        # 尝试从Redis获取
+        # 如果Redis加载失败，直接从优化文件加载
         try:
-            compressed_data = self.redis_client.get(self.index_key)
-            if not compressed_data:
-                # Redis中不存在索引，尝试加载
-                if not self.load_index_to_redis():
-                    raise Exception("无法加载索引到Redis")
-                compressed_data = self.redis_client.get(self.index_key)
+            optimized_data = IndexOptimizer.decompress_index(self.optimized_index_file)
+            if optimized_data:
+                self._degraded_reason = degraded_reason
+                return IndexSnapshot.from_optimized_data(optimized_data,
+                                                         self._file_generation(self.optimized_index_file),
+                                                         "optimized_file")
+        except Exception as e2:
+            print(f"❌ 从优化文件加载索引失败: {str(e2)}")
+
+        # 如果优化文件也加载失败，尝试从原始JSON加载
+        print(f"⚠️ 尝试从原始JSON加载索引 ({self.original_index_file})...")
+        with open(self.original_index_file, "r", encoding="utf-8") as f:
+            original_index = json.load(f)
+
+        # 使用原始索引，但没有ID优化
+        self._degraded_reason = degraded_reason
+        return IndexSnapshot(original_index, {}, generation=self._file_generation(self.original_index_file),
+                             source="json")
+
+    def _load_packed(self):
+        if not os.path.exists(self.packed_index_file):
+            print(f"📌 打包索引文件不存在，开始创建: {self.packed_index_file}")
+            build_packed_index(self.optimized_index_file, self.packed_index_file)
+
+        packed_index = PackedIndex(self.packed_index_file)
+        return IndexSnapshot(packed_index, packed_index.doc_id_map, packed_index.static_rank,
+                             packed_index.impact_ordered, self._file_generation(self.packed_index_file), "packed",
+                             packed_index.reverse_doc_id_map, packed_index.case_variants)
+
+    def snapshot(self):
+        """获取当前索引快照，尚未加载时加载（多个线程同时调用时只加载一次）"""
+        snapshot = self._snapshot
+        if snapshot is not None:
+            # 熔断器没有打开（未达到失败阈值，或冷却结束进入半开）时探测Redis是否恢复
+            if self._degraded_reason is not None and self.breaker.state != OPEN:
+                self._start_recovery()
+            return snapshot
+        return self._load(self._load_from_tiers)
+
+    def _start_recovery(self):
+        """降级模式下在后台线程中探测Redis是否恢复（同一时间只有一个探测），期间查询继续使用本地索引"""
+        with self._recovery_lock:
+            if self._recovering:
+                return
+            self._recovering = True
+
+        def recover():
+            try:
+                self._probe_redis()
+            finally:
+                self._recovering = False
 
-            # 解压缩和反序列化 - 添加strict_map_key=False参数
-            decompressed_data = zlib.decompress(compressed_data)
-            optimized_data = msgpack.unpackb(decompressed_data, raw=False, strict_map_key=False)
+        threading.Thread(target=recover, name="redis-index-recovery", daemon=True).start()
 
-            # 缓存到内存
-            self._doc_id_map = optimized_data["doc_id_map"]
-            self._index_cache = optimized_data["index"]
+    def _probe_redis(self):
+        """
+        降级模式下的探测调用：只检查Redis中的索引键，不重新加载索引
 
-            # 创建反向映射 (整数ID -> 原始ID)
-            self._reverse_doc_id_map = {v: k for k, v in self._doc_id_map.items()}
+        Redis 恢复后退出降级模式，但保留当前快照（通常是 mmap 打包索引），不会换成完整解压的
+        字典快照，索引版本也不变，已发出的分页游标继续有效；之后 reload() 再按正常顺序选择来源。
+        探测失败时计入熔断器（半开状态下重新打开），不会重新映射打包索引文件。
+        """
+        if not self.breaker.allow():
+            return False
+        try:
+            self.redis_client.exists(self.index_key)
+        except Exception as e:
+            self.breaker.record_failure(e)
+            print(f"⚠️ Redis 仍不可用: {str(e)}，继续使用本地索引")
+            return False
+        self.breaker.record_success()
+        self._degraded_reason = None
+        print("✅ Redis 已恢复，退出降级模式")
+        return True
 
-            return self._index_cache, self._doc_id_map
+    def get_index(self):
+        """
+        获取索引，优先从内存缓存中获取，其次从Redis获取
+        返回元组: (索引字典, 文档ID映射)
+        """
+        snapshot = self.snapshot()
+        return snapshot.index, snapshot.doc_id_map
 
-        except Exception as e:
-            print(f"❌ 从Redis加载索引失败: {str(e)}")
-            # 如果Redis加载失败，直接从优化文件加载
-            try:
-                optimized_data = IndexOptimizer.decompress_index(self.optimized_index_file)
-                if optimized_data:
-                    self._doc_id_map = optimized_data["doc_id_map"]
-                    self._index_cache = optimized_data["index"]
-                    self._reverse_doc_id_map = {v: k for k, v in self._doc_id_map.items()}
-                    return self._index_cache, self._doc_id_map
-            except Exception as e2:
-                print(f"❌ 从优化文件加载索引失败: {str(e2)}")
-
-            # 如果优化文件也加载失败，尝试从原始JSON加载
-            print(f"⚠️ 尝试从原始JSON加载索引 ({self.original_index_file})...")
-            try:
-                with open(self.original_index_file, "r", encoding="utf-8") as f:
-                    original_index = json.load(f)
+    def load_packed_index(self):
+        """
+        从 mmap 打包索引加载，不经过Redis，也不解压整个索引
+        适合在预 fork 的主进程中调用，由所有 worker 共享
+        """
+        snapshot = self._load(self._load_packed, replace=True)
+        return snapshot.index, snapshot.doc_id_map
+
+    def reload(self):
+        """
+        重新加载索引并原子地替换快照（索引重建后调用），加载期间查询继续使用旧快照
 
-                # 使用原始索引，但没有ID优化
-                self._index_cache = original_index
-                self._doc_id_map = {}
-                return self._index_cache, self._doc_id_map
-            except Exception as e3:
-                print(f"❌ 所有索引加载方法均失败: {str(e3)}")
-                return {}, {}
+        当前主动使用打包索引时重新映射打包索引文件，否则先把新的优化索引上传到Redis再加载
+        （降级模式下也会重新尝试Redis）。
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.source == "packed" and self._degraded_reason is None:
+            return self._load(self._load_packed, replace=True)
+        self.load_index_to_redis()
+        return self._load(self._load_from_tiers, replace=True)
 
     def get_original_doc_id(self, int_doc_id):
         """将整数文档ID转换回原始文档ID"""
-        if self._reverse_doc_id_map is None:
-            # 确保映射已加载
-            self.get_index()
+        return self.snapshot().reverse_doc_id_map.get(int_doc_id, str(int_doc_id))
 
-        return self._reverse_doc_id_map.get(int_doc_id, str(int_doc_id))
+    def resolve_term(self, term, snapshot=None):
+        """返回索引中与 term 对应的词条（不区分大小写），不存在时返回 None"""
+        snapshot = snapshot or self.snapshot()
+        term = term.lower()
+        if term in snapshot.index:
+            return term
+        return snapshot.case_variants.get(term)
 
     def get_term_postings(self, term):
         """获取某个词的倒排记录，并转换回原始格式"""
-        index, _ = self.get_index()
-
-        # 确保查询词转换为小写以匹配索引
-        term = term.lower()
+        snapshot = self.snapshot()
+        reverse_doc_id_map = snapshot.reverse_doc_id_map
 
-        if term not in index:
-            # 尝试查找大小写变体
-            for indexed_term in index.keys():
-                if indexed_term.lower() == term:
-                    term = indexed_term
-                    break
-            else:
+        with span("lexicon"):
+            indexed_term = self.resolve_term(term, snapshot)
+            if indexed_term is None:
+                record_postings(term.lower(), 0)
                 return {}  # 如果没有找到任何匹配，返回空结果
+            term = indexed_term
+
+        with span("decode"):
+            # 获取该词的倒排记录
+            postings = snapshot.index[term]
+            record_postings(term, len(postings))
+
+            # 转换为原始格式
+            original_postings = {}
+            for int_doc_id, diff_positions in postings.items():
+                # 获取原始文档ID
+                doc_id = reverse_doc_id_map.get(int_doc_id, str(int_doc_id))
+
+                # 还原差分编码的位置
+                positions = []
+                if diff_positions:
+                    current_pos = 0
+                    for diff in diff_positions:
+                        current_pos += diff
+                        positions.append(current_pos)
+
+                # 使用原始格式存储
+                original_postings[doc_id] = {
+                    "positions": positions
+                }
 
-        # 获取该词的倒排记录
-        postings = index[term]
+        return original_postings
 
-        # 转换为原始格式
-        original_postings = {}
-        for int_doc_id, diff_positions in postings.items():
-            # 获取原始文档ID
-            doc_id = self.get_original_doc_id(int_doc_id)
+    def get_static_rank(self):
+        """获取按整数文档ID下标排列的静态排名，旧格式的索引没有静态排名时返回空列表"""
+        return self.snapshot().static_rank
 
-            # 还原差分编码的位置
-            positions = []
-            if diff_positions:
-                current_pos = 0
-                for diff in diff_positions:
-                    current_pos += diff
-                    positions.append(current_pos)
+    def get_top_doc_ids(self, term, k, doc_filter=None):
+        """
+        获取包含某个词、静态排名最高的前 k 篇文档的原始ID，不还原位置信息
 
-            # 使用原始格式存储
-            original_postings[doc_id] = {
-                "positions": positions
-            }
+        倒排记录按静态排名降序存储时顺序读取前 k 篇即可结束，否则在全部倒排记录中取前 k 篇。
 
-        return original_postings
+        参数:
+        - term: 词条
+        - k: 最多返回的文档数
+        - doc_filter: 可选的原始文档ID集合，只返回其中的文档
+        """
+        snapshot = self.snapshot()
+        reverse_doc_id_map = snapshot.reverse_doc_id_map
+        with span("lexicon"):
+            indexed_term = self.resolve_term(term, snapshot)
+            if indexed_term is None:
+                record_postings(term, 0)
+                return []
+            term = indexed_term
+
+        with span("decode"):
+            postings = snapshot.index[term]
+            record_postings(term, len(postings))
+            int_doc_ids = iter(postings)
+            if doc_filter is not None:
+                int_doc_ids = (int_doc_id for int_doc_id in int_doc_ids
+                               if reverse_doc_id_map.get(int_doc_id) in doc_filter)
+            if snapshot.impact_ordered:
+                top = islice(int_doc_ids, k)
+            else:
+                top = heapq.nlargest(k, int_doc_ids, key=snapshot.static_rank.__getitem__)
+            return [reverse_doc_id_map.get(int_doc_id, str(int_doc_id)) for int_doc_id in top]
 
     def get_document_ids_for_term(self, term):
         """获取包含某个词的所有文档ID"""
@@ -0,0 +1,111 @@
+"""
+/api/search 响应编码
+
+- fields: 只返回调用方需要的结果字段，例如 fields=title,url,snippet
+- JSON 按结果逐条编码后流式输出，安装了 orjson 时用它代替标准库 json
+- format=msgpack 或 Accept: application/x-msgpack 时返回 msgpack，供内部服务使用
+- 按 Accept-Encoding 对响应做 brotli（需要安装 brotli）或 gzip 流式压缩
+"""
+import json
+import zlib
+
+import msgpack
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 可以通过 fields 参数请求的结果字段，content 为完整正文，只在显式请求时返回
+RESULT_FIELDS = ("id", "title", "snippet", "url", "publishedDate", "source", "sourceUrl", "content")
+DEFAULT_FIELDS = ("id", "title", "snippet", "url", "publishedDate", "source", "sourceUrl")
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPE = "application/x-msgpack"
+
+# 可用的压缩方式，按优先级排列
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def parse_fields(value):
+    """
+    解析 fields 参数
+
+    返回:
+    - 字段元组，未指定时返回 DEFAULT_FIELDS
+
+    异常:
+    - ValueError: 请求了不存在的字段
+    """
+    if not value:
+        return DEFAULT_FIELDS
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(",") if name.strip()))
+    unknown = [name for name in fields if name not in RESULT_FIELDS]
+    if unknown:
+        raise ValueError(f"未知的字段: {', '.join(unknown)}，可用字段: {', '.join(RESULT_FIELDS)}")
+    return fields or DEFAULT_FIELDS
+
+
+def dumps(obj):
+    """把对象编码为 UTF-8 JSON 字节串"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def iter_json(payload):
+    """逐条编码 results 中的结果，其余字段在最后一次输出，不在内存中拼出整个响应"""
+    yield b'{"results":['
+    for i, result in enumerate(payload["results"]):
+        yield b"," + dumps(result) if i else dumps(result)
+    rest = dumps({key: value for key, value in payload.items() if key != "results"})
+    yield b"]," + rest[1:] if len(rest) > 2 else b"]}"
+
+
+def compress_chunks(chunks, encoding):
+    """按 encoding (br 或 gzip) 流式压缩字节块"""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits=31 输出 gzip 格式
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+def encode_payload(payload, response_format="json", encoding=None):
+    """
+    编码检索响应
+
+    参数:
+    - payload: 响应字典，包含 results 列表
+    - response_format: json 或 msgpack
+    - encoding: br、gzip 或 None（不压缩）
+
+    返回:
+    - (字节块迭代器, mimetype)
+    """
+    if response_format == "msgpack":
+        chunks = iter([msgpack.packb(payload, use_bin_type=True)])
+        mimetype = MSGPACK_MIMETYPE
+    else:
+        chunks = iter_json(payload)
+        mimetype = JSON_MIMETYPE
+
+    if encoding:
+        chunks = compress_chunks(chunks, encoding)
+    return chunks, mimetype
@@ -1,3 +1,4 @@
+import asyncio
 import time
 from fetch_gnews import save_gnews
 
@@ -5,7 +6,7 @@ def scheduled_fetch():
     """定时更新新闻，每6小时运行一次"""
     while True:
         print("⏳ 正在抓取最新新闻...")
-        save_gnews()
+        asyncio.run(save_gnews())
         print("✅ 新闻更新完成，等待 6 小时后继续")
         time.sleep(6 * 3600)  # 6 小时
 
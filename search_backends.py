@@ -0,0 +1,105 @@
+import re
+
+import search_functions
+from config import SEARCH_BACKEND
+from fts_backend import FTS5SearchBackend
+from sharded_index import ShardedSearchBackend
+
+
+class IndexSearchBackend:
+    """基于自定义倒排索引 (Redis / 优化索引) 的检索后端，即 search_functions 中的检索函数"""
+
+    name = "index"
+    native_methods = ()
+
+    def keyword_search(self, query, doc_filter=None):
+        return search_functions.keyword_search(query, doc_filter)
+
+    def phrase_search(self, query, doc_filter=None):
+        return search_functions.phrase_search(query, doc_filter)
+
+    def proximity_search(self, query, doc_filter=None):
+        return search_functions.proximity_search(query, doc_filter)
+
+    def boolean_search_and_not(self, query, doc_filter=None):
+        return search_functions.boolean_search_and_not(query, doc_filter)
+
+    def boolean_search_and(self, query, doc_filter=None):
+        return search_functions.boolean_search_and(query, doc_filter)
+
+    def boolean_search_or(self, query, doc_filter=None):
+        return search_functions.boolean_search_or(query, doc_filter)
+
+
+BACKENDS = {
+    "index": IndexSearchBackend(),
+    "fts5": FTS5SearchBackend(),
+    "sharded": ShardedSearchBackend(),
+}
+
+
+def get_backend(name=None):
+    """按名称获取检索后端，默认使用配置中的 SEARCH_BACKEND"""
+    name = name or SEARCH_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"未知的检索后端: {name}")
+    return BACKENDS[name]
+
+
+def ranks_natively(backend, method):
+    """后端是否能按 method 原生排序：结果已经按相关度排好序，不需要再用 evaluation 中的函数重新打分"""
+    return method in backend.native_methods
+
+
+def classify_query_type(query):
+    """根据查询语法判断查询类型"""
+    query = query.strip().lower()  # 统一转换为小写
+
+    # 近邻搜索匹配：#数字 + 词1 + 词2
+    proximity_pattern = r"^#\d+\s+\w+\s+\w+$"
+
+    # 短语搜索匹配："xxx xxx"
+    phrase_pattern = r'^".+"$'
+
+    # 布尔搜索匹配
+    and_not_pattern = r"\b\w+\s+and\s+not\s+\w+\b"
+    and_pattern = r"\b\w+\s+and\s+\w+\b"
+    or_pattern = r"\b\w+\s+or\s+\w+\b"
+
+    if re.match(proximity_pattern, query):
+        return "proximity"
+    elif re.match(phrase_pattern, query):
+        return "phrase"
+    elif re.match(and_not_pattern, query):
+        return "and_not"
+    elif re.match(and_pattern, query):
+        return "and"
+    elif re.match(or_pattern, query):
+        return "or"
+    else:
+        return "keyword"
+
+
+def classify_search_query(query, doc_filter=None, backend=None, limit=None, method=None):
+    """
+    根据查询类型调用检索后端中对应的搜索函数
+
+    limit 和 method 只传给能按 method 原生排序的后端：结果已按相关度排好序，只需为排名前 limit 的结果回表
+    """
+    backend = backend or get_backend()
+    query = query.strip().lower()
+    options = {"limit": limit, "method": method} if ranks_natively(backend, method) else {}
+
+    query_type = classify_query_type(query)
+    if query_type == "proximity":
+        return backend.proximity_search(query, doc_filter, **options)
+    elif query_type == "phrase":
+        return backend.phrase_search(query, doc_filter, **options)
+    elif query_type == "and_not":
+        return backend.boolean_search_and_not(query, doc_filter, **options)
+    elif query_type == "and":
+        return backend.boolean_search_and(query, doc_filter, **options)
+    elif query_type == "or":
+        return backend.boolean_search_or(query, doc_filter, **options)
+    else:
+        return backend.keyword_search(query, doc_filter, **options)
@@ -1,19 +1,35 @@
+import heapq
+import logging
 import re
-import time
+import threading
 
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
 from nltk.stem import PorterStemmer
+from config import EARLY_TERMINATION_K, FUZZY_MAX_EXPANSIONS
+from facet_index import facet_index
+from fuzzy_lexicon import fuzzy_lexicon
+from lexicon import sorted_lexicon, extract_wildcards
+from near_duplicates import cluster_map
 from redis_index_manager import index_manager
+from segment_index import segment_index
+from suggestion_index import suggestion_index
+from tracing import span
 
 import fetch_news_db
 
+logger = logging.getLogger(__name__)
+
 # 全局常量
 db_file = "news.db"
+_initialize_lock = threading.Lock()
 STOPWORDS = set(stopwords.words("english"))
 STEMMER = PorterStemmer()  # 使用与索引构建时相同的词干提取器
+# 由倒排索引派生的辅助索引，与索引快照一起加载和重新加载
+SIDE_INDEXES = (sorted_lexicon, fuzzy_lexicon, segment_index, facet_index, suggestion_index, cluster_map)
 
 
+@span("parse")
 def preprocess_query(text):
     """
     对查询文本进行与索引构建相同的预处理：
@@ -31,10 +47,16 @@ def preprocess_query(text):
     return processed_tokens
 
 
-def proximity_search(query):
+def filter_doc_ids(doc_ids, doc_filter=None):
+    """按文档过滤器（原始文档ID集合）裁剪候选文档，在查询数据库之前执行"""
+    if doc_filter is None:
+        return list(doc_ids)
+    return [doc_id for doc_id in doc_ids if doc_id in doc_filter]
+
+
+def proximity_search(query, doc_filter=None):
     """近邻搜索函数 - 使用Redis优化版本"""
     query = query.strip().lower()
-    start_time = time.time()  # 记录开始时间
 
     # 解析近邻查询，格式如 "#3 apple banana"
     match = re.match(r"#(\d+)\s+(\w+)\s+(\w+)", query)
@@ -47,7 +69,7 @@ def proximity_search(query):
     term1 = STEMMER.stem(match.group(2))
     term2 = STEMMER.stem(match.group(3))
 
-    print(f"近邻搜索: 词干提取后的词条: '{term1}' 和 '{term2}'")
+    logger.debug(f"近邻搜索: 词干提取后的词条: '{term1}' 和 '{term2}'")
 
     # 获取词汇的倒排记录
     postings1 = index_manager.get_term_postings(term1)
@@ -55,39 +77,43 @@ def proximity_search(query):
 
     # 检查两个单词是否存在于索引中
     if not postings1:
-        print(f"词条 '{term1}' 不在索引中")
+        logger.debug(f"词条 '{term1}' 不在索引中")
     if not postings2:
-        print(f"词条 '{term2}' 不在索引中")
+        logger.debug(f"词条 '{term2}' 不在索引中")
 
     if not postings1 or not postings2:
         return []  # 直接返回空列表
 
-    # 获取包含两个单词的文档ID集合
-    docs_with_term1 = set(postings1.keys())
-    docs_with_term2 = set(postings2.keys())
-
-    # 找到两个单词都在的文档
-    common_docs = docs_with_term1.intersection(docs_with_term2)
-
-    # 结果存储
-    valid_docs = []
-
-    # 遍历共同文档，检查位置间距
-    for doc_id in common_docs:
-        positions1 = sorted(postings1[doc_id]["positions"])
-        positions2 = sorted(postings2[doc_id]["positions"])
-
-        # 双指针方法寻找最近距离
-        i, j = 0, 0
-        while i < len(positions1) and j < len(positions2):
-            pos1, pos2 = positions1[i], positions2[j]
-            if abs(pos1 - pos2) <= max_distance:
-                valid_docs.append(doc_id)
-                break  # 找到一个匹配的就可以跳出循环
-            if pos1 < pos2:
-                i += 1
-            else:
-                j += 1
+    with span("intersect"):
+        # 获取包含两个单词的文档ID集合
+        docs_with_term1 = set(postings1.keys())
+        docs_with_term2 = set(postings2.keys())
+
+        # 找到两个单词都在的文档
+        common_docs = docs_with_term1.intersection(docs_with_term2)
+
+        # 结果存储
+        valid_docs = []
+
+        # 遍历共同文档，检查位置间距
+        for doc_id in common_docs:
+            positions1 = sorted(postings1[doc_id]["positions"])
+            positions2 = sorted(postings2[doc_id]["positions"])
+
+            # 双指针方法寻找最近距离
+            i, j = 0, 0
+            while i < len(positions1) and j < len(positions2):
+                pos1, pos2 = positions1[i], positions2[j]
+                if abs(pos1 - pos2) <= max_distance:
+                    valid_docs.append(doc_id)
+                    break  # 找到一个匹配的就可以跳出循环
+                if pos1 < pos2:
+                    i += 1
+                else:
+                    j += 1
+
+    # 按文档过滤器（如日期范围）裁剪候选文档
+    valid_docs = filter_doc_ids(valid_docs, doc_filter)
 
     # 如果没有匹配的文档，直接返回空
     if not valid_docs:
@@ -96,17 +122,14 @@ def proximity_search(query):
     # 从数据库中查询完整新闻数据
     results = fetch_news_db.fetch_news_from_db(valid_docs, db_file)
 
-    # 记录总搜索时间
-    end_time = time.time()
-    print(f"近邻搜索完成，耗时: {end_time - start_time:.4f} 秒，找到 {len(results)} 篇文章")
+    logger.debug(f"近邻搜索完成，找到 {len(results)} 篇文章")
 
     return results
 
 
-def phrase_search(query):
+def phrase_search(query, doc_filter=None):
     """短语搜索函数 - 使用Redis优化版本"""
     query = query.strip().lower()
-    start_time = time.time()  # 记录开始时间
 
     # 解析短语查询，格式如："apple banana"
     match = re.match(r'"(.+?)"', query)
@@ -117,7 +140,7 @@ def phrase_search(query):
     phrase_text = match.group(1)
     phrase_terms = preprocess_query(phrase_text)
 
-    print(f"短语搜索: 词干提取后的词条: {phrase_terms}")
+    logger.debug(f"短语搜索: 词干提取后的词条: {phrase_terms}")
 
     # 确保短语中仍然有有效单词
     if not phrase_terms:
@@ -128,23 +151,27 @@ def phrase_search(query):
     for term in phrase_terms:
         postings = index_manager.get_term_postings(term)
         if not postings:  # 如果有任何一个词不在索引中，返回空结果
-            print(f"词条 '{term}' 不在索引中")
+            logger.debug(f"词条 '{term}' 不在索引中")
             return []
         all_postings[term] = postings
 
-    # 获取包含所有单词的文档集合
-    doc_sets = [set(postings.keys()) for postings in all_postings.values()]
-    common_docs = set.intersection(*doc_sets)  # 获取所有词共同出现的文档
+    with span("intersect"):
+        # 获取包含所有单词的文档集合
+        doc_sets = [set(postings.keys()) for postings in all_postings.values()]
+        common_docs = set.intersection(*doc_sets)  # 获取所有词共同出现的文档
 
-    valid_docs = []  # 存储满足短语搜索的文档ID
+        valid_docs = []  # 存储满足短语搜索的文档ID
 
-    # 遍历共同文档，检查是否为短语
-    for doc_id in common_docs:
-        positions_list = [sorted(all_postings[term][doc_id]["positions"]) for term in phrase_terms]
+        # 遍历共同文档，检查是否为短语
+        for doc_id in common_docs:
+            positions_list = [sorted(all_postings[term][doc_id]["positions"]) for term in phrase_terms]
 
-        # 采用多指针方法检查是否构成连续短语
-        if is_phrase_match(positions_list):
-            valid_docs.append(doc_id)
+            # 采用多指针方法检查是否构成连续短语
+            if is_phrase_match(positions_list):
+                valid_docs.append(doc_id)
+
+    # 按文档过滤器（如日期范围）裁剪候选文档
+    valid_docs = filter_doc_ids(valid_docs, doc_filter)
 
     # 如果没有匹配的文档，直接返回空
     if not valid_docs:
@@ -153,9 +180,7 @@ def phrase_search(query):
     # 从数据库中查询完整新闻数据
     results = fetch_news_db.fetch_news_from_db(valid_docs, db_file)
 
-    # 记录总搜索时间
-    end_time = time.time()
-    print(f"短语搜索完成，耗时: {end_time - start_time:.4f} 秒，找到 {len(results)} 篇文章")
+    logger.debug(f"短语搜索完成，找到 {len(results)} 篇文章")
 
     return results
 
@@ -185,10 +210,9 @@ def is_phrase_match(positions_list):
     return False
 
 
-def boolean_search_and_not(query):
+def boolean_search_and_not(query, doc_filter=None):
     """布尔搜索（AND NOT）- 使用Redis优化版本"""
     query = query.strip().lower()
-    start_time = time.time()  # 记录开始时间
 
     # 解析 AND NOT 查询
     match = re.match(r"(.+?)\s+and\s+not\s+(.+)", query, re.IGNORECASE)
@@ -202,7 +226,7 @@ def boolean_search_and_not(query):
     term_a = preprocess_query(term_a_text)
     term_b = preprocess_query(term_b_text)
 
-    print(f"布尔搜索(AND NOT): 词干提取后的词条: A={term_a}, B={term_b}")
+    logger.debug(f"布尔搜索(AND NOT): 词干提取后的词条: A={term_a}, B={term_b}")
 
     # 确保至少有一个有效单词
     if not term_a:
@@ -213,7 +237,7 @@ def boolean_search_and_not(query):
     for term in term_a:
         postings = index_manager.get_term_postings(term)
         if not postings:
-            print(f"词条 '{term}' 不在索引中")
+            logger.debug(f"词条 '{term}' 不在索引中")
             continue
         doc_set_a.update(postings.keys())
 
@@ -222,27 +246,26 @@ def boolean_search_and_not(query):
     for term in term_b:
         postings = index_manager.get_term_postings(term)
         if not postings:
-            print(f"词条 '{term}' 不在索引中")
+            logger.debug(f"词条 '{term}' 不在索引中")
             continue
         doc_set_b.update(postings.keys())
 
     # 计算 A - B
-    valid_docs = list(doc_set_a - doc_set_b)
+    with span("intersect"):
+        valid_docs = list(doc_set_a - doc_set_b)
+    valid_docs = filter_doc_ids(valid_docs, doc_filter)
 
     # 从数据库中查询完整新闻数据
     results = fetch_news_db.fetch_news_from_db(valid_docs, db_file)
 
-    # 记录总搜索时间
-    end_time = time.time()
-    print(f"布尔搜索(AND NOT)完成，耗时: {end_time - start_time:.4f} 秒，找到 {len(results)} 篇文章")
+    logger.debug(f"布尔搜索(AND NOT)完成，找到 {len(results)} 篇文章")
 
     return results
 
 
-def boolean_search_and(query):
+def boolean_search_and(query, doc_filter=None):
     """布尔搜索（AND）- 使用Redis优化版本"""
     query = query.strip().lower()
-    start_time = time.time()  # 记录开始时间
 
     # 解析 AND 查询
     match = re.match(r"(.+?)\s+and\s+(.+)", query, re.IGNORECASE)
@@ -256,7 +279,7 @@ def boolean_search_and(query):
     term_a = preprocess_query(term_a_text)
     term_b = preprocess_query(term_b_text)
 
-    print(f"布尔搜索(AND): 词干提取后的词条: A={term_a}, B={term_b}")
+    logger.debug(f"布尔搜索(AND): 词干提取后的词条: A={term_a}, B={term_b}")
 
     # 确保至少有一个有效单词
     if not term_a or not term_b:
@@ -267,7 +290,7 @@ def boolean_search_and(query):
     for term in term_a:
         postings = index_manager.get_term_postings(term)
         if not postings:
-            print(f"词条 '{term}' 不在索引中")
+            logger.debug(f"词条 '{term}' 不在索引中")
             continue
         doc_set_a.update(postings.keys())
 
@@ -276,27 +299,26 @@ def boolean_search_and(query):
     for term in term_b:
         postings = index_manager.get_term_postings(term)
         if not postings:
-            print(f"词条 '{term}' 不在索引中")
+            logger.debug(f"词条 '{term}' 不在索引中")
             continue
         doc_set_b.update(postings.keys())
 
     # 计算 A ∩ B
-    valid_docs = list(doc_set_a & doc_set_b)
+    with span("intersect"):
+        valid_docs = list(doc_set_a & doc_set_b)
+    valid_docs = filter_doc_ids(valid_docs, doc_filter)
 
     # 从数据库中查询完整新闻数据
     results = fetch_news_db.fetch_news_from_db(valid_docs, db_file)
 
-    # 记录总搜索时间
-    end_time = time.time()
-    print(f"布尔搜索(AND)完成，耗时: {end_time - start_time:.4f} 秒，找到 {len(results)} 篇文章")
+    logger.debug(f"布尔搜索(AND)完成，找到 {len(results)} 篇文章")
 
     return results
 
 
-def boolean_search_or(query):
+def boolean_search_or(query, doc_filter=None):
     """布尔搜索（OR）- 使用Redis优化版本"""
     query = query.strip().lower()
-    start_time = time.time()  # 记录开始时间
 
     # 解析 OR 查询
     match = re.match(r"(.+?)\s+or\s+(.+)", query, re.IGNORECASE)
@@ -310,7 +332,7 @@ def boolean_search_or(query):
     term_a = preprocess_query(term_a_text)
     term_b = preprocess_query(term_b_text)
 
-    print(f"布尔搜索(OR): 词干提取后的词条: A={term_a}, B={term_b}")
+    logger.debug(f"布尔搜索(OR): 词干提取后的词条: A={term_a}, B={term_b}")
 
     # 确保至少有一个有效单词
     if not term_a and not term_b:
@@ -321,7 +343,7 @@ def boolean_search_or(query):
     for term in term_a:
         postings = index_manager.get_term_postings(term)
         if not postings:
-            print(f"词条 '{term}' 不在索引中")
+            logger.debug(f"词条 '{term}' 不在索引中")
             continue
         doc_set_a.update(postings.keys())
 
@@ -330,83 +352,217 @@ def boolean_search_or(query):
     for term in term_b:
         postings = index_manager.get_term_postings(term)
         if not postings:
-            print(f"词条 '{term}' 不在索引中")
+            logger.debug(f"词条 '{term}' 不在索引中")
             continue
         doc_set_b.update(postings.keys())
 
     # 计算 A ∪ B
-    valid_docs = list(doc_set_a | doc_set_b)
+    with span("intersect"):
+        valid_docs = list(doc_set_a | doc_set_b)
+    valid_docs = filter_doc_ids(valid_docs, doc_filter)
 
     # 从数据库中查询完整新闻数据
     results = fetch_news_db.fetch_news_from_db(valid_docs, db_file)
 
-    # 记录总搜索时间
-    end_time = time.time()
-    print(f"布尔搜索(OR)完成，耗时: {end_time - start_time:.4f} 秒，找到 {len(results)} 篇文章")
+    logger.debug(f"布尔搜索(OR)完成，找到 {len(results)} 篇文章")
 
     return results
 
 
-def keyword_search(query):
+def expand_keywords_weighted(keywords):
+    """
+    将不在索引中的词条替换为编辑距离最近的几个词条（距离相同时文档频率高的优先）
+
+    返回 [(词条, 权重), ...]：索引中已有的词条权重为 1；同一个拼错的词扩展出的词条按
+    1 / (1 + 编辑距离) 加权，再按文档频率在这些词条之间分配，合计不超过 1。
+    FUZZY_MAX_EXPANSIONS 为 0 时不做扩展。
+    """
+    if not FUZZY_MAX_EXPANSIONS:
+        return [(term, 1.0) for term in keywords]
+
+    expanded = []
+    with span("lexicon"):
+        for term in keywords:
+            if index_manager.resolve_term(term) is not None:
+                expanded.append((term, 1.0))
+                continue
+            matches = fuzzy_lexicon.lookup(term, FUZZY_MAX_EXPANSIONS)
+            if matches:
+                logger.debug("词条 '%s' 不在索引中，扩展为: %s", term, matches)
+            total_df = sum(df for _, _, df in matches) or 1
+            expanded.extend((candidate, df / total_df / (1 + distance)) for candidate, distance, df in matches)
+    return expanded
+
+
+def expand_keywords(keywords):
+    """将不在索引中的词条替换为编辑距离最近的几个词条，见 expand_keywords_weighted"""
+    return [term for term, _ in expand_keywords_weighted(keywords)]
+
+
+def expand_wildcards_weighted(patterns):
+    """
+    将通配符模式扩展为索引中匹配的词条，每个模式最多 WILDCARD_MAX_EXPANSIONS 个
+
+    返回 [(词条, 权重), ...]：同一个模式扩展出的词条按文档频率分配权重，合计为 1。
+    """
+    expanded = []
+    with span("lexicon"):
+        for pattern in patterns:
+            terms = sorted_lexicon.expand(pattern)
+            logger.debug("通配符 '%s' 扩展为 %d 个词条", pattern, len(terms))
+            frequencies = [sorted_lexicon.document_frequency(term) for term in terms]
+            total_df = sum(frequencies) or 1
+            expanded.extend((term, df / total_df) for term, df in zip(terms, frequencies))
+    return expanded
+
+
+def expand_wildcards(patterns):
+    """将通配符模式扩展为索引中匹配的词条，见 expand_wildcards_weighted"""
+    return [term for term, _ in expand_wildcards_weighted(patterns)]
+
+
+def parse_keyword_query(query):
+    """分离出通配符模式 (如 crypt*)，其余部分使用与索引构建相同的预处理，返回 (词干列表, 通配符列表)"""
+    query, patterns = extract_wildcards(query.strip().lower())
+    return preprocess_query(query), patterns
+
+
+def weighted_query_terms(keywords, patterns):
+    """
+    关键词查询实际检索的索引词条及其打分权重 {词条: 权重}
+
+    不在索引中的词条（多半是拼写错误）扩展为相近的词条，通配符扩展为有序词典中匹配的词条。
+    同一个词条出现多次时取最大权重。
+    """
+    weighted = {}
+    for term, weight in expand_keywords_weighted(keywords) + expand_wildcards_weighted(patterns):
+        weighted[term] = max(weight, weighted.get(term, 0.0))
+    return weighted
+
+
+def scoring_terms(query):
+    """
+    关键词查询发生了拼写扩展或通配符扩展时，返回用于打分的 {词条: 权重}，否则返回 None
+
+    扩展出的词条是词干，原始查询中的拼错的词或 crypt* 在文档中并不存在；
+    打分函数收到词条权重后按词干匹配文档，而不是按原始查询词匹配。
+    """
+    keywords, patterns = parse_keyword_query(query)
+    weighted = weighted_query_terms(keywords, patterns)
+    if not patterns and set(weighted) == set(keywords):
+        return None
+    return weighted
+
+
+def keyword_search(query, doc_filter=None):
     """关键词搜索 - 使用Redis优化版本"""
     original_query = query.strip()
     query = original_query.lower()
-    start_time = time.time()  # 记录开始时间
 
-    print(f"关键词搜索: 原始查询 '{original_query}'")
+    logger.debug(f"关键词搜索: 原始查询 '{original_query}'")
 
-    # 使用与索引构建相同的预处理
-    keywords = preprocess_query(query)
+    # 分离出通配符模式 (如 crypt*)，其余部分使用与索引构建相同的预处理
+    keywords, patterns = parse_keyword_query(query)
 
-    print(f"关键词搜索: 词干提取后的词条: {keywords}")
+    logger.debug(f"关键词搜索: 词干提取后的词条: {keywords}，通配符: {patterns}")
 
     # 确保至少有一个有效的关键词
-    if not keywords:
-        print("查询中没有有效关键词(可能全为停用词)")
+    if not keywords and not patterns:
+        logger.debug("查询中没有有效关键词(可能全为停用词)")
         return "No valid keywords in the query."
 
+    # 不在索引中的词条（多半是拼写错误）扩展为相近的词条，通配符扩展为有序词典中匹配的词条
+    keywords = list(weighted_query_terms(keywords, patterns))
+
+    # 开启提前结束时只取静态排名最高的前 k 篇文档
+    if EARLY_TERMINATION_K and index_manager.get_static_rank():
+        return keyword_search_top_k(keywords, EARLY_TERMINATION_K, doc_filter)
+
     # 获取包含关键词的文档集合
     doc_sets = set()
     for term in keywords:
         postings = index_manager.get_term_postings(term)
         if not postings:
-            print(f"词条 '{term}' 不在索引中")
+            logger.debug(f"词条 '{term}' 不在索引中")
             continue
         doc_count = len(postings)
-        print(f"词条 '{term}' 在 {doc_count} 篇文档中出现")
+        logger.debug(f"词条 '{term}' 在 {doc_count} 篇文档中出现")
         doc_sets.update(postings.keys())
 
     # 如果没有包含关键词的文档，返回空列表
     if not doc_sets:
-        print("没有找到包含这些关键词的文档")
+        logger.debug("没有找到包含这些关键词的文档")
         return []
 
     # 获取有效文档ID
     valid_docs = list(doc_sets)
+    valid_docs = filter_doc_ids(valid_docs, doc_filter)
 
     # 从数据库中查询完整新闻数据
     results = fetch_news_db.fetch_news_from_db(valid_docs, db_file)
 
-    # 记录总搜索时间
-    end_time = time.time()
-    print(f"关键词搜索完成，耗时: {end_time - start_time:.4f} 秒，找到 {len(results)} 篇文章")
+    logger.debug(f"关键词搜索完成，找到 {len(results)} 篇文章")
 
     return results
 
 
+class TruncatedResults(list):
+    """提前结束的检索结果：只包含部分匹配文档，调用方应把结果数当作总数的下限"""
+
+
+def keyword_search_top_k(keywords, k, doc_filter=None):
+    """
+    关键词搜索的提前结束版本：只对静态排名最高的前 k 篇候选文档查询数据库
+
+    每个词条最多读取 k 篇静态排名最高的文档（倒排记录按静态排名存储时顺序读取即可结束），
+    合并后再取前 k 篇。匹配文档不足 k 篇的窄查询与完整搜索的结果相同，返回普通列表；
+    有匹配文档被舍弃时返回 TruncatedResults。
+    """
+    candidates = set()
+    truncated = False
+    for term in keywords:
+        top_ids = index_manager.get_top_doc_ids(term, k, doc_filter)
+        if not top_ids:
+            logger.debug(f"词条 '{term}' 不在索引中")
+            continue
+        # 某个词条恰好读满 k 篇时，可能还有更多匹配文档没有读取
+        truncated = truncated or len(top_ids) >= k
+        candidates.update(top_ids)
+
+    if not candidates:
+        logger.debug("没有找到包含这些关键词的文档")
+        return []
+
+    if len(candidates) > k:
+        truncated = True
+        snapshot = index_manager.snapshot()
+        static_rank, doc_id_map = snapshot.static_rank, snapshot.doc_id_map
+        candidates = heapq.nlargest(k, candidates, key=lambda doc_id: static_rank[doc_id_map[doc_id]])
+
+    results = fetch_news_db.fetch_news_from_db(list(candidates), db_file)
+    logger.debug(f"关键词搜索提前结束，对静态排名最高的 {len(results)} 篇文章打分")
+    return TruncatedResults(results) if truncated else results
+
+
 # 初始化索引 - 在导入模块时不会立即执行，只有在首次使用时才会加载
 def initialize_index():
-    """初始化索引，只在首次调用时执行"""
-    # 检查Redis中是否有索引
-    if not index_manager.is_index_in_redis():
-        print("⚠️ Redis中未找到索引，正在加载...")
-        index_manager.load_index_to_redis()
-    else:
-        print("✅ Redis中已有索引，无需重新加载")
-
-    # 预热索引 - 将索引加载到内存
-    index, doc_id_map = index_manager.get_index()
-    print(f"✅ 索引预热完成，共有 {len(index)} 个词条和 {len(doc_id_map)} 个文档")
+    """
+    初始化索引，在首个请求中调用
+
+    多个线程同时调用时只有一个线程加载（Redis中没有索引时先上传优化索引）并输出预热信息，
+    其余线程等待加载完成后直接返回。辅助索引随快照一起加载，首批请求不必各自解压。
+    """
+    with _initialize_lock:
+        if index_manager.ready:
+            return
+        snapshot = index_manager.snapshot()
+        if snapshot.source == "empty":
+            return  # 加载失败，原因见 index_manager.status()
+        for side_index in SIDE_INDEXES:
+            side_index.load()
+
+    index, doc_id_map = snapshot.index, snapshot.doc_id_map
+    print(f"✅ 索引预热完成（来源: {snapshot.source}），共有 {len(index)} 个词条和 {len(doc_id_map)} 个文档")
 
     # 测试一些常见词的索引情况
     test_terms = ["appl", "googl", "china", "technolog", "presid"]
@@ -415,4 +571,18 @@ def initialize_index():
             doc_count = len(index[term])
             print(f"测试词条 '{term}' 在索引中，包含于 {doc_count} 篇文档")
         else:
-            print(f"测试词条 '{term}' 不在索引中")
\ No newline at end of file
+            print(f"测试词条 '{term}' 不在索引中")
+
+
+def reload_index():
+    """
+    索引重建后重新加载倒排索引快照和所有辅助索引
+
+    每个结构都在加载完成后整体替换，加载期间查询继续使用旧数据。
+    """
+    with _initialize_lock:
+        snapshot = index_manager.reload()
+        for side_index in SIDE_INDEXES:
+            side_index.reload()
+    print(f"✅ 索引重新加载完成（来源: {snapshot.source}，版本: {snapshot.generation}）")
+    return snapshot
@@ -0,0 +1,397 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+import msgpack
+
+from config import DB_PATH
+from index_optimizer import IndexOptimizer
+
+UNKNOWN_SEGMENT = "unknown"
+
+# 一份段清单及按需加载的段数据缓存，重新加载时整体替换
+SegmentState = namedtuple("SegmentState", ["manifest", "segments", "segment_docs"])
+
+
+def segment_key(published_at, granularity="year"):
+    """根据发布时间计算所属段的键，例如 2020 或 2020-05"""
+    if not published_at or not published_at[:4].isdigit():
+        return UNKNOWN_SEGMENT
+    return published_at[:7] if granularity == "month" else published_at[:4]
+
+
+def date_in_range(published_at, date_from=None, date_to=None):
+    """
+    判断发布时间是否落在 [date_from, date_to] 内
+
+    日期均为ISO格式字符串，允许只给出前缀（如 2020 或 2020-05），
+    date_to 按前缀比较，因此 to=2020 包含 2020 全年
+    """
+    if not published_at:
+        return False
+    if date_from and published_at < date_from:
+        return False
+    if date_to and published_at[:len(date_to)] > date_to:
+        return False
+    return True
+
+
+class TimeSegmentIndex:
+    """
+    按发布年份/月份切分的索引段，每段记录最小/最大日期，查询时可整段跳过
+
+    每个段由两个文件组成：文档元数据（整数ID -> 原始ID、发布时间）和倒排记录，
+    只需要按日期取文档ID时不必加载倒排记录。
+    清单和段缓存作为一个 SegmentState 整体发布，清单与段文件都在锁内读取，并发请求只读取一次；
+    重新加载时换上新的 SegmentState，进行中的查询继续使用旧的清单和段。
+    """
+
+    def __init__(self, segment_dir="segments", granularity=None,
+                 optimized_index_file="optimized_index.msgpack", db_path=DB_PATH):
+        """
+        初始化时间分段索引
+
+        参数:
+        - segment_dir: 段文件存放目录
+        - granularity: 分段粒度 (year或month)，默认沿用已有清单中的粒度，没有清单时为 year
+        - optimized_index_file: 优化索引文件路径
+        - db_path: 数据库路径，用于读取发布时间
+        """
+        self.segment_dir = segment_dir
+        self.granularity = granularity
+        self.optimized_index_file = optimized_index_file
+        self.db_path = db_path
+        self.manifest_file = os.path.join(segment_dir, "manifest.json")
+
+        self._state = None
+        self._lock = threading.Lock()
+
+    def _read_granularity(self):
+        if self.granularity is None:
+            self.granularity = "year"
+            if os.path.exists(self.manifest_file):
+                with open(self.manifest_file, "r", encoding="utf-8") as f:
+                    self.granularity = json.load(f).get("granularity", "year")
+        return self.granularity
+
+    def _published_dates(self, doc_ids=None):
+        """从数据库读取发布时间 {文档ID: 发布时间}，doc_ids 为 None 时读取全部新闻"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        if doc_ids is None:
+            cursor.execute("SELECT id, published_at FROM news")
+            published = dict(cursor.fetchall())
+        else:
+            published = {}
+            id_list = list(doc_ids)
+            for start in range(0, len(id_list), 500):
+                chunk = id_list[start:start + 500]
+                cursor.execute(f"SELECT id, published_at FROM news WHERE id IN ({','.join('?' * len(chunk))})",
+                               chunk)
+                published.update(cursor.fetchall())
+        conn.close()
+        return published
+
+    @staticmethod
+    def _split(optimized_data, members):
+        """
+        按段拆分文档和倒排记录
+
+        参数:
+        - optimized_data: 完整的优化索引
+        - members: 要写入段的文档 {整数文档ID: (段键, 原始文档ID, 发布时间)}
+
+        返回:
+        - {段键: {"docs": {"doc_dates": {...}, "doc_ids": {...}}, "index": {...}}}
+        """
+        segments = {}
+        for int_doc_id, (key, doc_id, published_at) in members.items():
+            segment = segments.setdefault(key, {"docs": {"doc_dates": {}, "doc_ids": {}}, "index": {}})
+            segment["docs"]["doc_dates"][int_doc_id] = published_at
+            segment["docs"]["doc_ids"][int_doc_id] = doc_id
+
+        # 将倒排记录拆分到各个段
+        for term, postings in optimized_data["index"].items():
+            for int_doc_id, diff_positions in postings.items():
+                member = members.get(int_doc_id)
+                if member is None:
+                    continue
+                segments[member[0]]["index"].setdefault(term, {})[int_doc_id] = diff_positions
+        return segments
+
+    def _write_segment(self, key, segment):
+        """写出一个段的文档元数据和倒排记录，返回清单条目"""
+        docs = segment["docs"]
+        dates = [d for d in docs["doc_dates"].values() if d and key != UNKNOWN_SEGMENT]
+        file_name = f"segment_{key}.msgpack"
+        docs_file_name = f"segment_{key}.docs.msgpack"
+        with open(os.path.join(self.segment_dir, file_name), "wb") as f:
+            f.write(zlib.compress(msgpack.packb({"index": segment["index"]}, use_bin_type=True)))
+        with open(os.path.join(self.segment_dir, docs_file_name), "wb") as f:
+            f.write(zlib.compress(msgpack.packb(docs, use_bin_type=True)))
+        return {
+            "key": key,
+            "file": file_name,
+            "docs_file": docs_file_name,
+            "min_date": min(dates) if dates else None,
+            "max_date": max(dates) if dates else None,
+            "doc_count": len(docs["doc_ids"])
+        }
+
+    def _write_manifest(self, manifest):
+        # 最新的段排在前面，未知日期的段排在最后
+        manifest.sort(key=lambda s: (s["max_date"] is not None, s["max_date"] or ""), reverse=True)
+        with open(self.manifest_file, "w", encoding="utf-8") as f:
+            json.dump({"granularity": self.granularity, "segments": manifest}, f, indent=2)
+        self._state = SegmentState(manifest, {}, {})
+        return manifest
+
+    def build(self, optimized_data=None):
+        """从优化索引和数据库构建时间分段，并写出段文件和清单"""
+        self._read_granularity()
+        print(f"📌 开始构建时间分段索引 (粒度: {self.granularity})...")
+        start_time = time.time()
+
+        if optimized_data is None:
+            optimized_data = IndexOptimizer.decompress_index(self.optimized_index_file)
+        if not optimized_data:
+            raise Exception(f"无法加载优化索引: {self.optimized_index_file}")
+
+        # 为每个文档分配所属的段；已从数据库删除、尚未回收整数ID的文档不属于任何段
+        published = self._published_dates()
+        members = {int_doc_id: (segment_key(published[doc_id], self.granularity), doc_id, published[doc_id])
+                   for doc_id, int_doc_id in optimized_data["doc_id_map"].items() if doc_id in published}
+        segments = self._split(optimized_data, members)
+
+        os.makedirs(self.segment_dir, exist_ok=True)
+        manifest = self._write_manifest([self._write_segment(key, segment) for key, segment in segments.items()])
+        print(f"✅ 时间分段索引构建完成，共 {len(manifest)} 个段，耗时: {time.time() - start_time:.2f} 秒")
+        return manifest
+
+    def update(self, doc_ids, optimized_data=None):
+        """
+        增量更新：只重建包含变化文档的段，即这些文档原来所在的段和按当前发布时间应在的段
+
+        参数:
+        - doc_ids: 重新索引或已删除的原始文档ID
+        - optimized_data: 已更新的完整优化索引，为 None 时从文件加载
+
+        返回:
+        - 新的段清单
+        """
+        if not os.path.exists(self.manifest_file):
+            return self.build(optimized_data)
+        if optimized_data is None:
+            optimized_data = IndexOptimizer.decompress_index(self.optimized_index_file)
+        if not optimized_data:
+            raise Exception(f"无法加载优化索引: {self.optimized_index_file}")
+
+        start_time = time.time()
+        self._read_granularity()
+        with open(self.manifest_file, "r", encoding="utf-8") as f:
+            entries = {entry["key"]: entry for entry in json.load(f)["segments"]}
+        doc_ids = set(doc_ids)
+        doc_id_map = optimized_data["doc_id_map"]
+
+        # 变化文档按当前发布时间应在的段；已删除的文档不在数据库中，只从原来的段中移除
+        placed = {doc_id_map[doc_id]: (segment_key(published_at, self.granularity), doc_id, published_at)
+                  for doc_id, published_at in self._published_dates(doc_ids).items() if doc_id in doc_id_map}
+        touched = {key for key, _, _ in placed.values()}
+
+        # 变化文档原来所在的段：先只读取各段的文档元数据文件，不加载倒排记录
+        segment_docs = {key: self._read(entry.get("docs_file", entry["file"])) for key, entry in entries.items()}
+        touched.update(key for key, docs in segment_docs.items()
+                       if any(doc_id in doc_ids for doc_id in docs["doc_ids"].values()))
+
+        # 受影响的段保留其中未变化的文档，再放入变化文档
+        members = {}
+        for key in touched & segment_docs.keys():
+            docs = segment_docs[key]
+            for int_doc_id, doc_id in docs["doc_ids"].items():
+                if doc_id not in doc_ids:
+                    members[int_doc_id] = (key, doc_id, docs["doc_dates"][int_doc_id])
+        members.update(placed)
+
+        segments = self._split(optimized_data, members)
+        for key in touched:
+            if key in segments:
+                entries[key] = self._write_segment(key, segments[key])
+            elif key in entries:
+                # 段中的文档全部被删除或移到了其他段
+                for file_field in ("file", "docs_file"):
+                    path = os.path.join(self.segment_dir, entries[key].get(file_field, ""))
+                    if os.path.isfile(path):
+                        os.remove(path)
+                del entries[key]
+
+        manifest = self._write_manifest(list(entries.values()))
+        print(f"✅ 已重建 {len(touched)}/{len(manifest)} 个时间段，耗时: {time.time() - start_time:.2f} 秒")
+        return manifest
+
+    def _read_state(self):
+        """读取段清单，清单不存在时构建"""
+        if not os.path.exists(self.manifest_file):
+            print(f"⚠️ 时间分段清单不存在，开始构建: {self.manifest_file}")
+            self.build()
+            return self._state
+
+        with open(self.manifest_file, "r", encoding="utf-8") as f:
+            self._state = SegmentState(json.load(f)["segments"], {}, {})
+        return self._state
+
+    def _load_state(self):
+        state = self._state
+        if state is not None:
+            return state
+        with self._lock:
+            return self._state or self._read_state()
+
+    def load(self):
+        """加载段清单（多个线程同时调用时只加载一次），段数据本身在首次访问时才加载"""
+        return self._load_state().manifest
+
+    def reload(self):
+        """重新读取清单并丢弃缓存的段数据（索引重建后调用），读取完成前查询继续使用旧清单"""
+        with self._lock:
+            return self._read_state().manifest
+
+    def _read(self, file_name):
+        with open(os.path.join(self.segment_dir, file_name), "rb") as f:
+            return msgpack.unpackb(zlib.decompress(f.read()), raw=False, strict_map_key=False)
+
+    def _cached(self, state, cache, key, file_field, prepare=None):
+        """从 state 的段缓存中取出段数据，首次访问时在锁内从磁盘加载，prepare 在发布前补充派生数据"""
+        value = cache.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            value = cache.get(key)
+            if value is None:
+                entry = next(s for s in state.manifest if s["key"] == key)
+                # 旧版本的段文件把文档元数据和倒排记录存放在同一个文件中
+                value = self._read(entry.get(file_field, entry["file"]))
+                if prepare is not None:
+                    prepare(value)
+                cache[key] = value
+            return value
+
+    @staticmethod
+    def _add_case_variants(segment):
+        # 与主索引相同：只记录大小写不同的词条，小写 -> 段中的词条
+        segment["case_variants"] = {term.lower(): term for term in segment["index"] if term != term.lower()}
+
+    def get_segment(self, key, state=None):
+        """获取某个段的倒排记录 {"index": {...}, "case_variants": {...}}，按需从磁盘加载"""
+        state = state or self._load_state()
+        return self._cached(state, state.segments, key, "file", self._add_case_variants)
+
+    @staticmethod
+    def term_postings(segment, term):
+        """按词条取段中的倒排记录，与主索引的 resolve_term 一样不区分大小写"""
+        term = term.lower()
+        postings = segment["index"].get(term)
+        if postings is None and term in segment["case_variants"]:
+            postings = segment["index"][segment["case_variants"][term]]
+        return postings or {}
+
+    def get_segment_docs(self, key, state=None):
+        """获取某个段的文档元数据 {"doc_ids": {...}, "doc_dates": {...}}，不加载倒排记录"""
+        state = state or self._load_state()
+        return self._cached(state, state.segment_docs, key, "docs_file")
+
+    @staticmethod
+    def _covers(entry, date_from, date_to):
+        """段内的所有文档是否都落在日期范围内"""
+        return date_in_range(entry["min_date"], date_from, date_to) and \
+            date_in_range(entry["max_date"], date_from, date_to)
+
+    def segments_in_range(self, date_from=None, date_to=None, manifest=None):
+        """返回与日期范围有交集的段，完全落在范围外的段直接跳过"""
+        manifest = manifest or self.load()
+        if not date_from and not date_to:
+            return list(manifest)
+
+        selected = []
+        for entry in manifest:
+            if entry["max_date"] is None:
+                continue  # 日期未知的段无法满足日期过滤
+            if date_from and entry["max_date"] < date_from:
+                continue
+            if date_to and entry["min_date"][:len(date_to)] > date_to:
+                continue
+            selected.append(entry)
+        return selected
+
+    def doc_ids_in_range(self, date_from=None, date_to=None):
+        """返回日期范围内的所有原始文档ID集合，用作检索时的文档过滤器"""
+        # 清单和段数据取自同一份 SegmentState，避免与重新加载交错
+        state = self._load_state()
+        doc_ids = set()
+        for entry in self.segments_in_range(date_from, date_to, state.manifest):
+            docs = self.get_segment_docs(entry["key"], state)
+
+            # 整段都在范围内时无需逐个检查
+            if self._covers(entry, date_from, date_to):
+                doc_ids.update(docs["doc_ids"].values())
+                continue
+
+            for int_doc_id, published_at in docs["doc_dates"].items():
+                if date_in_range(published_at, date_from, date_to):
+                    doc_ids.add(docs["doc_ids"][int_doc_id])
+        return doc_ids
+
+    def search_recent(self, terms, limit=10, date_from=None, date_to=None, doc_filter=None):
+        """
+        "最新优先"检索：从最新的段开始，按发布时间降序收集命中文档，凑满 limit 篇后不再读取更早的段
+
+        参数:
+        - terms: 预处理后的查询词条（任意词条命中即可，不区分大小写）
+        - limit: 需要的结果数，None 表示读取所有段，全部命中文档都按发布时间排序
+        - date_from / date_to: 可选的日期范围
+        - doc_filter: 可选的原始文档ID集合（如来源过滤）
+
+        返回:
+        - (按发布时间降序的命中文档原始ID列表（提前结束时至少 limit 篇）, 已读取的段中所有命中文档的原始ID集合,
+          是否提前结束)；提前结束时命中文档集合只覆盖较新的段，调用方应把它的大小当作总数的下限
+        """
+        state = self._load_state()
+        hits = []
+        matched_ids = set()
+        for entry in self.segments_in_range(date_from, date_to, state.manifest):
+            if limit is not None and len(hits) >= limit:
+                # 当前页已经凑满，更早的段只会排在后面；与提前结束的关键词检索一样，总数只是下限
+                return hits, matched_ids, True
+
+            segment = self.get_segment(entry["key"], state)
+            docs = self.get_segment_docs(entry["key"], state)
+            doc_ids, doc_dates = docs["doc_ids"], docs["doc_dates"]
+
+            matched = set()
+            for term in terms:
+                matched.update(self.term_postings(segment, term))
+            if (date_from or date_to) and not self._covers(entry, date_from, date_to):
+                matched = {int_doc_id for int_doc_id in matched
+                           if date_in_range(doc_dates[int_doc_id], date_from, date_to)}
+            if doc_filter is not None:
+                matched = {int_doc_id for int_doc_id in matched if doc_ids[int_doc_id] in doc_filter}
+
+            segment_hits = sorted(((doc_dates[int_doc_id] or "", doc_ids[int_doc_id]) for int_doc_id in matched),
+                                  reverse=True)
+            hits.extend(doc_id for _, doc_id in segment_hits)
+            matched_ids.update(doc_ids[int_doc_id] for int_doc_id in matched)
+
+        return hits, matched_ids, False
+
+
+# 创建全局实例，用于应用中访问
+segment_index = TimeSegmentIndex()
+
+if __name__ == "__main__":
+    # 构建时间分段索引并打印各段信息
+    manager = TimeSegmentIndex()
+    for entry in manager.build():
+        print(f"{entry['key']}: {entry['doc_count']} 篇文档，{entry['min_date']} ~ {entry['max_date']}")
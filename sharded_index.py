@@ -0,0 +1,641 @@
+import bisect
+import heapq
+import json
+import math
+import multiprocessing as mp
+import os
+import re
+import threading
+import time
+import zlib
+
+import msgpack
+
+import fetch_news_db
+import search_functions
+from config import FUZZY_MAX_EXPANSIONS, INDEX_SHARDS, SHARD_DIR
+from fuzzy_lexicon import MIN_DOCUMENT_FREQUENCY, edit_distance, max_distance_for
+from index_optimizer import IndexOptimizer
+from lexicon import WILDCARD_MAX_EXPANSIONS, pattern_kgrams
+
+# 分片文件格式版本，格式变化后启动时重新切分
+SHARD_FORMAT = 3
+
+
+def shard_range(total_docs, num_shards, shard_id):
+    """按文档ID区间切分，返回第 shard_id 个分片负责的 [lo, hi) 区间"""
+    size = math.ceil(total_docs / num_shards) if num_shards else total_docs
+    lo = min(shard_id * size, total_docs)
+    hi = min(lo + size, total_docs)
+    return lo, hi
+
+
+def shard_file(shard_dir, shard_id):
+    return os.path.join(shard_dir, f"shard_{shard_id}.msgpack")
+
+
+def _source_generation(optimized_index_file):
+    try:
+        return os.stat(optimized_index_file).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def manifest_file(shard_dir):
+    return os.path.join(shard_dir, "manifest.json")
+
+
+def _read_manifest(shard_dir):
+    try:
+        with open(manifest_file(shard_dir), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _split_shards(optimized_data, num_shards, shard_size, shard_ids):
+    """把优化索引中属于 shard_ids 的文档和倒排记录拆分出来，整数文档ID超出最后一个区间的归入最后一个分片"""
+    shard_ids = set(shard_ids)
+    shards = {shard_id: {"doc_ids": {}, "doc_lengths": {}, "index": {}} for shard_id in shard_ids}
+
+    def shard_of(int_doc_id):
+        return shards.get(min(int_doc_id // shard_size, num_shards - 1))
+
+    for term, postings in optimized_data["index"].items():
+        for int_doc_id, diff_positions in postings.items():
+            shard = shard_of(int_doc_id)
+            if shard is None:
+                continue
+            shard["index"].setdefault(term, {})[int_doc_id] = diff_positions
+            # 文档长度 = 去掉停用词后的词数，用于 BM25 的长度归一化
+            shard["doc_lengths"][int_doc_id] = shard["doc_lengths"].get(int_doc_id, 0) + (len(diff_positions) or 1)
+    # 没有倒排记录的文档（已被删除、尚未回收整数ID）不计入分片的文档数
+    for doc_id, int_doc_id in optimized_data["doc_id_map"].items():
+        shard = shard_of(int_doc_id)
+        if shard is not None and int_doc_id in shard["doc_lengths"]:
+            shard["doc_ids"][int_doc_id] = doc_id
+    return shards
+
+
+def _write_shards(shards, ranges, num_shards, shard_size, generation, shard_dir):
+    """写出分片文件，最后写清单：清单中的版本与优化索引一致时分片才被视为最新"""
+    os.makedirs(shard_dir, exist_ok=True)
+    for shard_id, shard in shards.items():
+        with open(shard_file(shard_dir, shard_id), "wb") as f:
+            f.write(zlib.compress(msgpack.packb({
+                "num_shards": num_shards,
+                "range": ranges[shard_id],
+                "doc_ids": shard["doc_ids"],
+                "doc_lengths": shard["doc_lengths"],
+                "index": shard["index"]
+            }, use_bin_type=True)))
+    with open(manifest_file(shard_dir), "w", encoding="utf-8") as f:
+        json.dump({"format": SHARD_FORMAT, "num_shards": num_shards, "shard_size": shard_size,
+                   "ranges": ranges, "generation": generation}, f, indent=2)
+
+
+def build_shards(num_shards=INDEX_SHARDS, optimized_index_file="optimized_index.msgpack", shard_dir=SHARD_DIR,
+                 optimized_data=None):
+    """
+    把优化索引按文档ID区间切分为分片文件
+
+    只在这里解压一次完整索引，每个分片工作进程只读取自己的分片文件。
+    分片清单中记录了优化索引的修改时间，优化索引重建后启动分片时会重新切分。
+    """
+    print(f"📌 开始将索引切分为 {num_shards} 个分片...")
+    start_time = time.time()
+
+    if optimized_data is None:
+        optimized_data = IndexOptimizer.decompress_index(optimized_index_file) or {"doc_id_map": {}, "index": {}}
+    total_docs = len(optimized_data["doc_id_map"])
+    ranges = [list(shard_range(total_docs, num_shards, shard_id)) for shard_id in range(num_shards)]
+    shard_size = max((hi - lo for lo, hi in ranges), default=0) or 1
+
+    shards = _split_shards(optimized_data, num_shards, shard_size, range(num_shards))
+    _write_shards(shards, ranges, num_shards, shard_size, _source_generation(optimized_index_file), shard_dir)
+    print(f"✅ 分片切分完成，耗时: {time.time() - start_time:.2f} 秒")
+
+
+def update_shards(changed_int_ids, optimized_data, num_shards=INDEX_SHARDS,
+                  optimized_index_file="optimized_index.msgpack", shard_dir=SHARD_DIR):
+    """
+    增量更新后只重写包含变化文档的分片，其他分片文件保持不变
+
+    优化索引的增量更新保留已有文档的整数ID，新文档的ID接在最后、归入最后一个分片，
+    因此沿用清单中的区间即可；分片数或格式变化时退回完整切分。
+    """
+    manifest = _read_manifest(shard_dir)
+    if not manifest or manifest.get("format") != SHARD_FORMAT or manifest["num_shards"] != num_shards \
+            or not all(os.path.exists(shard_file(shard_dir, shard_id)) for shard_id in range(num_shards)):
+        return build_shards(num_shards, optimized_index_file, shard_dir, optimized_data)
+
+    start_time = time.time()
+    shard_size, ranges = manifest["shard_size"], manifest["ranges"]
+    ranges[-1][1] = max(ranges[-1][1], len(optimized_data["doc_id_map"]))
+    shard_ids = {min(int_doc_id // shard_size, num_shards - 1) for int_doc_id in changed_int_ids}
+
+    shards = _split_shards(optimized_data, num_shards, shard_size, shard_ids)
+    _write_shards(shards, ranges, num_shards, shard_size, _source_generation(optimized_index_file), shard_dir)
+    print(f"✅ 已重写 {len(shard_ids)}/{num_shards} 个分片，耗时: {time.time() - start_time:.2f} 秒")
+
+
+def _read_shard_file(path):
+    with open(path, "rb") as f:
+        return msgpack.unpackb(zlib.decompress(f.read()), raw=False, strict_map_key=False)
+
+
+def shards_up_to_date(num_shards=INDEX_SHARDS, optimized_index_file="optimized_index.msgpack", shard_dir=SHARD_DIR):
+    """分片文件是否齐全、格式为当前版本，且是从当前的优化索引切分出来的"""
+    manifest = _read_manifest(shard_dir)
+    if not manifest or manifest.get("format") != SHARD_FORMAT or manifest["num_shards"] != num_shards:
+        return False
+    if not all(os.path.exists(shard_file(shard_dir, shard_id)) for shard_id in range(num_shards)):
+        return False
+    return manifest["generation"] == _source_generation(optimized_index_file)
+
+
+class IndexShard:
+    """
+    单个索引分片，只从自己的分片文件中加载整数文档ID落在 [lo, hi) 区间内的倒排记录
+
+    分片在本地完成词条扩展（通配符和拼写容错）、匹配和打分：打分使用协调者汇总后下发的
+    全局文档数、平均文档长度和文档频率，因此各分片的分数可以直接比较和合并。
+    """
+
+    def __init__(self, shard_id, num_shards, shard_dir=SHARD_DIR):
+        self.shard_id = shard_id
+        self.num_shards = num_shards
+
+        data = _read_shard_file(shard_file(shard_dir, shard_id))
+        if data["num_shards"] != num_shards:
+            raise ValueError(f"分片文件按 {data['num_shards']} 个分片切分，与配置的 {num_shards} 个不一致")
+        self.lo, self.hi = data["range"]
+        self.reverse_doc_id_map = data["doc_ids"]  # 整数ID -> 原始ID
+        self.doc_lengths = data["doc_lengths"]
+        self.total_length = sum(self.doc_lengths.values())
+        self.index = data["index"]
+        # 只包含大小写不同的词条: 小写 -> 索引中的词条
+        self.case_variants = {term.lower(): term for term in self.index if term != term.lower()}
+        # 通配符扩展用的有序词条表，拼写容错用的按长度分组的词条表，首次使用时构建
+        self._sorted_terms = None
+        self._terms_by_length = None
+
+    def _postings(self, term):
+        term = term.lower()
+        postings = self.index.get(term)
+        if postings is None and term in self.case_variants:
+            postings = self.index[self.case_variants[term]]
+        return postings or {}
+
+    def _doc_set(self, terms):
+        doc_ids = set()
+        for term in terms:
+            doc_ids.update(self._postings(term))
+        return doc_ids
+
+    @staticmethod
+    def _positions(diff_positions):
+        positions = []
+        current_pos = 0
+        for diff in diff_positions:
+            current_pos += diff
+            positions.append(current_pos)
+        return positions
+
+    def _expand_wildcard(self, pattern):
+        """在本分片的词条中扩展通配符模式，返回本分片文档频率最高的 WILDCARD_MAX_EXPANSIONS 个 {词条: 文档频率}"""
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self.index)
+        terms = self._sorted_terms
+        prefix = pattern.partition("*")[0]
+        if not prefix and not pattern_kgrams(pattern):
+            return {}  # 例如 *a*，与有序词典一样不做扩展
+
+        lo = bisect.bisect_left(terms, prefix)
+        hi = bisect.bisect_left(terms, prefix + "\uffff", lo)
+        matcher = re.compile(".*".join(re.escape(part) for part in pattern.split("*")))
+        matched = ((term, len(self.index[term])) for term in terms[lo:hi] if matcher.fullmatch(term))
+        return dict(heapq.nlargest(WILDCARD_MAX_EXPANSIONS, matched, key=lambda item: item[1]))
+
+    def _fuzzy_candidates(self, term):
+        """返回本分片中与 term 编辑距离不超过允许值的词条 {词条: [编辑距离, 文档频率]}"""
+        max_distance = max_distance_for(term)
+        if max_distance <= 0:
+            return {}
+        if self._terms_by_length is None:
+            self._terms_by_length = {}
+            for candidate in self.index:
+                self._terms_by_length.setdefault(len(candidate), []).append(candidate)
+
+        candidates = {}
+        for length in range(len(term) - max_distance, len(term) + max_distance + 1):
+            for candidate in self._terms_by_length.get(length, ()):
+                distance = edit_distance(term, candidate, max_distance)
+                if distance <= max_distance and candidate != term:
+                    candidates[candidate] = [distance, len(self.index[candidate])]
+        return candidates
+
+    def stats(self, terms):
+        """本分片的文档数、文档总长度和各词条的文档频率，由协调者汇总为全局统计"""
+        return {
+            "doc_count": len(self.reverse_doc_id_map),
+            "total_length": self.total_length,
+            "df": {term: len(self._postings(term)) for term in terms}
+        }
+
+    def expand(self, terms, patterns, fuzzy):
+        """
+        关键词查询的词条扩展
+
+        返回本分片的统计 (见 stats)，以及每个通配符模式在本分片中的扩展结果；
+        fuzzy 为 True 时，对本分片中不存在的词条给出拼写相近的候选，由协调者按全局文档频率决定是否采用。
+        """
+        result = self.stats(terms)
+        result["wildcards"] = {pattern: self._expand_wildcard(pattern) for pattern in patterns}
+        result["fuzzy"] = {term: self._fuzzy_candidates(term) for term in terms if fuzzy and not result["df"][term]}
+        return result
+
+    def _match(self, query):
+        """按查询求出本分片中命中的整数文档ID集合，query 的格式见 ShardedIndex.search"""
+        kind = query["type"]
+        if kind == "phrase":
+            postings_list = [self._postings(term) for term in query["terms"]]
+            if not postings_list or not all(postings_list):
+                return set()
+            common_docs = set.intersection(*(set(postings) for postings in postings_list))
+            return {int_doc_id for int_doc_id in common_docs
+                    if search_functions.is_phrase_match([self._positions(postings[int_doc_id])
+                                                         for postings in postings_list])}
+
+        if kind == "proximity":
+            postings1, postings2 = self._postings(query["term1"]), self._postings(query["term2"])
+            matched = set()
+            for int_doc_id in set(postings1) & set(postings2):
+                positions1 = self._positions(postings1[int_doc_id])
+                positions2 = self._positions(postings2[int_doc_id])
+                i, j = 0, 0
+                while i < len(positions1) and j < len(positions2):
+                    if abs(positions1[i] - positions2[j]) <= query["distance"]:
+                        matched.add(int_doc_id)
+                        break
+                    if positions1[i] < positions2[j]:
+                        i += 1
+                    else:
+                        j += 1
+            return matched
+
+        # 布尔匹配：组内任意词条命中即可；or 各组求并，and 各组求交，and_not 第一组减去第二组
+        doc_sets = [self._doc_set(terms) for terms in query["groups"]]
+        if query["op"] == "and":
+            return set.intersection(*doc_sets)
+        if query["op"] == "and_not":
+            return doc_sets[0] - doc_sets[1]
+        return set().union(*doc_sets)
+
+    def search(self, query, weights, global_stats, method="bm25", k1=1.5, b=0.75):
+        """
+        在本分片中匹配并打分
+
+        参数:
+        - query: 查询描述，见 ShardedIndex.search
+        - weights: 参与打分的词条及其权重 {词条: 权重}
+        - global_stats: 协调者汇总的全局统计 (doc_count, avg_doc_length, df)
+        - method: 排序方法 (tfidf或bm25)，公式与 evaluation 中的实现相同，但 IDF 使用全局统计
+
+        返回:
+        - 本分片全部命中文档的 [(原始文档ID, 分数), ...]，按分数降序、文档ID升序排列
+        """
+        matched = self._match(query)
+        total_docs = global_stats["doc_count"] or 1
+        avg_doc_length = global_stats["avg_doc_length"] or 1
+
+        scoring = []
+        for term, weight in weights.items():
+            df = global_stats["df"].get(term, 0)
+            postings = self._postings(term)
+            if not df or not postings:
+                continue
+            if method == "bm25":
+                idf = math.log((total_docs - df + 0.5) / (df + 0.5) + 1)
+            else:
+                idf = math.log((total_docs + 1) / (df + 1)) + 1
+            scoring.append((postings, weight * idf))
+
+        scored = []
+        for int_doc_id in matched:
+            doc_length = self.doc_lengths.get(int_doc_id) or 1
+            score = 0.0
+            for postings, weighted_idf in scoring:
+                diff_positions = postings.get(int_doc_id)
+                if diff_positions is None:
+                    continue
+                tf = len(diff_positions) or 1
+                if method == "bm25":
+                    score += weighted_idf * (tf * (k1 + 1)) / (tf + k1 * (1 - b + b * doc_length / avg_doc_length))
+                else:
+                    score += weighted_idf * tf / doc_length
+            scored.append((-score, self.reverse_doc_id_map.get(int_doc_id, str(int_doc_id))))
+        scored.sort()
+        return [(doc_id, -negative_score) for negative_score, doc_id in scored]
+
+
+def _shard_worker(conn, shard_id, num_shards, shard_dir):
+    """分片工作进程：加载分片后循环处理协调者发来的命令"""
+    shard = IndexShard(shard_id, num_shards, shard_dir)
+    conn.send(("ready", {"shard_id": shard_id, "range": (shard.lo, shard.hi), "terms": len(shard.index)}))
+
+    handlers = {"stats": shard.stats, "expand": shard.expand, "search": shard.search}
+    while True:
+        try:
+            command, payload = conn.recv()
+        except EOFError:
+            break
+
+        if command == "stop":
+            break
+        handler = handlers.get(command)
+        if handler is None:
+            conn.send(("error", f"未知命令: {command}"))
+            continue
+        try:
+            conn.send(("ok", handler(**payload)))
+        except Exception as e:
+            conn.send(("error", f"分片 {shard_id} 执行 {command} 失败: {str(e)}"))
+
+    conn.close()
+
+
+def _merge_stats(shard_stats, terms):
+    """把各分片的统计汇总为全局统计"""
+    doc_count = sum(stats["doc_count"] for stats in shard_stats)
+    total_length = sum(stats["total_length"] for stats in shard_stats)
+    return {
+        "doc_count": doc_count,
+        "avg_doc_length": total_length / doc_count if doc_count else 0,
+        "df": {term: sum(stats["df"].get(term, 0) for stats in shard_stats) for term in terms}
+    }
+
+
+class ShardedIndex:
+    """
+    分片索引协调者
+
+    将索引按文档ID区间切分为 N 个分片，每个分片由一个工作进程（本地模拟节点）持有。
+    一次查询分两到三轮分发：(关键词查询) 各分片扩展词条 -> 汇总全局文档数、平均长度和文档频率
+    -> 各分片用全局统计为自己区间内的命中文档打分并排好序，协调者用堆按分数归并各分片的结果。
+    协调者本身不加载倒排索引。
+    """
+
+    def __init__(self, num_shards=INDEX_SHARDS, optimized_index_file="optimized_index.msgpack", shard_dir=SHARD_DIR):
+        self.num_shards = num_shards
+        self.optimized_index_file = optimized_index_file
+        self.shard_dir = shard_dir
+        self._workers = []
+        self._conns = []
+        # 管道不是线程安全的：一次分发和收集的全过程持有锁，保证每个请求收到的是自己的响应
+        self._lock = threading.Lock()
+
+    def start(self):
+        """启动所有分片工作进程，等待它们加载完成；分片文件缺失或过期时先重新切分"""
+        with self._lock:
+            if self._workers:
+                return
+
+            if not shards_up_to_date(self.num_shards, self.optimized_index_file, self.shard_dir):
+                build_shards(self.num_shards, self.optimized_index_file, self.shard_dir)
+
+            start_time = time.time()
+            for shard_id in range(self.num_shards):
+                parent_conn, child_conn = mp.Pipe()
+                process = mp.Process(target=_shard_worker,
+                                          args=(child_conn, shard_id, self.num_shards, self.shard_dir),
+                                          daemon=True)
+                process.start()
+                self._workers.append(process)
+                self._conns.append(parent_conn)
+
+            for conn in self._conns:
+                _, info = conn.recv()
+                print(f"✅ 分片 {info['shard_id']} 已就绪，文档区间 {info['range']}，包含 {info['terms']} 个词条")
+            print(f"✅ {self.num_shards} 个分片启动完成，耗时: {time.time() - start_time:.2f} 秒")
+
+    def stop(self):
+        """停止所有分片工作进程"""
+        with self._lock:
+            for conn in self._conns:
+                try:
+                    conn.send(("stop", None))
+                except (BrokenPipeError, OSError):
+                    pass
+            for process in self._workers:
+                process.join(timeout=5)
+            self._workers = []
+            self._conns = []
+
+    def _scatter_gather(self, command, payload):
+        """向所有分片发送同一命令，返回各分片的结果列表"""
+        if not self._workers:
+            self.start()
+
+        with self._lock:
+            for conn in self._conns:
+                conn.send((command, payload))
+
+            results, errors = [], []
+            for conn in self._conns:
+                try:
+                    status, result = conn.recv()
+                except EOFError:
+                    status, result = "error", "分片工作进程已退出"
+                if status == "ok":
+                    results.append(result)
+                else:
+                    errors.append(result)
+        if errors:
+            raise RuntimeError("; ".join(errors))
+        return results
+
+    def global_stats(self, terms):
+        """汇总全局文档数、平均文档长度和各词条的文档频率"""
+        return _merge_stats(self._scatter_gather("stats", {"terms": terms}), terms)
+
+    def expand_keywords(self, keywords, patterns):
+        """
+        在各分片中扩展关键词查询，返回 ({词条: 权重}, 全局统计)
+
+        权重规则与 search_functions.weighted_query_terms 相同：所有分片中都不存在的词条按拼写容错扩展，
+        候选的全局文档频率不低于 MIN_DOCUMENT_FREQUENCY，同一个词的候选按 1 / (1 + 编辑距离) 和文档频率加权；
+        通配符取全局文档频率最高的 WILDCARD_MAX_EXPANSIONS 个词条，按文档频率分配权重。
+        各分片只返回本地文档频率最高的扩展词条，因此通配符的取舍是近似的，但权重和打分使用精确的全局统计。
+        """
+        shard_results = self._scatter_gather("expand", {"terms": keywords, "patterns": patterns,
+                                                        "fuzzy": bool(FUZZY_MAX_EXPANSIONS)})
+        stats = _merge_stats(shard_results, keywords)
+        if not patterns and all(stats["df"].values()):
+            return {term: 1.0 for term in keywords}, stats  # 无需扩展，统计可以直接用于打分
+
+        groups = []  # [(词条列表, 词条 -> 权重计算函数)]
+        for term in keywords:
+            if stats["df"][term] or not FUZZY_MAX_EXPANSIONS:
+                groups.append(([term], None))
+                continue
+            candidates = {}
+            for result in shard_results:
+                for candidate, (distance, df) in result["fuzzy"].get(term, {}).items():
+                    previous = candidates.get(candidate, (distance, 0))
+                    candidates[candidate] = (distance, previous[1] + df)
+            matches = sorted(((distance, -df, candidate) for candidate, (distance, df) in candidates.items()
+                              if df >= MIN_DOCUMENT_FREQUENCY))[:FUZZY_MAX_EXPANSIONS]
+            distances = {candidate: distance for distance, _, candidate in matches}
+            groups.append(([candidate for _, _, candidate in matches], distances))
+        for pattern in patterns:
+            frequencies = {}
+            for result in shard_results:
+                for term, df in result["wildcards"][pattern].items():
+                    frequencies[term] = frequencies.get(term, 0) + df
+            top = heapq.nlargest(WILDCARD_MAX_EXPANSIONS, frequencies.items(), key=lambda item: item[1])
+            groups.append(([term for term, _ in top], {}))
+
+        terms = list(dict.fromkeys(term for group_terms, _ in groups for term in group_terms))
+        stats = self.global_stats(terms)
+        weights = {}
+        for group_terms, distances in groups:
+            total_df = sum(stats["df"][term] for term in group_terms) or 1
+            for term in group_terms:
+                if distances is None:
+                    weight = 1.0
+                else:
+                    weight = stats["df"][term] / total_df / (1 + distances.get(term, 0))
+                weights[term] = max(weight, weights.get(term, 0.0))
+        return weights, stats
+
+    def search(self, query, weights, stats=None, method="bm25"):
+        """
+        各分片匹配并打分，协调者用堆归并各分片已排好序的结果
+
+        参数:
+        - query: {"type": "match", "groups": [...], "op": "or"|"and"|"and_not"}、
+          {"type": "phrase", "terms": [...]} 或 {"type": "proximity", "term1": ..., "term2": ..., "distance": ...}
+        - weights: 参与打分的词条及其权重 {词条: 权重}
+        - stats: 全局统计，为 None 时先汇总
+        - method: 排序方法 (tfidf或bm25)
+
+        返回:
+        - 全部命中文档的 [(原始文档ID, 分数), ...]，按分数降序排列
+        """
+        stats = stats or self.global_stats(list(weights))
+        shard_hits = self._scatter_gather("search", {"query": query, "weights": weights, "global_stats": stats,
+                                                     "method": method})
+        return list(heapq.merge(*shard_hits, key=lambda hit: (-hit[1], hit[0])))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class ShardedSearchBackend:
+    """
+    基于分片索引的检索后端
+
+    查询解析与 search_functions 中的检索函数相同；词条扩展、匹配和打分都在分片工作进程中完成，
+    打分使用全局 IDF 统计，因此 tfidf 和 bm25 都是原生排序。协调者按文档过滤器裁剪归并后的结果，
+    只为排名前 limit 的结果回表读取完整新闻，其余结果只有 id 和 score（总数和分面计数仍基于全部命中）。
+    """
+
+    name = "sharded"
+    native_methods = ("tfidf", "bm25")
+
+    def __init__(self, sharded_index=None):
+        self.sharded_index = sharded_index or ShardedIndex()
+
+    def _rank(self, query, weights, doc_filter, limit, method, stats=None):
+        hits = self.sharded_index.search(query, weights, stats, method)
+        if doc_filter is not None:
+            hits = [hit for hit in hits if hit[0] in doc_filter]
+
+        results = [{"id": doc_id, "score": score} for doc_id, score in hits]
+        head = results if limit is None else results[:limit]
+        if head:
+            hydrated = {row["id"]: row for row in
+                        fetch_news_db.fetch_news_from_db([result["id"] for result in head], search_functions.db_file)}
+            for result in head:
+                result.update(hydrated.get(result["id"], {}))
+        return results
+
+    def keyword_search(self, query, doc_filter=None, limit=None, method="bm25"):
+        """关键词搜索：任意关键词命中即可，不在索引中的词条和通配符在各分片中扩展"""
+        keywords, patterns = search_functions.parse_keyword_query(query)
+        if not keywords and not patterns:
+            return "No valid keywords in the query."
+        weights, stats = self.sharded_index.expand_keywords(keywords, patterns)
+        if not weights:
+            return []
+        return self._rank({"type": "match", "groups": [list(weights)], "op": "or"}, weights, doc_filter, limit,
+                          method, stats)
+
+    def phrase_search(self, query, doc_filter=None, limit=None, method="bm25"):
+        """短语搜索，格式如 "apple banana" """
+        match = re.match(r'"(.+?)"', query.strip().lower())
+        if not match:
+            return "Invalid phrase search format"
+        terms = search_functions.preprocess_query(match.group(1))
+        if not terms:
+            return []
+        return self._rank({"type": "phrase", "terms": terms}, dict.fromkeys(terms, 1.0), doc_filter, limit, method)
+
+    def proximity_search(self, query, doc_filter=None, limit=None, method="bm25"):
+        """近邻搜索，格式如 #3 apple banana"""
+        match = re.match(r"#(\d+)\s+(\w+)\s+(\w+)", query.strip().lower())
+        if not match:
+            return "Invalid proximity search format"
+        term1 = search_functions.STEMMER.stem(match.group(2))
+        term2 = search_functions.STEMMER.stem(match.group(3))
+        return self._rank({"type": "proximity", "term1": term1, "term2": term2, "distance": int(match.group(1))},
+                          dict.fromkeys([term1, term2], 1.0), doc_filter, limit, method)
+
+    def _boolean(self, query, pattern, op, error, doc_filter, limit, method):
+        match = re.match(pattern, query.strip().lower())
+        if not match:
+            return error
+        term_a = search_functions.preprocess_query(match.group(1))
+        term_b = search_functions.preprocess_query(match.group(2))
+        if not term_a and (op != "or" or not term_b):
+            return []
+        if op == "and" and not term_b:
+            return []
+        # AND NOT 只按第一组的词条打分
+        weights = dict.fromkeys(term_a if op == "and_not" else term_a + term_b, 1.0)
+        return self._rank({"type": "match", "groups": [term_a, term_b], "op": op}, weights, doc_filter, limit, method)
+
+    def boolean_search_and_not(self, query, doc_filter=None, limit=None, method="bm25"):
+        """布尔搜索（AND NOT）"""
+        return self._boolean(query, r"(.+?)\s+and\s+not\s+(.+)", "and_not", "Invalid AND NOT query format",
+                             doc_filter, limit, method)
+
+    def boolean_search_and(self, query, doc_filter=None, limit=None, method="bm25"):
+        """布尔搜索（AND）"""
+        return self._boolean(query, r"(.+?)\s+and\s+(.+)", "and", "Invalid AND query format", doc_filter, limit,
+                             method)
+
+    def boolean_search_or(self, query, doc_filter=None, limit=None, method="bm25"):
+        """布尔搜索（OR）"""
+        return self._boolean(query, r"(.+?)\s+or\s+(.+)", "or", "Invalid OR query format", doc_filter, limit,
+                             method)
+
+
+if __name__ == "__main__":
+    import sys
+
+    # 测试分片检索，例如: python sharded_index.py apple iphone
+    test_query = " ".join(sys.argv[1:]) or "technology"
+    backend = ShardedSearchBackend()
+    with backend.sharded_index:
+        start = time.time()
+        hits = backend.keyword_search(test_query, limit=10)
+        hits = hits if isinstance(hits, list) else []
+        print(f"分片检索完成，耗时: {time.time() - start:.4f} 秒")
+        for hit in hits[:10]:
+            print(f"{hit['id']}\t{hit['title']}")
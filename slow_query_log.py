@@ -0,0 +1,119 @@
+"""
+慢查询日志
+
+查询耗时超过 SLOW_QUERY_THRESHOLD_MS 时，把查询文本、执行计划（查询类型、后端、排序方法、过滤条件）、
+分阶段耗时、涉及的倒排表长度和回表行数追加写入 JSONL 日志。
+
+按 SLOW_QUERY_PROFILE_RATE 的比例抽样的查询会在 cProfile 下运行，其中的慢查询额外保存一份
+.prof 文件（可用 python -m pstats 或 snakeviz 查看），目录中最多保留 SLOW_QUERY_MAX_PROFILES 个。
+"""
+import cProfile
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from config import (SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_LOG, SLOW_QUERY_PROFILE_RATE, SLOW_QUERY_PROFILE_DIR,
+                    SLOW_QUERY_MAX_PROFILES)
+
+logger = logging.getLogger(__name__)
+
+
+class SlowQueryLog:
+    """记录慢查询及其 profile 文件"""
+
+    def __init__(self, threshold_ms=SLOW_QUERY_THRESHOLD_MS, log_file=SLOW_QUERY_LOG,
+                 profile_rate=SLOW_QUERY_PROFILE_RATE, profile_dir=SLOW_QUERY_PROFILE_DIR,
+                 max_profiles=SLOW_QUERY_MAX_PROFILES):
+        self.threshold_ms = threshold_ms
+        self.log_file = log_file
+        self.profile_rate = profile_rate
+        self.profile_dir = profile_dir
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.threshold_ms is not None
+
+    def start_profile(self):
+        """按抽样比例决定是否在 cProfile 下运行本次查询，返回已启动的 profiler 或 None"""
+        if not self.enabled or self.profile_rate <= 0 or random.random() >= self.profile_rate:
+            return None
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # 同一时间只能有一个 profiler 生效（Python 3.12+），这次查询不做 profile
+            return None
+        return profiler
+
+    @staticmethod
+    def stop_profile(profiler):
+        if profiler is not None:
+            profiler.disable()
+
+    def record(self, query, plan, elapsed, trace, profiler=None):
+        """
+        如果查询超过阈值，则写入慢查询日志
+
+        参数:
+        - query: 查询文本
+        - plan: 执行计划字典（查询类型、后端、排序方法、过滤条件等）
+        - elapsed: 查询总耗时（秒）
+        - trace: 本次查询的 Trace
+        - profiler: start_profile() 返回的 profiler
+
+        返回:
+        - 是否被记录为慢查询
+        """
+        elapsed_ms = elapsed * 1000
+        if not self.enabled or elapsed_ms < self.threshold_ms:
+            return False
+
+        entry = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "query": query,
+            "plan": plan,
+            "elapsed_ms": round(elapsed_ms, 3),
+            "stages_ms": {name: round(stage_elapsed * 1000, 3) for name, stage_elapsed in trace.stages.items()},
+            "postings": dict(trace.postings),
+            "rows_hydrated": trace.counters.get("rows_hydrated", 0),
+        }
+        if profiler is not None:
+            entry["profile"] = self._dump_profile(profiler, query)
+
+        with self._lock:
+            with open(self.log_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+        logger.warning(f"🐢 慢查询: '{query}'，耗时: {elapsed_ms:.1f} ms，阶段: {entry['stages_ms']}")
+        return True
+
+    def _dump_profile(self, profiler, query):
+        """保存 profile 文件，并删除超出保留上限的最旧文件"""
+        os.makedirs(self.profile_dir, exist_ok=True)
+        digest = hashlib.md5(query.encode("utf-8")).hexdigest()[:8]
+        path = os.path.join(self.profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{digest}.prof")
+        profiler.dump_stats(path)
+
+        with self._lock:
+            profiles = sorted(
+                (os.path.join(self.profile_dir, name) for name in os.listdir(self.profile_dir)
+                 if name.endswith(".prof")),
+                key=os.path.getmtime
+            )
+            for stale in profiles[:max(len(profiles) - self.max_profiles, 0)]:
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+        return path
+
+
+# 创建全局实例，用于应用中访问
+slow_query_log = SlowQueryLog()
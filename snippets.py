@@ -0,0 +1,137 @@
+"""
+检索结果摘要生成
+
+只为当前页的结果生成摘要：对正文分词并记录每个词在原文中的字符偏移，
+用与索引构建相同的停用词表和词干提取找出命中查询词的位置，
+再选出覆盖查询词最多（其次命中次数最多）的窗口，只返回这段文本，并用 <mark> 标出命中的词。
+"""
+import html
+import re
+from functools import lru_cache
+
+from nltk.corpus import stopwords
+from nltk.stem import PorterStemmer
+
+# 摘要窗口包含的词数
+SNIPPET_WINDOW = 30
+# 正文中找不到查询词时，退回到描述的前多少个字符
+SNIPPET_FALLBACK_CHARS = 300
+
+TOKEN_PATTERN = re.compile(r"\w+")
+# 近邻查询的 #n 前缀不是查询词
+PROXIMITY_PREFIX = re.compile(r"#\d+")
+
+STOPWORDS = set(stopwords.words("english"))
+STEMMER = PorterStemmer()
+
+
+@lru_cache(maxsize=100000)
+def stem(word):
+    """对小写单词做词干提取（新闻用词高度重复，缓存后同一个词只计算一次）"""
+    return STEMMER.stem(word)
+
+
+def query_terms(query):
+    """
+    提取查询中用于高亮的词干集合
+
+    布尔运算符 and/or/not 本身就是停用词，会和其他停用词一起被去掉。
+    """
+    words = TOKEN_PATTERN.findall(PROXIMITY_PREFIX.sub(" ", query.lower()))
+    return {stem(word) for word in words if word not in STOPWORDS}
+
+
+def _matches(tokens, terms):
+    """返回命中查询词的 (词序号, 词干) 列表"""
+    initials = {term[0] for term in terms}
+    matches = []
+    for i, token in enumerate(tokens):
+        word = token.group().lower()
+        # 词干提取只改写词尾，首字母不同的词不可能命中，跳过以减少词干提取次数
+        if word[0] not in initials or word in STOPWORDS:
+            continue
+        term = stem(word)
+        if term in terms:
+            matches.append((i, term))
+    return matches
+
+
+def _best_window(matches, window):
+    """在命中位置上滑动窗口，返回覆盖不同查询词最多、其次命中次数最多的窗口起点"""
+    best_start, best_score = matches[0][0], (0, 0)
+    lo = 0
+    term_counts = {}
+    for hi, (position, term) in enumerate(matches):
+        term_counts[term] = term_counts.get(term, 0) + 1
+        while position - matches[lo][0] >= window:
+            lo_term = matches[lo][1]
+            term_counts[lo_term] -= 1
+            if not term_counts[lo_term]:
+                del term_counts[lo_term]
+            lo += 1
+        score = (len(term_counts), hi - lo + 1)
+        if score > best_score:
+            best_start, best_score = matches[lo][0], score
+    return best_start
+
+
+def _highlight(text, tokens, start, end, matched):
+    """把 tokens[start:end] 覆盖的原文转义成 HTML，并为命中的词加上 <mark>"""
+    parts = []
+    cursor = tokens[start].start()
+    for i in range(start, end):
+        token = tokens[i]
+        if i in matched:
+            parts.append(html.escape(text[cursor:token.start()]))
+            parts.append(f"<mark>{html.escape(token.group())}</mark>")
+            cursor = token.end()
+    parts.append(html.escape(text[cursor:tokens[end - 1].end()]))
+
+    snippet = "".join(parts)
+    if start > 0:
+        snippet = "..." + snippet
+    if tokens[end - 1].end() < len(text.rstrip()):
+        snippet += "..."
+    return snippet
+
+
+def best_snippet(text, terms, window=SNIPPET_WINDOW):
+    """
+    从文本中选出最佳摘要窗口
+
+    参数:
+    - text: 原文
+    - terms: query_terms 返回的词干集合
+    - window: 窗口包含的词数
+
+    返回:
+    - 高亮后的 HTML 摘要；文本中没有查询词时返回 None
+    """
+    if not text or not terms:
+        return None
+    tokens = list(TOKEN_PATTERN.finditer(text))
+    matches = _matches(tokens, terms)
+    if not matches:
+        return None
+
+    start = _best_window(matches, window)
+    # 命中的词尽量放在窗口中间，而不是紧贴开头
+    last = max(position for position, _ in matches if position < start + window)
+    start = max(0, min(start - (window - (last - start + 1)) // 2, len(tokens) - window))
+    end = min(start + window, len(tokens))
+    matched = {position for position, _ in matches if start <= position < end}
+    return _highlight(text, tokens, start, end, matched)
+
+
+def make_snippet(row, terms):
+    """
+    为一条检索结果生成摘要：优先取正文中的最佳窗口，其次是描述中的，都没有命中时返回截断的描述
+    """
+    snippet = best_snippet(row.get("content"), terms) or best_snippet(row.get("snippet"), terms)
+    if snippet:
+        return snippet
+
+    description = row.get("snippet") or ""
+    if len(description) > SNIPPET_FALLBACK_CHARS:
+        return html.escape(description[:SNIPPET_FALLBACK_CHARS]) + "..."
+    return html.escape(description)
@@ -0,0 +1,251 @@
+import bisect
+import heapq
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter, namedtuple
+
+import msgpack
+from nltk.corpus import stopwords
+from nltk.stem import PorterStemmer
+
+from config import DB_PATH
+from index_optimizer import IndexOptimizer
+
+STOPWORDS = set(stopwords.words("english"))
+WORD_PATTERN = re.compile(r"[a-z0-9][a-z0-9'\-]*")
+
+# 一次加载得到的完整建议索引，整体发布后不再修改
+SuggestionData = namedtuple("SuggestionData", ["keys", "weights", "prefix_table", "max_tree"])
+
+
+def normalize_text(text):
+    """将标题或查询规范化为小写、单空格分隔的词序列"""
+    return " ".join(WORD_PATTERN.findall(text.lower()))
+
+
+class SuggestionIndex:
+    """
+    搜索建议索引
+
+    在索引构建时从新闻标题中抽取 1~3 元词组，按出现次数加权（单词再加上其词干在倒排索引中的文档频率），
+    存为按字典序排列的紧凑数组。查询时：
+    1. 短前缀 (长度不超过 PREFIX_TABLE_LENGTH) 直接查预先计算好的 top-k 表
+    2. 更长的前缀用二分查找定位有序数组中的区间，再用权重上的区间最大值树按权重从高到低
+       取出区间内的前 k 个，耗时只与 k 和 log(候选数) 有关，与区间大小无关
+
+    建议索引在 optimize 时构建，查询路径只加载已有文件，不会在请求中构建。
+    各数组作为一个 SuggestionData 整体发布，加载在锁内进行，并发请求只解压一次。
+    """
+
+    PREFIX_TABLE_LENGTH = 4
+    TOP_K = 10
+
+    def __init__(self, suggestion_file="suggestion_index.msgpack",
+                 optimized_index_file="optimized_index.msgpack", db_path=DB_PATH,
+                 max_ngram=3, min_phrase_count=2):
+        self.suggestion_file = suggestion_file
+        self.optimized_index_file = optimized_index_file
+        self.db_path = db_path
+        self.max_ngram = max_ngram
+        self.min_phrase_count = min_phrase_count
+
+        self._data = None
+        self._lock = threading.Lock()
+
+    def build(self):
+        """从数据库标题和倒排索引词典构建建议索引"""
+        print("📌 开始构建搜索建议索引...")
+        start_time = time.time()
+
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT title FROM news")
+        titles = [row[0] for row in cursor.fetchall() if row[0]]
+        conn.close()
+
+        # 统计标题中的 1~3 元词组，词组首尾不能是停用词
+        counts = Counter()
+        for title in titles:
+            words = normalize_text(title).split()
+            for n in range(1, self.max_ngram + 1):
+                for i in range(len(words) - n + 1):
+                    if words[i] in STOPWORDS or words[i + n - 1] in STOPWORDS:
+                        continue
+                    counts[" ".join(words[i:i + n])] += 1
+
+        # 单词额外加上其词干在索引中的文档频率，多词词组只保留出现多次的
+        optimized_data = IndexOptimizer.decompress_index(self.optimized_index_file) or {"index": {}}
+        index = optimized_data["index"]
+        stemmer = PorterStemmer()
+
+        entries = {}
+        for phrase, count in counts.items():
+            if " " in phrase:
+                if count >= self.min_phrase_count:
+                    entries[phrase] = count
+            else:
+                entries[phrase] = count + len(index.get(stemmer.stem(phrase), ()))
+
+        keys = sorted(entries)
+        weights = [entries[key] for key in keys]
+        prefix_table = self._build_prefix_table(keys, weights)
+        max_tree = self._build_max_tree(weights)
+
+        with open(self.suggestion_file, "wb") as f:
+            f.write(zlib.compress(msgpack.packb({
+                "keys": keys,
+                "weights": weights,
+                "prefix_table": prefix_table,
+                "max_tree": max_tree.tobytes()
+            }, use_bin_type=True)))
+
+        self._set_data(keys, weights, prefix_table, max_tree)
+        print(f"✅ 搜索建议索引构建完成，共 {len(keys)} 个候选，耗时: {time.time() - start_time:.2f} 秒")
+
+    def _build_prefix_table(self, keys, weights):
+        """为所有短前缀预先计算权重最高的 TOP_K 个候选（存储候选在有序数组中的下标）"""
+        candidates = {}
+        for i, key in enumerate(keys):
+            for length in range(1, min(len(key), self.PREFIX_TABLE_LENGTH) + 1):
+                heap = candidates.setdefault(key[:length], [])
+                if len(heap) < self.TOP_K:
+                    heapq.heappush(heap, (weights[i], -i))
+                elif weights[i] > heap[0][0]:
+                    heapq.heapreplace(heap, (weights[i], -i))
+
+        return {prefix: [-i for _, i in sorted(heap, reverse=True)] for prefix, heap in candidates.items()}
+
+    @staticmethod
+    def _better(weights, i, j):
+        """权重更高者优先，权重相同时字典序靠前者优先（与前缀表一致）"""
+        return i if (weights[i], -i) >= (weights[j], -j) else j
+
+    @classmethod
+    def _build_max_tree(cls, weights):
+        """
+        构建权重上的区间最大值树（自底向上的线段树），节点存放区间内权重最高的候选下标
+
+        叶子 i 位于 tree[n + i]，内部节点 tree[p] 取 tree[2p] 和 tree[2p + 1] 中较优者。
+        """
+        n = len(weights)
+        tree = array("I", [0] * n) + array("I", range(n))
+        for p in range(n - 1, 0, -1):
+            tree[p] = cls._better(weights, tree[2 * p], tree[2 * p + 1])
+        return tree
+
+    def _range_best(self, data, lo, hi):
+        """返回有序数组区间 [lo, hi) 中权重最高的候选下标"""
+        weights, tree = data.weights, data.max_tree
+        n = len(weights)
+        best = None
+        lo += n
+        hi += n
+        while lo < hi:
+            if lo & 1:
+                best = tree[lo] if best is None else self._better(weights, best, tree[lo])
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                best = tree[hi] if best is None else self._better(weights, best, tree[hi])
+            lo >>= 1
+            hi >>= 1
+        return best
+
+    def _top_in_range(self, data, lo, hi, limit):
+        """按权重从高到低取出区间 [lo, hi) 中的前 limit 个候选下标"""
+        top = []
+        heap = []
+        if lo < hi:
+            i = self._range_best(data, lo, hi)
+            heap.append((-data.weights[i], i, lo, hi))
+        while heap and len(top) < limit:
+            _, i, lo, hi = heapq.heappop(heap)
+            top.append(i)
+            # 取出 i 后区间分成左右两段，分别找出各自的最优候选
+            for sub_lo, sub_hi in ((lo, i), (i + 1, hi)):
+                if sub_lo < sub_hi:
+                    j = self._range_best(data, sub_lo, sub_hi)
+                    heapq.heappush(heap, (-data.weights[j], j, sub_lo, sub_hi))
+        return top
+
+    def _set_data(self, keys, weights, prefix_table, max_tree=None):
+        """所有字段准备好之后一次性替换引用"""
+        weights = array("I", weights)
+        if max_tree is None:
+            max_tree = self._build_max_tree(weights)
+        self._data = SuggestionData(keys, weights, prefix_table, max_tree)
+        return self._data
+
+    def _read(self):
+        """从文件读取建议索引，文件不存在时为空索引"""
+        if not os.path.exists(self.suggestion_file):
+            print(f"⚠️ 搜索建议索引文件不存在，请先运行 optimize 构建: {self.suggestion_file}")
+            return self._set_data([], [], {})
+
+        with open(self.suggestion_file, "rb") as f:
+            data = msgpack.unpackb(zlib.decompress(f.read()), raw=False)
+        max_tree = None
+        if "max_tree" in data:
+            max_tree = array("I")
+            max_tree.frombytes(data["max_tree"])
+        return self._set_data(data["keys"], data["weights"], data["prefix_table"], max_tree)
+
+    def load(self):
+        """加载建议索引（多个线程同时调用时只加载一次），文件不存在时不返回任何建议（建议索引由 optimize 构建）"""
+        data = self._data
+        if data is not None:
+            return data
+        with self._lock:
+            return self._data or self._read()
+
+    def reload(self):
+        """重新加载建议索引（与倒排索引一起重新加载），加载完成前查询继续使用旧索引"""
+        with self._lock:
+            return self._read()
+
+    def suggest(self, query, limit=10):
+        """
+        返回以 query 为前缀的建议
+
+        参数:
+        - query: 用户已输入的文本
+        - limit: 返回的建议数 (不超过 TOP_K)
+
+        返回:
+        - [(建议文本, 权重), ...]，按权重降序
+        """
+        data = self.load()
+        prefix = normalize_text(query)
+        if not prefix:
+            return []
+        # 保留末尾空格的语义：用户已输完一个词，只补全后续的词
+        if query.endswith(" "):
+            prefix += " "
+
+        limit = min(limit, self.TOP_K)
+        if prefix in data.prefix_table:
+            return [(data.keys[i], data.weights[i]) for i in data.prefix_table[prefix][:limit]]
+        if len(prefix) <= self.PREFIX_TABLE_LENGTH:
+            return []  # 短前缀不在表中说明没有任何候选
+
+        lo = bisect.bisect_left(data.keys, prefix)
+        hi = bisect.bisect_left(data.keys, prefix + "\uffff", lo)
+        return [(data.keys[i], data.weights[i]) for i in self._top_in_range(data, lo, hi, limit)]
+
+
+# 创建全局实例，用于应用中访问
+suggestion_index = SuggestionIndex()
+
+if __name__ == "__main__":
+    # 构建搜索建议索引并测试几个前缀
+    manager = SuggestionIndex()
+    manager.build()
+    for test_prefix in ["ap", "pre", "china tr", "technology"]:
+        start = time.perf_counter()
+        completions = manager.suggest(test_prefix)
+        print(f"{test_prefix!r}: {completions} ({(time.perf_counter() - start) * 1000:.3f} ms)")
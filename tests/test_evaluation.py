@@ -0,0 +1,30 @@
+import evaluation
+from evaluation import bm25, index_term_counts, tfidf
+
+RESULTS = [
+    {"id": "a", "title": "Running shoes", "content": "runners run in running shoes"},
+    {"id": "b", "title": "Markets", "content": "stocks rallied as markets opened"},
+    {"id": "c", "title": "Marathon", "content": "a runner finished the marathon"},
+]
+
+
+def test_weighted_terms_rank_by_stems():
+    weighted_terms = {"run": 1.0, "market": 0.5}
+    assert [r["id"] for r in bm25(RESULTS, "runing", weighted_terms=weighted_terms)] == ["a", "b", "c"]
+    assert [r["id"] for r in tfidf(RESULTS, "runing", weighted_terms)] == ["a", "b", "c"]
+
+
+def test_term_counts_are_cached_per_document_text(monkeypatch):
+    evaluation._doc_term_cache.clear()
+    calls = []
+    tokenize = evaluation.index_tokens
+    monkeypatch.setattr(evaluation, "index_tokens", lambda text: calls.append(text) or tokenize(text))
+
+    counts, length = index_term_counts("a", "Running runners run")
+    assert counts["run"] == 2 and length == 3
+    assert index_term_counts("a", "Running runners run") == (counts, length)
+    assert len(calls) == 1
+
+    # 正文变化后按新内容重新分词
+    counts, length = index_term_counts("a", "markets")
+    assert counts["market"] == 1 and len(calls) == 2
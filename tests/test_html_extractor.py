@@ -0,0 +1,21 @@
+import asyncio
+
+import html_extractor
+
+ARTICLE = "<html><body><article><p>正文</p></article></body></html>"
+
+
+def test_pool_is_recreated_after_shutdown():
+    async def extract_twice():
+        first = await html_extractor.extract_in_pool(ARTICLE)
+        html_extractor.shutdown_extractor_pool()
+        second = await html_extractor.extract_in_pool(ARTICLE)
+        html_extractor.shutdown_extractor_pool()
+        return first, second
+
+    assert asyncio.run(extract_twice()) == ("正文", "正文")
+
+
+def test_xml_declaration_is_ignored():
+    html = '<?xml version="1.0" encoding="utf-8"?>' + ARTICLE
+    assert html_extractor.extract_article_text(html) == "正文"
@@ -0,0 +1,45 @@
+import sqlite3
+
+from near_duplicates import BANDS, ClusterMap, NearDuplicateDetector, benchmark_corpus
+
+WIRE_STORY = "central bank raises interest rates again as inflation stays high across the region"
+
+
+def insert_news(db_path, rows):
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE IF NOT EXISTS news (id TEXT PRIMARY KEY, title TEXT, description TEXT, "
+                 "published_at TEXT)")
+    conn.executemany("INSERT INTO news (id, title, description, published_at) VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def test_reassign_replaces_bands(tmp_path):
+    db_path = str(tmp_path / "news.db")
+    insert_news(db_path, [("a", "Rates", WIRE_STORY, "2024-01-01")])
+    conn = sqlite3.connect(db_path)
+    detector = NearDuplicateDetector(conn)
+    detector.assign("a", WIRE_STORY)
+    detector.assign("a", WIRE_STORY)
+    assert conn.execute("SELECT COUNT(*) FROM minhash_bands WHERE id = 'a'").fetchone()[0] == BANDS
+
+    # 正文改变后重新分配，旧文本的分桶被删除
+    detector.assign("a", "football club wins the cup after a dramatic penalty shootout in the final")
+    assert conn.execute("SELECT COUNT(*) FROM minhash_bands WHERE id = 'a'").fetchone()[0] == BANDS
+    conn.close()
+
+
+def test_cluster_map_reloads_after_rebuild(tmp_path):
+    db_path = str(tmp_path / "news.db")
+    insert_news(db_path, [
+        ("a", "Rates", WIRE_STORY, "2024-01-01"),
+        ("b", "Rates", WIRE_STORY, "2024-01-02"),
+    ])
+    benchmark_corpus(db_path)
+    cluster_map = ClusterMap(db_path, refresh_interval=0)
+    assert cluster_map.clusters() == {"b": "a"}
+
+    # 重建后签名表的行数比之前多，仅凭 rowid 无法发现重建
+    insert_news(db_path, [("c", "Rates", WIRE_STORY, "2023-12-31"), ("d", "Sport", "cup final", "2024-01-03")])
+    benchmark_corpus(db_path, rebuild=True)
+    assert cluster_map.clusters() == {"a": "c", "b": "c"}
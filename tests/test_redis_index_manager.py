@@ -0,0 +1,222 @@
+import time
+import zlib
+
+import fakeredis
+import msgpack
+import pytest
+
+import redis_index_manager
+from circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from metrics import SearchMetrics
+from packed_index import build_packed_index
+from redis_index_manager import RedisIndexManager
+
+RESET_TIMEOUT = 0.2
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def index_files(tmp_path):
+    """写出一个很小的优化索引，并由它生成打包索引"""
+    optimized_data = {
+        "doc_id_map": {"doc-a": 0, "doc-b": 1, "doc-c": 2},
+        "index": {
+            "appl": {0: [1, 4], 2: [0]},
+            "china": {1: [3]},
+            "googl": {0: [2], 1: [0, 5]},
+        },
+        "static_rank": [0.5, 0.25, 0.75],
+        "impact_ordered": False,
+    }
+    optimized_file = tmp_path / "optimized_index.msgpack"
+    optimized_file.write_bytes(zlib.compress(msgpack.packb(optimized_data, use_bin_type=True)))
+    packed_file = tmp_path / "packed_index.bin"
+    build_packed_index(str(optimized_file), str(packed_file))
+    return {
+        "optimized_index_file": str(optimized_file),
+        "original_index_file": str(tmp_path / "inverted_index.json"),
+        "packed_index_file": str(packed_file),
+    }
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def make_manager(index_files, server):
+    def make(failure_threshold=1):
+        breaker = CircuitBreaker("Redis", failure_threshold, RESET_TIMEOUT)
+        return RedisIndexManager(redis_client=fakeredis.FakeRedis(server=server), breaker=breaker, **index_files)
+    return make
+
+
+@pytest.fixture
+def packed_loads(monkeypatch):
+    """统计打包索引文件被映射的次数"""
+    loads = []
+    packed_index_class = redis_index_manager.PackedIndex
+
+    def counting_packed_index(path):
+        loads.append(path)
+        return packed_index_class(path)
+
+    monkeypatch.setattr(redis_index_manager, "PackedIndex", counting_packed_index)
+    return loads
+
+
+def degrade(manager, server):
+    """Redis 不可用时加载索引，进入降级模式"""
+    server.connected = False
+    snapshot = manager.snapshot()
+    assert snapshot.source == "packed"
+    assert manager.status()["degraded"]
+    return snapshot
+
+
+def test_breaker_transitions():
+    breaker = CircuitBreaker("Redis", failure_threshold=2, reset_timeout=RESET_TIMEOUT)
+    assert breaker.state == CLOSED
+
+    breaker.record_failure(Exception("timeout"))
+    assert breaker.state == CLOSED
+    breaker.record_failure(Exception("timeout"))
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    time.sleep(RESET_TIMEOUT)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()  # 半开状态下只放行一次探测
+
+    breaker.record_failure(Exception("timeout"))
+    assert breaker.state == OPEN  # 探测失败立即重新打开
+
+    time.sleep(RESET_TIMEOUT)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.status()["failures_total"] == 3
+
+
+def test_loads_from_redis_when_available(make_manager):
+    manager = make_manager()
+    snapshot = manager.snapshot()
+
+    assert snapshot.source == "redis"
+    assert not manager.status()["degraded"]
+    assert manager.breaker.state == CLOSED
+    assert set(manager.get_term_postings("appl")) == {"doc-a", "doc-c"}
+    # 版本由Redis中的索引内容决定，其他实例加载同一份索引时版本相同
+    assert make_manager().snapshot().generation == snapshot.generation
+
+
+def test_falls_back_to_packed_index_when_redis_is_down(make_manager, server):
+    manager = make_manager()
+    degrade(manager, server)
+
+    status = manager.status()
+    assert status["degraded_reason"].startswith("Redis 不可用")
+    assert status["redis"]["state"] == OPEN
+    assert status["redis"]["failures_total"] == 1
+    assert set(manager.get_term_postings("googl")) == {"doc-a", "doc-b"}
+
+
+def test_failed_probe_keeps_packed_snapshot(make_manager, server, packed_loads):
+    manager = make_manager()
+    snapshot = degrade(manager, server)
+    assert len(packed_loads) == 1
+
+    time.sleep(RESET_TIMEOUT)
+    assert manager.breaker.state == HALF_OPEN
+    assert manager.snapshot() is snapshot  # 探测在后台进行，查询不等待
+    wait_until(lambda: not manager._recovering)
+
+    assert manager.breaker.state == OPEN
+    assert manager.status()["degraded"]
+    assert manager.status()["redis"]["failures_total"] == 2
+    assert manager.snapshot() is snapshot
+    assert len(packed_loads) == 1  # 探测失败不会重新映射打包索引
+
+
+def test_recovery_keeps_snapshot_and_generation(make_manager, server, packed_loads):
+    manager = make_manager()
+    snapshot = degrade(manager, server)
+
+    server.connected = True
+    time.sleep(RESET_TIMEOUT)
+    manager.snapshot()
+    wait_until(lambda: not manager._recovering)
+
+    status = manager.status()
+    assert not status["degraded"]
+    assert status["redis"]["state"] == CLOSED
+    # 恢复后继续使用 mmap 打包索引，不换成解压后的字典快照，分页游标依然有效
+    current = manager.snapshot()
+    assert current is snapshot
+    assert current.source == "packed"
+    assert current.generation == snapshot.generation
+    assert len(packed_loads) == 1
+
+
+def test_redis_failures_exported_as_counter(make_manager, server):
+    manager = make_manager()
+    degrade(manager, server)
+
+    metrics = SearchMetrics()
+    metrics.observe_index_status(manager.status())
+    text = metrics.render()
+
+    assert "# TYPE search_redis_failures_total counter" in text
+    assert "search_redis_failures_total 1" in text
+    assert "search_index_degraded 1" in text
+
+
+def test_recovers_with_default_failure_threshold(index_files, server):
+    # 默认阈值下一次启动失败不会打开熔断器，降级模式仍然需要探测Redis
+    manager = RedisIndexManager(redis_client=fakeredis.FakeRedis(server=server), **index_files)
+    snapshot = degrade(manager, server)
+    assert manager.breaker.state == CLOSED
+
+    server.connected = True
+    assert manager.snapshot() is snapshot
+    wait_until(lambda: not manager._recovering)
+
+    assert not manager.status()["degraded"]
+    assert manager.breaker.state == CLOSED
+    assert manager.snapshot() is snapshot
+
+
+def test_probes_until_breaker_opens_while_redis_stays_down(index_files, server):
+    manager = RedisIndexManager(redis_client=fakeredis.FakeRedis(server=server), **index_files)
+    degrade(manager, server)
+
+    for _ in range(manager.breaker.failure_threshold):
+        manager.snapshot()
+        wait_until(lambda: not manager._recovering)
+
+    assert manager.breaker.state == OPEN
+    assert manager.status()["degraded"]
+    manager.snapshot()
+    assert not manager._recovering  # 熔断期间不再探测
+
+
+def test_corrupt_index_in_redis_releases_half_open_probe(make_manager, server):
+    fakeredis.FakeRedis(server=server).set("inverted_index", b"not a zlib stream")
+    manager = make_manager()
+    assert manager.snapshot().source == "optimized_file"
+    assert manager.breaker.state == OPEN
+
+    time.sleep(RESET_TIMEOUT)
+    manager._load(manager._load_from_tiers, replace=True)  # 半开探测再次读到损坏的数据
+    assert manager.breaker.state == OPEN
+
+    time.sleep(RESET_TIMEOUT)
+    assert manager.breaker.allow()  # 探测标记已释放，冷却后仍会放行新的探测
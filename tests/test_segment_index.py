@@ -0,0 +1,80 @@
+import sqlite3
+import zlib
+
+import msgpack
+import pytest
+
+from segment_index import TimeSegmentIndex
+
+PUBLISHED = {
+    "doc-0": "2023-03-01", "doc-1": "2023-05-01",
+    "doc-2": "2022-02-01", "doc-3": "2022-08-01",
+    "doc-4": "2021-01-01", "doc-5": "2021-06-01",
+}
+
+
+@pytest.fixture
+def segments(tmp_path):
+    """三个年份段，每段两篇文档；索引中的 NASA 保留了大写形式"""
+    optimized_data = {
+        "doc_id_map": {doc_id: i for i, doc_id in enumerate(PUBLISHED)},
+        "index": {
+            "appl": {i: [0] for i in range(6)},
+            "NASA": {1: [1], 4: [2]},
+        },
+    }
+    optimized_file = tmp_path / "optimized_index.msgpack"
+    optimized_file.write_bytes(zlib.compress(msgpack.packb(optimized_data, use_bin_type=True)))
+
+    db_path = tmp_path / "news.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE news (id TEXT PRIMARY KEY, published_at TEXT)")
+    conn.executemany("INSERT INTO news VALUES (?, ?)", PUBLISHED.items())
+    conn.commit()
+    conn.close()
+
+    index = TimeSegmentIndex(str(tmp_path / "segments"), "year", str(optimized_file), str(db_path))
+    index.build()
+    return index
+
+
+def test_search_recent_stops_once_page_is_filled(segments, monkeypatch):
+    loaded = []
+    read = segments._read
+    monkeypatch.setattr(segments, "_read", lambda file_name: loaded.append(file_name) or read(file_name))
+
+    hits, matched_ids, truncated = segments.search_recent(["appl"], limit=2)
+    assert hits == ["doc-1", "doc-0"]
+    assert truncated and matched_ids == {"doc-0", "doc-1"}
+    assert not any("2021" in file_name or "2022" in file_name for file_name in loaded)
+
+    hits, matched_ids, truncated = segments.search_recent(["appl"], limit=None)
+    assert hits == ["doc-1", "doc-0", "doc-3", "doc-2", "doc-5", "doc-4"]
+    assert not truncated and len(matched_ids) == 6
+
+
+def test_search_recent_resolves_case_variants(segments):
+    hits, _, truncated = segments.search_recent(["nasa"], limit=None)
+    assert hits == ["doc-1", "doc-4"]
+    assert not truncated
+
+
+def test_update_moves_and_removes_documents(segments):
+    # doc-1 的发布时间改到 2021 年，doc-2 被删除
+    conn = sqlite3.connect(segments.db_path)
+    conn.execute("UPDATE news SET published_at = '2021-12-01' WHERE id = 'doc-1'")
+    conn.execute("DELETE FROM news WHERE id = 'doc-2'")
+    conn.commit()
+    conn.close()
+
+    optimized_data = {
+        "doc_id_map": {doc_id: i for i, doc_id in enumerate(PUBLISHED)},
+        "index": {"appl": {i: [0] for i in range(6) if i != 2}, "NASA": {1: [1], 4: [2]}},
+    }
+    manifest = segments.update(["doc-1", "doc-2"], optimized_data)
+
+    assert [(entry["key"], entry["doc_count"]) for entry in manifest] == [("2023", 1), ("2022", 1), ("2021", 3)]
+    hits, _, _ = segments.search_recent(["nasa"], limit=None)
+    assert hits == ["doc-1", "doc-4"]
+    hits, _, _ = segments.search_recent(["appl"], limit=None)
+    assert hits == ["doc-0", "doc-3", "doc-1", "doc-5", "doc-4"]
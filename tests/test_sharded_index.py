@@ -0,0 +1,58 @@
+import zlib
+
+import msgpack
+import pytest
+
+from sharded_index import ShardedIndex
+
+QUERIES = [
+    ({"type": "match", "groups": [["appl", "googl"]], "op": "or"}, {"appl": 1.0, "googl": 0.5}),
+    ({"type": "match", "groups": [["appl"], ["china"]], "op": "and_not"}, {"appl": 1.0}),
+    ({"type": "phrase", "terms": ["appl", "googl"]}, {"appl": 1.0, "googl": 1.0}),
+    ({"type": "proximity", "term1": "appl", "term2": "china", "distance": 2}, {"appl": 1.0, "china": 1.0}),
+]
+
+
+@pytest.fixture
+def optimized_index_file(tmp_path):
+    """六篇文档的优化索引，位置按差值编码"""
+    optimized_data = {
+        "doc_id_map": {f"doc-{i}": i for i in range(6)},
+        "index": {
+            "appl": {0: [0, 3], 1: [2], 3: [0], 4: [1, 1, 1], 5: [4]},
+            "googl": {0: [1], 2: [0], 3: [1], 5: [0, 2]},
+            "china": {1: [0], 3: [5], 4: [0]},
+            "crypto": {2: [3], 5: [7]},
+        },
+        "static_rank": [0.0] * 6,
+        "impact_ordered": False,
+    }
+    path = tmp_path / "optimized_index.msgpack"
+    path.write_bytes(zlib.compress(msgpack.packb(optimized_data, use_bin_type=True)))
+    return str(path)
+
+
+@pytest.mark.parametrize("method", ["bm25", "tfidf"])
+def test_ranking_does_not_depend_on_shard_count(optimized_index_file, tmp_path, method):
+    # 各分片使用全局统计打分，归并后的排序和分数应与单个分片完全一致
+    rankings = []
+    for num_shards in (1, 3):
+        with ShardedIndex(num_shards, optimized_index_file, str(tmp_path / f"shards_{num_shards}")) as sharded:
+            rankings.append([[(doc_id, round(score, 9)) for doc_id, score in
+                              sharded.search(query, weights, method=method)] for query, weights in QUERIES])
+
+    single, sharded = rankings
+    assert sharded == single
+    assert {doc_id for doc_id, _ in single[2]} == {"doc-0", "doc-3"}
+    assert {doc_id for doc_id, _ in single[1]} == {"doc-0", "doc-5"}
+
+
+def test_expansion_uses_global_document_frequency(optimized_index_file, tmp_path):
+    with ShardedIndex(3, optimized_index_file, str(tmp_path / "shards")) as sharded:
+        weights, stats = sharded.expand_keywords(["china", "appll"], ["cr*"])
+
+    assert stats["doc_count"] == 6
+    assert stats["df"]["appl"] == 5  # 拼写容错的候选汇总了所有分片的文档频率
+    assert weights["china"] == 1.0
+    assert weights["appl"] == pytest.approx(0.5)  # 唯一候选，编辑距离为 1
+    assert weights["crypto"] == 1.0
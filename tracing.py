@@ -0,0 +1,86 @@
+import functools
+import threading
+import time
+from collections import defaultdict
+
+_local = threading.local()
+
+
+class Trace:
+    """一次查询的分阶段耗时记录"""
+
+    def __init__(self):
+        self.stages = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.postings = {}
+
+    def add(self, name, elapsed):
+        self.stages[name] += elapsed
+
+
+def count(name, amount=1):
+    """在当前追踪中累加一个计数，例如回表的行数；未开启追踪时不做任何事"""
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        trace.counters[name] += amount
+
+
+def record_postings(term, length):
+    """在当前追踪中记录某个词的倒排表长度"""
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        trace.postings[term] = length
+
+
+class span:
+    """
+    记录某个阶段耗时的上下文管理器，也可以用作函数装饰器
+
+    只有当前线程通过 start_trace() 开启了追踪时才会计时，
+    未开启时只有一次线程局部变量查找的开销。
+    """
+
+    __slots__ = ("name", "trace", "start")
+
+    def __init__(self, name):
+        self.name = name
+        self.trace = None
+        self.start = 0.0
+
+    def __enter__(self):
+        self.trace = getattr(_local, "trace", None)
+        if self.trace is not None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.trace is not None:
+            self.trace.add(self.name, time.perf_counter() - self.start)
+        return False
+
+    def __call__(self, func):
+        name = self.name
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+class start_trace:
+    """在当前线程开启一次查询追踪，退出时结束；给出 trace 时继续记录到这个已有的追踪中（例如跨线程的同一个请求）"""
+
+    def __init__(self, trace=None):
+        self.trace = trace or Trace()
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = getattr(_local, "trace", None)
+        _local.trace = self.trace
+        return self.trace
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _local.trace = self._previous
+        return False
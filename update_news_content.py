@@ -1,15 +1,32 @@
+import hashlib
+import os
 import sqlite3
+import time
 import aiohttp
 import asyncio
 import random
 import tqdm  # 进度条
 import requests
-from bs4 import BeautifulSoup
+from collections import namedtuple
 from config import DB_PATH
+from database import create_crawl_state_table
+from html_extractor import ExtractionError, extract_in_pool, shutdown_extractor_pool
+from host_scheduler import HostScheduler, PER_HOST_CONCURRENCY
 
 # 限制最大并发请求数
-MAX_CONCURRENT_REQUESTS = 5
+MAX_CONCURRENT_REQUESTS = 32
 TIMEOUT = 15  # 请求超时时间
+QUEUE_SIZE = 100  # 结果队列的容量
+WRITE_BATCH_SIZE = 50  # 每个事务提交的结果数
+CHECKPOINT_FILE = "update_content_checkpoint.txt"  # 已处理的新闻 ID
+CRAWL_MAX_FAILURES = 5  # 暂时失败超过此次数后放弃并删除新闻
+RETRY_BASE_DELAY = 3600  # 第一次失败后的重试等待时间（秒），之后每次翻倍
+RETRY_MAX_DELAY = 7 * 24 * 3600
+
+# 一次抓取的结果：正文、HTTP 状态码（网络错误/超时为 None）、验证信息、是否被拒绝/限流/超时、
+# 页面已下载但正文提取出错
+FetchResult = namedtuple("FetchResult", ["content", "status", "etag", "last_modified", "blocked", "extract_error"],
+                         defaults=(False,))
 
 # 伪装成移动设备，减少封锁
 USER_AGENTS = [
@@ -27,7 +44,7 @@ COOKIES = {
 
 
 def fetch_with_requests(url):
-    """使用 requests 处理超长 HTTP 头的网站"""
+    """使用 requests 下载超长 HTTP 头的网站（阻塞调用，需在线程中执行），返回 HTML"""
     try:
         headers = {
             "User-Agent": random.choice(USER_AGENTS),
@@ -37,124 +54,272 @@ def fetch_with_requests(url):
         if response.status_code != 200:
             print(f"❌ requests 访问失败 {url}，状态码: {response.status_code}")
             return None
-        soup = BeautifulSoup(response.text, "html.parser")
-        paragraphs = soup.find_all("p")
-        full_text = "\n".join([p.get_text() for p in paragraphs]).strip()
-        return full_text if full_text else None
+        return response.text
     except Exception as e:
-        print(f"⚠️ requests 解析失败 {url}: {e}")
+        print(f"⚠️ requests 下载失败 {url}: {e}")
         return None
 
 
-async def fetch_full_content(session, url, bar):
-    """异步获取完整新闻正文"""
+async def fetch_full_content(session, url, bar, etag=None, last_modified=None):
+    """
+    异步获取完整新闻正文，下载在事件循环中进行，解析交给进程池
+
+    带上次抓取时的 ETag / Last-Modified 发送条件请求，页面没有变化时服务器返回 304。
+
+    返回:
+    - FetchResult
+    """
     headers = {
         "User-Agent": random.choice(USER_AGENTS),
         "Referer": url,
     }
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
 
     try:
         async with session.get(url, headers=headers, cookies=COOKIES, timeout=TIMEOUT,
                                allow_redirects=True) as response:
-            if response.status in [403, 404]:
+            if response.status == 304:
+                bar.update(1)
+                return FetchResult(None, 304, response.headers.get("ETag"), response.headers.get("Last-Modified"),
+                                   False)
+            if response.status in [403, 404, 429]:
                 print(f"🚫 访问被拒绝（{response.status}），跳过：{url}")
                 bar.update(1)
-                return None
+                return FetchResult(None, response.status, None, None, response.status != 404)
             if response.status != 200:
                 print(f"❌ 访问失败 {url}，状态码: {response.status}")
                 bar.update(1)
-                return None
+                return FetchResult(None, response.status, None, None, False)
 
             html = await response.text(encoding="utf-8", errors="ignore")
-            try:
-                soup = BeautifulSoup(html, "html.parser")
-            except Exception:
-                soup = BeautifulSoup(html, "html5lib")
+            etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
 
-            article = soup.find("article")
-            if article:
-                paragraphs = article.find_all("p")
-            else:
-                content_divs = ["article-content", "entry-content", "post-content", "news-content"]
-                for div_class in content_divs:
-                    article = soup.find("div", class_=div_class)
-                    if article:
-                        paragraphs = article.find_all("p")
-                        break
-                else:
-                    main = soup.find("main")
-                    if main:
-                        paragraphs = main.find_all("p")
-                    else:
-                        bar.update(1)
-                        return None
-
-            full_text = "\n".join([p.get_text() for p in paragraphs]).strip()
+        try:
+            full_text = await extract_in_pool(html)
+        except ExtractionError as e:
+            # 不保存验证信息，重试时重新下载完整页面
+            print(f"⚠️ 正文提取出错，稍后重试 {url}: {e}")
             bar.update(1)
-            return full_text if full_text else None
+            return FetchResult(None, 200, None, None, False, True)
+        bar.update(1)
+        return FetchResult(full_text, 200, etag, last_modified, False)
 
     except asyncio.TimeoutError:
         print(f"⚠️ 请求超时: {url}")
         bar.update(1)
-        return None
+        return FetchResult(None, None, None, None, True)
     except aiohttp.ClientError as e:
-        # 如果是 Header 过长错误，直接用 requests 处理
+        # 如果是 Header 过长错误，改用 requests 在线程中下载，避免阻塞事件循环
         if "Got more than" in str(e) and "when reading Header value is too long" in str(e):
             print(f"⚠️ Header 过长，切换 requests 处理: {url}")
-            content = fetch_with_requests(url)
+            html = await asyncio.to_thread(fetch_with_requests, url)
+            try:
+                content = await extract_in_pool(html, all_paragraphs=True) if html else None
+            except ExtractionError as e:
+                print(f"⚠️ 正文提取出错，稍后重试 {url}: {e}")
+                bar.update(1)
+                return FetchResult(None, 200, None, None, False, True)
             bar.update(1)
-            return content
+            return FetchResult(content, 200 if html else None, None, None, False)
         print(f"⚠️ 网络错误 {url}: {e}")
         bar.update(1)
-        return None
+        return FetchResult(None, None, None, None, False)
+
+
+def is_transient_failure(result):
+    """
+    限流、超时、服务端和网络错误以及正文提取出错可以稍后重试；
+    其他失败（404、正文为空等）视为永久失败
+    """
+    return result.blocked or result.extract_error or result.status is None or result.status >= 500
+
+
+def retry_delay(failures):
+    """第 failures 次失败后的重试等待时间（秒），指数增长"""
+    return min(RETRY_BASE_DELAY * 2 ** (failures - 1), RETRY_MAX_DELAY)
+
+
+def load_checkpoint(path=CHECKPOINT_FILE):
+    """读取已处理的新闻 ID"""
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def append_checkpoint(news_ids, path=CHECKPOINT_FILE):
+    """在一批结果提交后追加记录已处理的新闻 ID"""
+    with open(path, "a", encoding="utf-8") as f:
+        f.writelines(f"{news_id}\n" for news_id in news_ids)
 
 
 async def update_news_content():
-    """异步更新数据库，将 content 替换为从 URL 解析的完整新闻正文"""
+    """
+    异步更新数据库，将 content 替换为从 URL 解析的完整新闻正文
+
+    生产者/消费者流水线：HostScheduler 按站点轮询分配待处理的新闻并限制每个站点的并发，
+    MAX_CONCURRENT_REQUESTS 个 worker 抓取并解析正文，唯一的写入者把结果按批提交并记录检查点。
+    中途崩溃或终止时，已提交的结果不会丢失，重新运行会跳过检查点中已处理的新闻。
+
+    每篇新闻的抓取状态保存在 crawl_state 表中：再次抓取时发送条件请求，正文哈希不变时不写回，
+    暂时失败的新闻按指数退避稍后重试。正文有变化的新闻通过 python main.py reindex 增量更新索引。
+    """
+    create_crawl_state_table(DB_PATH)
     conn = sqlite3.connect(DB_PATH)
+    conn.execute("PRAGMA journal_mode=WAL")
     cursor = conn.cursor()
 
-    cursor.execute("SELECT id, url, content FROM news ORDER BY published_at DESC")
-    news_items = cursor.fetchall()
-    
-    failed_news_ids = []  # 存储需要删除的新闻 ID
-    updated_data = []
-    sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    # 只读取 ID、URL 和抓取状态，正文由 worker 抓取后直接交给写入者
+    cursor.execute("""
+    SELECT news.id, news.url, crawl_state.etag, crawl_state.last_modified, crawl_state.content_hash,
+           COALESCE(crawl_state.failures, 0), crawl_state.next_retry_at
+    FROM news LEFT JOIN crawl_state ON crawl_state.id = news.id
+    ORDER BY news.published_at DESC
+    """)
+    processed = load_checkpoint()
+    now = time.time()
+    news_items = []
+    states = {}
+    backing_off = 0
+    for news_id, url, etag, last_modified, content_hash, failures, next_retry_at in cursor.fetchall():
+        if news_id in processed:
+            continue
+        if next_retry_at and next_retry_at > now:
+            backing_off += 1  # 最近失败过，还没到重试时间
+            continue
+        news_items.append((news_id, url))
+        states[news_id] = (etag, last_modified, content_hash, failures)
+    if processed:
+        print(f"⏭️ 跳过检查点中已处理的 {len(processed)} 条新闻")
+    if backing_off:
+        print(f"⏳ 跳过 {backing_off} 条最近抓取失败、尚未到重试时间的新闻")
+
+    scheduler = HostScheduler(news_items)
+    print(f"🌐 共 {len(news_items)} 条新闻，来自 {len(scheduler.pending)} 个站点")
+    results = asyncio.Queue(maxsize=QUEUE_SIZE)
+    stats = {"updated": 0, "unchanged": 0, "deleted": 0, "retry": 0}
+
+    async def fetch_worker(session, bar):
+        while (job := await scheduler.acquire()) is not None:
+            host, (news_id, url) = job
+            etag, last_modified, _, _ = states[news_id]
+            result = await fetch_full_content(session, url, bar, etag, last_modified)
+            bar.update(await scheduler.release(host, result.blocked))
+            await results.put((news_id, url, result))
+        await results.put(None)
+
+    def commit_batch(batch):
+        fetched_at = time.time()
+        updates, unchanged, retries, failed = [], [], [], []
+        for news_id, url, result in batch:
+            _, _, old_hash, failures = states[news_id]
+            if result.status == 304:
+                unchanged.append((result.etag, result.last_modified, fetched_at, news_id))
+            elif result.content and len(result.content) >= 50:
+                content_hash = hashlib.md5(result.content.encode("utf-8")).hexdigest()
+                updates.append((news_id, url, result, content_hash, content_hash != old_hash))
+            elif result.extract_error or (is_transient_failure(result) and failures + 1 < CRAWL_MAX_FAILURES):
+                # 提取出错是本地问题而不是页面失效，无论失败多少次都不删除新闻
+                retries.append((news_id, url, result.status, failures + 1, fetched_at,
+                                fetched_at + retry_delay(failures + 1)))
+            else:
+                failed.append((news_id, url, result.status, failures + 1, fetched_at))
+
+        with conn:
+            cursor.executemany("UPDATE news SET content = ? WHERE id = ?",
+                               [(result.content, news_id) for news_id, _, result, _, changed in updates if changed])
+            cursor.executemany("""
+            INSERT INTO crawl_state (id, url, etag, last_modified, status, content_hash, failures, fetched_at)
+            VALUES (?, ?, ?, ?, 200, ?, 0, ?)
+            ON CONFLICT(id) DO UPDATE SET url = excluded.url, etag = excluded.etag,
+                last_modified = excluded.last_modified, status = 200, content_hash = excluded.content_hash,
+                failures = 0, fetched_at = excluded.fetched_at, next_retry_at = NULL
+            """, [(news_id, url, result.etag, result.last_modified, content_hash, fetched_at)
+                  for news_id, url, result, content_hash, _ in updates])
+            cursor.executemany("""
+            UPDATE crawl_state SET etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified),
+                status = 304, failures = 0, fetched_at = ?, next_retry_at = NULL
+            WHERE id = ?
+            """, unchanged)
+            cursor.executemany("""
+            INSERT INTO crawl_state (id, url, status, failures, fetched_at, next_retry_at) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET status = excluded.status, failures = excluded.failures,
+                fetched_at = excluded.fetched_at, next_retry_at = excluded.next_retry_at
+            """, retries)
+            # 永久失败的新闻被删除；保留抓取状态并清空正文哈希，以便 reindex 时从索引中移除
+            cursor.executemany("DELETE FROM news WHERE id = ?", [(row[0],) for row in failed])
+            cursor.executemany("""
+            INSERT INTO crawl_state (id, url, status, failures, fetched_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET status = excluded.status, content_hash = NULL,
+                failures = excluded.failures, fetched_at = excluded.fetched_at, next_retry_at = NULL
+            """, failed)
+        append_checkpoint(news_id for news_id, _, _ in batch)
+        changed = sum(1 for update in updates if update[4])
+        stats["updated"] += changed
+        stats["unchanged"] += len(unchanged) + len(updates) - changed
+        stats["retry"] += len(retries)
+        stats["deleted"] += len(failed)
 
-    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=100, ssl=False)) as session:
+    async def write_results():
+        batch = []
+        finished_workers = 0
+        while finished_workers < MAX_CONCURRENT_REQUESTS:
+            result = await results.get()
+            if result is None:
+                finished_workers += 1
+                continue
+            batch.append(result)
+            if len(batch) >= WRITE_BATCH_SIZE:
+                commit_batch(batch)
+                batch = []
+        commit_batch(batch)
+
+    # 每个站点复用少量长连接，连接数上限与站点并发数一致
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT_REQUESTS, limit_per_host=PER_HOST_CONCURRENCY,
+                                     keepalive_timeout=30, ttl_dns_cache=300, ssl=False)
+    async with aiohttp.ClientSession(connector=connector) as session:
         with tqdm.tqdm(total=len(news_items), desc="正在爬取新闻") as bar:
-            async def process_news(news_id, url, old_content):
-                async with sem:
-                    await asyncio.sleep(random.uniform(0.2, 0.8))
-                    new_content = await fetch_full_content(session, url, bar)
-                    
-                    if not new_content or len(new_content) < 50:
-                        print(f"❌ 获取失败，记录待删除新闻: {news_id}")
-                        failed_news_ids.append(news_id)
-                        return  # 直接返回，跳过存储
-                    
-                    updated_data.append((new_content, news_id))
-
-            tasks = [process_news(news_id, url, old_content) for news_id, url, old_content in news_items]
-            await asyncio.gather(*tasks)
-
-    # 删除获取失败的新闻
-    if failed_news_ids:
-        cursor.executemany("DELETE FROM news WHERE id = ?", [(news_id,) for news_id in failed_news_ids])
-        print(f"🗑️ 已删除 {len(failed_news_ids)} 条无效新闻")
-
-    # 更新新闻内容
-    if updated_data:
-        cursor.executemany("UPDATE news SET content = ? WHERE id = ?", updated_data)
-        print(f"🎉 更新完成，共更新 {len(updated_data)} 条新闻")
-
-    # 额外删除 content 单词数少于 15 的新闻
-    cursor.execute("DELETE FROM news WHERE (LENGTH(content) - LENGTH(REPLACE(content, ' ', ''))) < 100")
+            tasks = [asyncio.create_task(write_results())]
+            tasks += [asyncio.create_task(fetch_worker(session, bar)) for _ in range(MAX_CONCURRENT_REQUESTS)]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                # 出错或被终止时取消流水线，未提交的结果会在下次运行时重新抓取
+                for task in tasks:
+                    task.cancel()
+                raise
+            finally:
+                shutdown_extractor_pool()
+
+    print(f"🗑️ 已删除 {stats['deleted']} 条无效新闻")
+    print(f"🎉 更新完成，共更新 {stats['updated']} 条新闻，{stats['unchanged']} 条正文没有变化")
+    if stats["retry"]:
+        print(f"⏳ {stats['retry']} 条新闻暂时抓取失败，将在退避时间后重试")
+    if scheduler.skipped_hosts:
+        print(f"⏭️ 跳过 {len(scheduler.skipped_hosts)} 个站点的 {len(scheduler.skipped_ids)} 条新闻，留到下次运行")
+
+    # 额外删除 content 单词数少于 15 的新闻（被跳过和等待重试的新闻还没有抓取正文，不参与删除）
+    cursor.execute("CREATE TEMP TABLE skipped_ids (id TEXT PRIMARY KEY)")
+    cursor.executemany("INSERT OR IGNORE INTO skipped_ids VALUES (?)", [(news_id,) for news_id in scheduler.skipped_ids])
+    cursor.execute("DELETE FROM news WHERE (LENGTH(content) - LENGTH(REPLACE(content, ' ', ''))) < 100 "
+                   "AND id NOT IN (SELECT id FROM skipped_ids) "
+                   "AND id NOT IN (SELECT id FROM crawl_state WHERE next_retry_at IS NOT NULL)")
     deleted_rows = cursor.rowcount
     print(f"🗑️ 额外删除 {deleted_rows} 条单词数过少的新闻")
+    cursor.execute("UPDATE crawl_state SET content_hash = NULL WHERE id NOT IN (SELECT id FROM news)")
     conn.commit()
+
+    cursor.execute("SELECT COUNT(*) FROM crawl_state WHERE content_hash IS NOT indexed_hash")
+    print(f"🔁 {cursor.fetchone()[0]} 篇新闻的正文有变化，运行 python main.py reindex 增量更新索引")
     conn.close()
 
+    # 全部处理完成，下次运行从头开始（有站点被跳过时保留检查点，下次只抓取被跳过的新闻）
+    if not scheduler.skipped_ids and os.path.exists(CHECKPOINT_FILE):
+        os.remove(CHECKPOINT_FILE)
+
 
 def run_async():
     import sys